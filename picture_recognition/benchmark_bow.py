@@ -0,0 +1,102 @@
+import argparse
+import fnmatch
+import os
+import time
+
+import cv2
+import numpy as np
+
+from methods.operations.bow_index import BoWIndex, SHORTLIST, WORDS
+from methods.operations.matching import count_good_matches, stack
+from methods.operations.orb_brute import THRESHOLD
+
+TOP = 10
+# Paintings with fewer good matches are not returned by ORBBrute
+MIN_SCORE = 4
+
+
+def extract(folder: str, orb: cv2.ORB, max_side: int):
+    descriptors = []
+    for name in sorted(fnmatch.filter(os.listdir(folder), '*.jpg')):
+        im = cv2.imread(os.path.join(folder, name), cv2.IMREAD_GRAYSCALE)
+        if im is None:
+            continue
+        scale = min(1., max_side / max(im.shape))
+        im = cv2.resize(im, (0, 0), fx=scale, fy=scale)
+        _, des = orb.detectAndCompute(im, None)
+        descriptors.append(des)
+    return descriptors
+
+
+def full_ranking(bf: cv2.BFMatcher, des: np.ndarray, database, positions) -> np.ndarray:
+    """
+    :return: the positions returned by ORBBrute, the best first, matching every painting of the positions
+    """
+    scores = np.array([count_good_matches(bf.match(database[pos], des), THRESHOLD) if database[pos] is not None
+                       else 0 for pos in positions])
+    order = np.argsort(-scores, kind='stable')[:TOP]
+    return np.asarray(positions)[order[scores[order] > MIN_SCORE]]
+
+
+def benchmark(database, queries, size: int, words: int, shortlist: int):
+    database = database[:size]
+    descriptors, owners = stack(database, 32, np.uint8)
+
+    start = time.perf_counter()
+    index = BoWIndex(words, shortlist)
+    index.train(descriptors, owners, len(database))
+    train_time = time.perf_counter() - start
+
+    bf = cv2.BFMatcher_create(cv2.NORM_HAMMING, crossCheck=True)
+    top1 = top = found = 0
+    full_time = bow_time = 0.
+    for des in queries:
+        start = time.perf_counter()
+        expected = full_ranking(bf, des, database, range(len(database)))
+        full_time += time.perf_counter() - start
+
+        start = time.perf_counter()
+        candidates = index.query(des)
+        # The shortlist is matched with ORB, as w5_bow does
+        full_ranking(bf, des, database, candidates)
+        bow_time += time.perf_counter() - start
+
+        # Only the queries with some result, the rest have no painting to find
+        if len(expected) > 0:
+            found += 1
+            top1 += expected[0] in candidates
+            top += len(np.intersect1d(expected, candidates)) / len(expected)
+
+    print('{} paintings ({} descriptors), trained in {:.1f} s: {} queries with results, top 1 recall {:.1%}, '
+          'top {} recall {:.1%}, {:.1f} ms full -> {:.1f} ms shortlist'.format(
+              len(database), len(descriptors), train_time, found, top1 / max(found, 1), TOP, top / max(found, 1),
+              full_time / len(queries) * 1000, bow_time / len(queries) * 1000))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare the bag of visual words shortlist with the full ORB '
+                                                 'ranking: how many of its best paintings are in the shortlist, and '
+                                                 'the query time of both for several catalog sizes.')
+    parser.add_argument('dataset', help='Source images folder')
+    parser.add_argument('query', help='Query images folder')
+    parser.add_argument('--sizes', help='Catalog sizes separated by ",", the first paintings of the dataset. All of '
+                                        'them by default')
+    parser.add_argument('--words', type=int, default=WORDS, help='Size of the vocabulary')
+    parser.add_argument('--shortlist', type=int, default=SHORTLIST, help='Number of candidates of each query')
+    parser.add_argument('--max-side', type=int, default=512, help='Images are resized to this maximum side')
+
+    args = parser.parse_args()
+    orb = cv2.ORB_create(1000)
+    print('Extracting...')
+    database = extract(args.dataset, orb, args.max_side)
+    queries = [des for des in extract(args.query, orb, args.max_side) if des is not None]
+    if not database or not queries:
+        raise SystemExit('No images could be read')
+
+    sizes = [int(size) for size in args.sizes.split(',')] if args.sizes else [len(database)]
+    for size in sizes:
+        benchmark(database, queries, size, args.words, args.shortlist)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,138 @@
+import argparse
+import fnmatch
+import os
+import time
+
+import cv2
+import numpy as np
+from numba import njit
+
+from methods.operations.get_lines_rotation_and_crop import find_intersections, magic, MAX_SIDE
+
+
+@njit()
+def magic_exhaustive(data: np.ndarray, width: int, height: int):
+    """
+    Previous implementation of magic, visiting every triple of intersections. Used as the reference.
+    """
+    max_area = 0
+    points = [(0., 0.), (0., 0.), (0., 0.), (0., 0.)]
+    angle = 0
+
+    for p0 in range(len(data)):
+        for p1 in range(p0 + 1, len(data)):
+            for p2 in range(p1 + 1, len(data)):
+                if (np.abs(data[p0, 2] - data[p1, 2]) < 5 and
+                        np.abs(data[p0, 2] - data[p2, 2]) < 5):
+
+                    # Combine points in a matrix
+                    p = data[np.array([p0, p1, p2]), 0:2]
+
+                    # Calculate area using shoelace formula
+                    area = 0.0
+                    for i in range(p.shape[0]):
+                        j = (i + 1) % p.shape[0]
+                        area += p[i][0] * p[j][1]
+                        area -= p[j][0] * p[i][1]
+                    area = abs(area) / 2.0
+
+                    if area > max_area:
+                        d01 = np.subtract(data[p1, :], data[p0, :])
+                        d12 = np.subtract(data[p2, :], data[p1, :])
+                        d20 = np.subtract(data[p0, :], data[p2, :])
+
+                        # Calculate fourth point
+                        if np.linalg.norm(d01) > np.linalg.norm(d12) and np.linalg.norm(d01) > np.linalg.norm(d20):
+                            # p2 corner
+                            point4 = np.add(data[p1, :], d20)
+                        elif np.linalg.norm(d12) > np.linalg.norm(d20):
+                            # p0 corner
+                            point4 = np.add(data[p2, :], d01)
+                        else:
+                            # p1 corner
+                            point4 = np.add(data[p0, :], d12)
+
+                        # Discard point if outside of image
+                        if point4[0] < 0 or point4[1] < 0 or point4[0] > width or point4[1] > height:
+                            continue
+
+                        max_area = area
+                        points = [
+                            (data[p0, 0], data[p0, 1]),
+                            (data[p1, 0], data[p1, 1]),
+                            (data[p2, 0], data[p2, 1]),
+                            (point4[0], point4[1])
+                        ]
+                        angle = data[p0, 2]
+
+    return points, angle
+
+
+def record(query_dir: str, output: str):
+    """
+    Stores the intersections found in each query image, with the size of the resized image.
+    """
+    arrays = {}
+    for name in sorted(fnmatch.filter(os.listdir(query_dir), '*.jpg')):
+        im = cv2.imread(os.path.join(query_dir, name))
+        scale = min(MAX_SIDE / im.shape[0], MAX_SIDE / im.shape[1])
+        resized = cv2.resize(im, (0, 0), fx=scale, fy=scale)
+        arrays[name] = find_intersections(resized)
+        arrays[name + ':size'] = np.array([im.shape[0] * scale, im.shape[1] * scale])
+    np.savez(output, **arrays)
+    print('Recorded', len(arrays) // 2, 'images in', output)
+
+
+def benchmark(recorded: str, repeat: int):
+    data = np.load(recorded)
+    names = [name for name in data.files if not name.endswith(':size')]
+
+    # Compile both functions before timing
+    warmup = np.array([[0., 0., 0.], [0., 10., 0.], [10., 0., 0.], [10., 10., 0.], [5., 5., 0.]])
+    magic(warmup, 20., 20.)
+    magic_exhaustive(warmup, 20., 20.)
+
+    total_exhaustive = total_pruned = 0
+    for name in names:
+        intersections = data[name]
+        width, height = data[name + ':size']
+        if len(intersections) <= 4:
+            continue
+
+        start = time.perf_counter()
+        for _ in range(repeat):
+            expected = magic_exhaustive(intersections, width, height)
+        exhaustive = (time.perf_counter() - start) / repeat
+
+        start = time.perf_counter()
+        for _ in range(repeat):
+            result = magic(intersections, width, height)
+        pruned = (time.perf_counter() - start) / repeat
+
+        if result != expected:
+            raise Exception('Different result for {}: {} != {}'.format(name, result, expected))
+
+        total_exhaustive += exhaustive
+        total_pruned += pruned
+        print('{}: {} intersections, {:.2f} ms -> {:.2f} ms'.format(name, len(intersections), exhaustive * 1000,
+                                                                     pruned * 1000))
+
+    print('Total: {:.1f} ms -> {:.1f} ms ({:.1f}x)'.format(total_exhaustive * 1000, total_pruned * 1000,
+                                                          total_exhaustive / max(total_pruned, 1e-9)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare the rectangle search of the frame detection with the '
+                                                 'previous exhaustive search, over recorded Hough intersections.')
+    parser.add_argument('intersections', help='File with the recorded intersections (.npz)')
+    parser.add_argument('--record', help='Query images folder. Records its intersections before the benchmark')
+    parser.add_argument('--repeat', type=int, default=3, help='Number of runs of each image')
+
+    args = parser.parse_args()
+    if args.record is not None:
+        record(args.record, args.intersections)
+    benchmark(args.intersections, args.repeat)
+
+
+if __name__ == '__main__':
+    main()
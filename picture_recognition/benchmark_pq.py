@@ -0,0 +1,115 @@
+import argparse
+import fnmatch
+import os
+import time
+
+import cv2
+import numpy as np
+
+from methods.operations.matching import knn_to_arrays, ratio_test, stack
+from methods.operations.product_quantizer import PQIndex, ProductQuantizer
+
+RATIO = 0.75
+
+
+def extract(folder: str, detector, max_side: int):
+    descriptors = []
+    for name in sorted(fnmatch.filter(os.listdir(folder), '*.jpg')):
+        im = cv2.imread(os.path.join(folder, name), cv2.IMREAD_GRAYSCALE)
+        if im is None:
+            continue
+        scale = min(1., max_side / max(im.shape))
+        im = cv2.resize(im, (0, 0), fx=scale, fy=scale)
+        _, des = detector.detectAndCompute(im, None)
+        descriptors.append(des)
+    return descriptors
+
+
+def exact_matches(bf: cv2.BFMatcher, des: np.ndarray, descriptors: np.ndarray):
+    """
+    :return: the database row matched by each query descriptor that passes the ratio test, -1 if it does not
+    """
+    distances, query_idx, train_idx = knn_to_arrays(bf.knnMatch(des, descriptors, k=2))
+    matched = np.full((len(des),), -1, np.int64)
+    good = ratio_test(distances, RATIO)
+    matched[query_idx[good, 0]] = train_idx[good, 0]
+    return matched
+
+
+def pq_matches(quantizer: ProductQuantizer, codes: np.ndarray, des: np.ndarray):
+    distances = quantizer.distances(quantizer.tables(des), codes)
+    nearest = np.argpartition(distances, 1, axis=0)[:2]
+    nearest_distances = distances[nearest, np.arange(len(des))]
+    order = np.argsort(nearest_distances, axis=0)
+    nearest = np.take_along_axis(nearest, order, axis=0)
+    nearest_distances = np.take_along_axis(nearest_distances, order, axis=0)
+    return np.where(nearest_distances[0] < RATIO * nearest_distances[1], nearest[0], -1)
+
+
+def top(votes: np.ndarray, k: int) -> np.ndarray:
+    return np.argsort(-votes, kind='stable')[:k]
+
+
+def benchmark(dataset_dir: str, query_dir: str, features: str, subspaces: int, max_side: int):
+    if features == 'sift':
+        detector, norm = cv2.xfeatures2d.SIFT_create(600), cv2.NORM_L2
+    else:
+        detector, norm = cv2.xfeatures2d.SURF_create(2000), cv2.NORM_L1
+
+    print('Extracting...')
+    database = extract(dataset_dir, detector, max_side)
+    queries = [des for des in extract(query_dir, detector, max_side) if des is not None]
+    descriptors, owners = stack(database, detector.descriptorSize(), np.float32)
+
+    start = time.perf_counter()
+    index = PQIndex(ProductQuantizer(subspaces, norm))
+    index.train(descriptors, owners, len(database))
+    print('Training: {:.1f} s for {} descriptors'.format(time.perf_counter() - start, len(descriptors)))
+
+    exact_bytes = descriptors.nbytes
+    pq_bytes = index.codes.nbytes + index.quantizer.centroids.nbytes
+    print('Memory: {:.1f} MB -> {:.2f} MB ({:.1f}x, {:.1f}x without the {:.0f} KB of centroids)'.format(
+        exact_bytes / 2 ** 20, pq_bytes / 2 ** 20, exact_bytes / pq_bytes, exact_bytes / index.codes.nbytes,
+        index.quantizer.centroids.nbytes / 2 ** 10))
+
+    bf = cv2.BFMatcher_create(norm)
+    found = total = top1 = 0
+    overlap = []
+    exact_time = pq_time = 0.
+    for des in queries:
+        start = time.perf_counter()
+        exact = exact_matches(bf, des, descriptors)
+        exact_votes = np.bincount(owners[exact[exact >= 0]], minlength=len(database))
+        exact_time += time.perf_counter() - start
+
+        start = time.perf_counter()
+        pq_votes = index.vote(des, RATIO)
+        pq_time += time.perf_counter() - start
+
+        approx = pq_matches(index.quantizer, index.codes, des)
+        total += np.count_nonzero(exact >= 0)
+        found += np.count_nonzero((exact >= 0) & (approx == exact))
+        top1 += top(exact_votes, 1)[0] == top(pq_votes, 1)[0]
+        overlap.append(len(np.intersect1d(top(exact_votes, 10), top(pq_votes, 10))) / 10)
+
+    print('Recall of the exact ratio test matches: {:.1%} ({} of {})'.format(found / max(total, 1), found, total))
+    print('Same top 1: {:.1%}, top 10 overlap: {:.1%}'.format(top1 / len(queries), np.mean(overlap)))
+    print('Query: {:.1f} ms exact -> {:.1f} ms quantized'.format(exact_time / len(queries) * 1000,
+                                                                 pq_time / len(queries) * 1000))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare the ratio test matching of the product quantized '
+                                                 'descriptors with the exact matching of the float descriptors.')
+    parser.add_argument('dataset', help='Source images folder')
+    parser.add_argument('query', help='Query images folder')
+    parser.add_argument('--features', choices=['sift', 'surf'], default='sift', help='Descriptors compared')
+    parser.add_argument('--subspaces', type=int, default=16, help='Number of bytes of each code')
+    parser.add_argument('--max-side', type=int, default=512, help='Images are resized to this maximum side')
+
+    args = parser.parse_args()
+    benchmark(args.dataset, args.query, args.features, args.subspaces, args.max_side)
+
+
+if __name__ == '__main__':
+    main()
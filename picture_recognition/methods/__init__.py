@@ -15,3 +15,21 @@ from .orb_brute_ratio_test_homography import instance as orb_brute_ratio_test_ho
 from .w5 import instance as w5
 from .w5_no_frame import instance as w5_no_frame
 from .w5_no_frame_no_text import instance as w5_no_frame_no_text
+from .w5_stacked import instance as w5_stacked
+from .w5_bow import instance as w5_bow
+from .hsv_4_orb_cascade import instance as hsv_4_orb_cascade
+from .w5_geometric import instance as w5_geometric
+from .w5_sift_pq import instance as w5_sift_pq
+
+# Methods that can be selected from the command line
+method_refs = {
+    'w5': w5,
+    'w5_no_frame': w5_no_frame,
+    'w5_no_frame_no_text': w5_no_frame_no_text,
+    'w5_stacked': w5_stacked,
+    'w5_bow': w5_bow,
+    'ycbcr_16_hellinger': ycbcr_16_hellinger,
+    'hsv_4_orb_cascade': hsv_4_orb_cascade,
+    'w5_geometric': w5_geometric,
+    'w5_sift_pq': w5_sift_pq
+}
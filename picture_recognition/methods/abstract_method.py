@@ -14,3 +14,18 @@ class AbstractMethod(ABC):
     @abstractmethod
     def train(self, images: List[Picture]) -> List[Rectangle]:
         pass
+
+    @abstractmethod
+    def add_pictures(self, images: List[Picture]) -> List[Rectangle]:
+        """
+        Adds the pictures to the trained database, only obtaining the features of the new ones.
+        :return: the text rectangle of each picture, as train
+        """
+        pass
+
+    @abstractmethod
+    def remove_pictures(self, images: List[Picture]) -> None:
+        """
+        Removes the pictures from the trained database.
+        """
+        pass
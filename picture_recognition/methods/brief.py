@@ -17,5 +17,11 @@ class brief(AbstractMethod):
     def train(self, images: List[Picture]):
         self.brief.train(images)
 
+    def add_pictures(self, images: List[Picture]):
+        self.brief.add_pictures(images)
+
+    def remove_pictures(self, images: List[Picture]) -> None:
+        self.brief.remove_pictures(images)
+
 
 instance = brief()
\ No newline at end of file
@@ -18,5 +18,11 @@ class flann_matcher(AbstractMethod):
     def train(self, images: List[Picture]):
         self.flann.train(images)
 
+    def add_pictures(self, images: List[Picture]):
+        self.flann.add_pictures(images)
+
+    def remove_pictures(self, images: List[Picture]) -> None:
+        self.flann.remove_pictures(images)
+
 
 instance = flann_matcher()
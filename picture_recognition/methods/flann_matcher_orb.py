@@ -18,5 +18,11 @@ class flann_matcher_orb(AbstractMethod):
     def train(self, images: List[Picture]):
         self.flann_orb.train(images)
 
+    def add_pictures(self, images: List[Picture]):
+        self.flann_orb.add_pictures(images)
+
+    def remove_pictures(self, images: List[Picture]) -> None:
+        self.flann_orb.remove_pictures(images)
+
 
 instance = flann_matcher_orb()
@@ -0,0 +1,60 @@
+from typing import List
+
+from methods import AbstractMethod
+from methods.operations import get_picture_frame, ORBBrute, CompareHistograms, CompareHistogramsMethods, \
+    HistogramTypes
+from methods.operations.compare_histrograms import HistogramComparisonMethods
+from methods.operations.profiling import instance as profiler
+from model import Picture, Frame
+from model.rectangle import Rectangle
+
+SHORTLIST = 30
+
+
+class hsv_4_orb_cascade(AbstractMethod):
+    """
+    Same as w5, but only the paintings with the most similar HSV 4x4 histograms to the cropped painting are matched
+    with ORB.
+    """
+
+    compare_histograms: CompareHistograms
+    orb: ORBBrute
+    shortlist: int
+
+    def __init__(self, shortlist: int = SHORTLIST):
+        """
+        :param shortlist: number of paintings selected by the histograms and matched with ORB
+        """
+        self.compare_histograms = CompareHistograms(CompareHistogramsMethods.BLOCKS_4_4, HistogramTypes.HSV,
+                                                    HistogramComparisonMethods.HISTCMP_HELLINGER)
+        self.orb = ORBBrute()
+        self.shortlist = shortlist
+
+    def query(self, picture: Picture) -> (List[Picture], Frame):
+        with profiler.span('cascade.frame'):
+            frame = get_picture_frame(picture)
+            im = self.orb.crop(picture, frame)
+
+        with profiler.span('cascade.histograms'):
+            candidates = self.compare_histograms.rank(im, self.shortlist)
+
+        with profiler.span('cascade.orb'):
+            kp, des = self.orb.describe(picture, frame=frame, cropped=im)
+            res = self.orb.match(des, candidates=candidates)
+        return res, frame
+
+    def train(self, images: List[Picture]) -> List[Rectangle]:
+        self.compare_histograms.train(images)
+        return self.orb.train(images)
+
+    def add_pictures(self, images: List[Picture]) -> List[Rectangle]:
+        # Both keep the same positions, so the histogram candidates are valid ORB positions
+        self.compare_histograms.add_pictures(images)
+        return self.orb.add_pictures(images)
+
+    def remove_pictures(self, images: List[Picture]) -> None:
+        self.compare_histograms.remove_pictures(images)
+        self.orb.remove_pictures(images)
+
+
+instance = hsv_4_orb_cascade()
@@ -10,5 +10,6 @@ from .brief import BRIEF
 from .flann_Matcher_ORB import Flann_Matcher_ORB
 from .surf_brute import SURFBrute
 from .orb_brute_ratio_test_homography import ORBBruteRatioTestHomography
-from .get_lines_rotation_and_crop import get_frame_with_lines
+from .bow_index import BoWIndex
+from .get_lines_rotation_and_crop import get_frame_with_lines, get_picture_frame
 from .text import detect_text
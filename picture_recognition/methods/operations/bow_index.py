@@ -0,0 +1,210 @@
+from typing import Collection, List, Set
+
+import cv2
+import numpy as np
+
+from methods.operations.matching import append_rows
+from methods.operations.profiling import instance as profiler
+
+WORDS = 1000
+SHORTLIST = 50
+ITERATIONS = 10
+MAX_SAMPLES = 200000
+
+
+class BoWIndex:
+    """
+    Bag of visual words retrieval over binary descriptors.
+
+    The vocabulary is obtained with k-majority clustering (k-means under the Hamming distance, where each centroid
+    takes the majority value of each bit of its members). Each painting is described by the TF-IDF weights of its
+    words, stored in an inverted file: for each word, the paintings containing it and their weights. A query only
+    visits the posting lists of its own words.
+
+    Paintings added after train are described with the trained vocabulary and IDF weights. Their postings are kept
+    apart and scored all at once, until they outnumber the posting lists and are merged into them. Removed
+    paintings are never returned.
+    """
+    words: int
+    shortlist: int
+    size: int
+    removed: Set[int]
+    vocabulary: np.ndarray
+    idf: np.ndarray
+    offsets: np.ndarray
+    pictures: np.ndarray
+    weights: np.ndarray
+    bf: cv2.BFMatcher
+
+    def __init__(self, words=WORDS, shortlist=SHORTLIST):
+        """
+        :param words: size of the vocabulary
+        :param shortlist: number of candidates returned by each query
+        """
+        self.words = words
+        self.shortlist = shortlist
+        self.size = 0
+        self.removed = set()
+        self.vocabulary = None
+        self.bf = cv2.BFMatcher_create(cv2.NORM_HAMMING)
+        self._clear_added()
+
+    def train(self, descriptors: np.ndarray, owners: np.ndarray, size: int) -> None:
+        """
+        Builds the vocabulary and the inverted file.
+        :param descriptors: the stacked binary descriptors of the database
+        :param owners: the position in the database of the painting owning each descriptor
+        :param size: the number of paintings in the database
+        """
+        self.size = size if len(descriptors) > 0 else 0
+        self.removed = set()
+        self.vocabulary = None
+        self._clear_added()
+        if self.size == 0:
+            return
+
+        self.vocabulary = self._cluster(descriptors)
+
+        pictures, words, counts = self._count(descriptors, owners)
+        df = np.bincount(words, minlength=self.words)
+        self.idf = np.log(size / np.maximum(df, 1)).astype(np.float32)
+
+        self._build(pictures, words, self._weigh(pictures, words, counts, owners, size))
+
+    def add(self, descriptors: np.ndarray, owners: np.ndarray, size: int) -> None:
+        """
+        Indexes new paintings, without changing the vocabulary nor the IDF weights.
+        :param descriptors: the stacked binary descriptors of the new paintings
+        :param owners: the position in the database of the painting owning each descriptor
+        :param size: the number of paintings in the database, including the new ones
+        """
+        if self.vocabulary is None:
+            self.train(descriptors, owners, size)
+            return
+
+        self.size = size
+        if len(descriptors) == 0:
+            return
+
+        pictures, words, counts = self._count(descriptors, owners)
+        weights = self._weigh(pictures, words, counts, owners, size)
+        self._added_pictures = append_rows(self._added_pictures, self._added, pictures)
+        self._added_words = append_rows(self._added_words, self._added, words)
+        self._added_weights = append_rows(self._added_weights, self._added, weights)
+        self._added += len(pictures)
+
+        if self._added > len(self.pictures):
+            # Merge the added postings into the posting lists
+            words = np.repeat(np.arange(self.words, dtype=np.int32), np.diff(self.offsets))
+            self._build(np.concatenate((self.pictures, self._added_pictures[:self._added])),
+                        np.concatenate((words, self._added_words[:self._added])),
+                        np.concatenate((self.weights, self._added_weights[:self._added])))
+            self._clear_added()
+
+    def remove(self, positions: Collection[int]) -> None:
+        """
+        :param positions: the positions in the database of the removed paintings
+        """
+        self.removed.update(positions)
+
+    def _count(self, descriptors: np.ndarray, owners: np.ndarray) -> (np.ndarray, np.ndarray, np.ndarray):
+        """
+        Counts the occurrences of each word in each painting.
+        :return: the painting, the word and the count of each pair that occurs
+        """
+        words = self._quantize(descriptors)
+        keys, counts = np.unique(owners.astype(np.int64) * self.words + words, return_counts=True)
+        return (keys // self.words).astype(np.int32), (keys % self.words).astype(np.int32), counts
+
+    def _weigh(self, pictures: np.ndarray, words: np.ndarray, counts: np.ndarray, owners: np.ndarray,
+               size: int) -> np.ndarray:
+        """
+        :return: the TF-IDF weight of each pair returned by _count, normalized so the weights of each painting have
+        unit norm
+        """
+        tf = counts / np.bincount(owners, minlength=size)[pictures]
+        weights = (tf * self.idf[words]).astype(np.float32)
+        norms = np.sqrt(np.bincount(pictures, weights=weights ** 2, minlength=size))
+        weights /= np.maximum(norms[pictures], 1e-12)
+        return weights
+
+    def _build(self, pictures: np.ndarray, words: np.ndarray, weights: np.ndarray) -> None:
+        """
+        Builds the posting lists, ordered by word.
+        """
+        order = np.argsort(words, kind='stable')
+        self.pictures = pictures[order]
+        self.weights = weights[order]
+        self.offsets = np.zeros((self.words + 1,), np.int64)
+        np.cumsum(np.bincount(words, minlength=self.words), out=self.offsets[1:])
+
+    def _clear_added(self) -> None:
+        self._added_pictures = np.empty((0,), np.int32)
+        self._added_words = np.empty((0,), np.int32)
+        self._added_weights = np.empty((0,), np.float32)
+        self._added = 0
+
+    @profiler.profiled('bow.query')
+    def query(self, des: np.ndarray) -> List[int]:
+        """
+        :param des: the query descriptors
+        :return: the positions in the database of the best scored paintings, the best first
+        """
+        if des is None or self.size == 0:
+            return []
+
+        q = np.bincount(self._quantize(des), minlength=self.words) * self.idf
+        q /= max(np.linalg.norm(q), 1e-12)
+
+        # Concatenate the posting lists of the query words
+        present = np.flatnonzero(q)
+        starts = self.offsets[present]
+        lengths = self.offsets[present + 1] - starts
+        idx = np.arange(lengths.sum()) + np.repeat(starts - np.cumsum(lengths) + lengths, lengths)
+
+        scores = np.bincount(self.pictures[idx], weights=self.weights[idx] * np.repeat(q[present], lengths),
+                             minlength=self.size)
+        if self._added:
+            added_words = self._added_words[:self._added]
+            scores += np.bincount(self._added_pictures[:self._added],
+                                  weights=self._added_weights[:self._added] * q[added_words], minlength=self.size)
+        scores[list(self.removed)] = 0
+        order = np.argsort(-scores, kind='stable')[:self.shortlist]
+        return [int(pos) for pos in order if scores[pos] > 0]
+
+    def _quantize(self, des: np.ndarray, vocabulary: np.ndarray = None) -> np.ndarray:
+        """
+        :return: the closest word of each descriptor
+        """
+        matches = self.bf.match(des, self.vocabulary if vocabulary is None else vocabulary)
+        return np.fromiter((m.trainIdx for m in matches), np.int32, len(matches))
+
+    def _cluster(self, descriptors: np.ndarray) -> np.ndarray:
+        """
+        k-majority clustering of the binary descriptors.
+        :return: the centroids, with the same format as the descriptors
+        """
+        rng = np.random.RandomState(0)
+        if len(descriptors) > MAX_SAMPLES:
+            descriptors = descriptors[rng.choice(len(descriptors), MAX_SAMPLES, replace=False)]
+
+        k = min(self.words, len(descriptors))
+        centroids = descriptors[rng.choice(len(descriptors), k, replace=False)]
+        bits = np.unpackbits(descriptors, axis=1)
+        for _ in range(ITERATIONS):
+            labels = self._quantize(descriptors, centroids)
+            order = np.argsort(labels, kind='stable')
+            used, starts, counts = np.unique(labels[order], return_index=True, return_counts=True)
+
+            # Majority vote of each bit among the members of each cluster
+            sums = np.add.reduceat(bits[order], starts, axis=0, dtype=np.int32)
+            updated = np.packbits((sums * 2 > counts[:, np.newaxis]).astype(np.uint8), axis=1)
+            if np.array_equal(updated, centroids[used]):
+                break
+            centroids[used] = updated
+
+        if k < self.words:
+            # Not enough descriptors, the remaining words are never used
+            centroids = np.concatenate((centroids, np.repeat(centroids[:1], self.words - k, axis=0)))
+
+        return centroids
@@ -1,51 +1,62 @@
-from typing import List, Tuple
+from typing import List, Set, Tuple
 
 import cv2
-from functional import seq
 import numpy as np
 from model import Picture,Rectangle
-from methods.operations.text import detect_text
+from methods.operations.text import detect_picture_text
+from methods.operations.feature_db import remove_features, train_features
+from methods.operations.matching import count_good_matches, find_positions, rank
 
 THRESHOLD = 28
 
 
 class BRIEF:
-    db: List[Tuple[Picture, List[cv2.KeyPoint], np.array,Rectangle]]
+    db: List[Tuple[Picture, np.ndarray, np.array,Rectangle]]
+    removed: Set[int]
     bf: cv2.BFMatcher
     star: cv2.xfeatures2d_StarDetector
     brief: cv2.xfeatures2d_BriefDescriptorExtractor
 
     def __init__(self):
         self.db = []
+        self.removed = set()
         self.bf = cv2.BFMatcher_create(cv2.NORM_HAMMING, crossCheck=True)
         self.star = cv2.xfeatures2d.StarDetector_create()
         self.brief = cv2.xfeatures2d.BriefDescriptorExtractor_create()
 
     def query(self, picture: Picture) -> List[Picture]:
-        mask,bounding_text= detect_text(picture.get_image())
+        mask,bounding_text= detect_picture_text(picture)
         kp = self.star.detect(picture.get_image(), mask)
         kp, des = self.brief.compute(picture.get_image(), kp)
 
-        return (
-            seq(self.db)
-                .map(lambda p: (p[0], self.bf.match(p[2], des)))
-                .map(lambda p: (p[0],
-                                seq(p[1]).filter(lambda d: d.distance < max(THRESHOLD,
-                                                                            seq(p[1]).map(lambda m: m.distance).min()))
-                                .to_list()
-                                )
-                     )
-                .map(lambda p: (p[0], len(p[1])))
-                .filter(lambda p: p[1] > 4)
-                .sorted(lambda p: p[1], reverse=True)
-                .map(lambda p: p[0])
-                .take(10)
-                .to_list()
-        )
+        scores = [count_good_matches(self.bf.match(p[2], des), THRESHOLD) if pos not in self.removed else 0
+                      for pos, p in enumerate(self.db)]
+        return rank([p[0] for p in self.db], scores, 4, excluded=self.removed)
 
     def train(self, images: List[Picture]) -> None:
-        for image in images:
-            mask,bounding_text = detect_text(image.get_image())
-            kp = self.star.detect(image.get_image(), mask)
-            kp, des = self.brief.compute(image.get_image(), kp)
-            self.db.append((image, kp, des,bounding_text))
+        self.db = []
+        self.removed = set()
+        self.add_pictures(images)
+
+    def add_pictures(self, images: List[Picture]) -> None:
+        """
+        Adds the pictures to the database, only obtaining the features of the new ones.
+        """
+        features = train_features('star_brief', self, images, self._extract, desc='Training brief')
+        for image, (kp, des, bounding_text) in zip(images, features):
+            self.db.append((image, kp, des, bounding_text))
+
+    def remove_pictures(self, images: List[Picture]) -> None:
+        """
+        Removes the pictures from the database, and their features when no other matcher uses them. They keep their
+        position in the database until the next train, but they are not matched anymore.
+        """
+        positions = find_positions([p[0] for p in self.db], images)
+        self.removed.update(positions)
+        remove_features('star_brief', self, images)
+
+    def _extract(self, image: Picture):
+        mask, bounding_text = detect_picture_text(image)
+        kp = self.star.detect(image.get_image(), mask)
+        kp, des = self.brief.compute(image.get_image(), kp)
+        return kp, des, bounding_text
@@ -1,16 +1,17 @@
-import math
 from enum import Enum, IntEnum
-from typing import List, Tuple
+from typing import List, Set
 
 import cv2
 import numpy as np
-from functional import seq
 
-from methods.operations.histograms import HistogramTypes, get_histogram
+from methods.operations.histograms import HistogramTypes, get_block_histograms
+from methods.operations.matching import append_rows, find_positions
+from methods.operations.profiling import instance as profiler
 from model import Picture
-import matplotlib.pyplot as plt
 
 K = 10
+FLT_EPSILON = np.finfo(np.float32).eps
+DBL_EPSILON = np.finfo(np.float64).eps
 
 
 class CompareHistogramsMethods(Enum):
@@ -26,9 +27,24 @@ class HistogramComparisonMethods(IntEnum):
 
 
 class CompareHistograms:
+    """
+    Ranks the database pictures by the similarity of their block histograms with the query.
+
+    The histograms of the database are kept in a single float32 tensor of shape (images, blocks, channels, bins), only
+    with the channels that are compared, so each query is compared with the whole database at once. The tensor is
+    stored in the form used by the comparison: the square root of the histograms for Hellinger and the histograms
+    minus their mean for correlation. The results are the same as with cv2.compareHist.
+
+    Pictures can be added to and removed from the trained database. The tensor grows geometrically, and removed
+    pictures keep their position, so the positions stay aligned with other structures built from the same pictures
+    until the next train.
+    """
     method: CompareHistogramsMethods
     histogram_type: HistogramTypes
-    db: List[Tuple[Picture, np.array]]
+    pictures: List[Picture]
+    removed: Set[int]
+    db: np.ndarray
+    norms: np.ndarray
     histogram_comparison_method: int
 
     def __init__(self, method: CompareHistogramsMethods, histogram_type: HistogramTypes,
@@ -36,59 +52,114 @@ class CompareHistograms:
         self.method = method
         self.histogram_type = histogram_type
         self.histogram_comparison_method = histogram_comparison_method
-
-    def query(self, picture: Picture) -> List[Picture]:
-        hist = self._get_histogram(picture.get_image())
-        return (
-            seq(self.db)
-                # Calculate histogram similarity
-                .map(lambda entry: (entry[0], self._compare_histograms_full(hist, entry[1])))
-                # Calculate distance to center
-                .map(lambda entry: (entry[0], self._euclidean_distance_to_origin(entry[1])))
-                # Order by distance
-                .sorted(lambda entry_res: entry_res[1],
-                        False if self.histogram_comparison_method == cv2.HISTCMP_HELLINGER else True)
-                .map(lambda entry: entry[0])
-                # Take first K
-                .take(K)
-                .to_list()
-        )
-
-    def _compare_histograms_full(self, h1: List[np.array], h2: List[np.array]) -> List[List[float]]:
-        channels_range = range(0, 1)
-        if self.histogram_type == HistogramTypes.HSV:
-            channels_range = range(0, 1)
-        elif self.histogram_type == HistogramTypes.YCbCr:
-            channels_range = range(1, 3)
-
-        val_list = []
-        # Iterate list of blocks
-        for i in range(len(h1)):
-            val = []
-            # Iterate channels to compare
-            for j in channels_range:
-                val.append(cv2.compareHist(h1[i][j], h2[i][j], self.histogram_comparison_method))
-            val_list.append(val)
-
-        return val_list
+        self.train([])
+
+    def query(self, picture: Picture, k: int = K) -> List[Picture]:
+        """
+        :param picture: the query picture
+        :param k: number of results
+        :return: the k most similar pictures, the most similar first
+        """
+        return [self.pictures[pos] for pos in self.rank(picture.get_image(), k)]
+
+    def rank(self, image: np.ndarray, k: int = K) -> List[int]:
+        """
+        :param image: the query image
+        :param k: number of results
+        :return: the positions in the database of the k most similar pictures, the most similar first
+        """
+        if len(self.removed) == len(self.pictures):
+            return []
+
+        with profiler.span('histograms.compute'):
+            hist = self._get_histograms(image)
+        with profiler.span('histograms.compare'):
+            # Calculate histogram similarity and distance to center
+            distances = self._euclidean_distance_to_origin(self._compare_histograms_full(hist))
+        # Order by distance, the highest correlation first
+        if self.histogram_comparison_method != cv2.HISTCMP_HELLINGER:
+            distances = -distances
+        distances[list(self.removed)] = np.inf
+        return self._top_k(distances, min(k, len(self.pictures) - len(self.removed))).tolist()
+
+    def _compare_histograms_full(self, hist: np.ndarray) -> np.ndarray:
+        """
+        :param hist: the query histograms, with shape (blocks, channels, bins)
+        :return: the comparison of each database block and channel with the query, with shape (images, blocks,
+        channels)
+        """
+        if self.histogram_comparison_method == cv2.HISTCMP_HELLINGER:
+            hist_sums = hist.sum(axis=-1, dtype=np.float64)
+            s12 = np.einsum('nbch,bch->nbc', self.db[:len(self.pictures)], np.sqrt(hist))
+            s1_s2 = self.norms[:len(self.pictures)] * hist_sums
+            ratio = np.divide(s12, np.sqrt(s1_s2), out=s12.astype(np.float64), where=s1_s2 > FLT_EPSILON)
+            return np.sqrt(np.maximum(1 - ratio, 0))
+
+        centered = hist - hist.mean(axis=-1, keepdims=True)
+        hist_norms = np.square(centered, dtype=np.float64).sum(axis=-1)
+        num = np.einsum('nbch,bch->nbc', self.db[:len(self.pictures)], centered)
+        denom = self.norms[:len(self.pictures)] * hist_norms
+        return np.divide(num, np.sqrt(denom), out=np.ones_like(denom), where=np.abs(denom) > DBL_EPSILON)
 
     @staticmethod
-    def _euclidean_distance_to_origin(pos: List[List[float]]) -> float:
-        total = 0
-        for i in range(len(pos)):
-            res: float = 0
-            for j in range(len(pos[i])):
-                res += pos[i][j] ** 2
-            total += math.sqrt(res)
+    def _euclidean_distance_to_origin(pos: np.ndarray) -> np.ndarray:
+        """
+        :param pos: array with shape (images, blocks, channels)
+        :return: mean through the blocks of the norm of the channel values, for each image
+        """
+        return np.sqrt(np.square(pos).sum(axis=-1)).mean(axis=-1)
 
-        return total / len(pos)
+    @staticmethod
+    def _top_k(distances: np.ndarray, k: int) -> np.ndarray:
+        """
+        :return: the positions of the k smallest distances in ascending order, the ties by position
+        """
+        if k < len(distances):
+            kth = np.partition(distances, k - 1)[k - 1]
+            candidates = np.flatnonzero(distances <= kth)
+        else:
+            candidates = np.arange(len(distances))
+        return candidates[np.argsort(distances[candidates], kind='stable')][:k]
 
     def train(self, images: List[Picture]) -> None:
-        self.db = []
-        for image in images:
-            self.db.append((image, self._get_histogram(image.get_image())))
-
-    def _get_histogram(self, image: np.ndarray) -> List[List[np.array]]:
+        self.pictures = []
+        self.removed = set()
+        self.db = np.empty((0,), np.float32)
+        self.norms = np.empty((0,), np.float64)
+        self.add_pictures(images)
+
+    def add_pictures(self, images: List[Picture]) -> None:
+        """
+        Adds the pictures at the end of the database, only computing the histograms of the new ones.
+        """
+        if not images:
+            return
+
+        hist = np.stack([self._get_histograms(image.get_image()) for image in images])
+        if self.histogram_comparison_method == cv2.HISTCMP_HELLINGER:
+            norms = hist.sum(axis=-1, dtype=np.float64)
+            np.sqrt(hist, out=hist)
+        else:
+            hist -= hist.mean(axis=-1, keepdims=True)
+            norms = np.square(hist, dtype=np.float64).sum(axis=-1)
+
+        if not self.pictures:
+            self.db = np.empty((0,) + hist.shape[1:], hist.dtype)
+            self.norms = np.empty((0,) + norms.shape[1:], norms.dtype)
+        self.db = append_rows(self.db, len(self.pictures), hist)
+        self.norms = append_rows(self.norms, len(self.pictures), norms)
+        self.pictures.extend(images)
+
+    def remove_pictures(self, images: List[Picture]) -> None:
+        """
+        Removes the pictures from the database. They are not returned by the queries anymore.
+        """
+        self.removed.update(find_positions(self.pictures, images))
+
+    def _get_histograms(self, image: np.ndarray) -> np.ndarray:
+        """
+        :return: the histograms of the compared channels of each block, with shape (blocks, channels, bins)
+        """
         columns = rows = 1
         if self.method == CompareHistogramsMethods.FULL_IMAGE:
             columns = rows = 1
@@ -98,22 +169,11 @@ class CompareHistograms:
             columns = rows = 32
         elif self.method == CompareHistogramsMethods.BLOCKS_4_4:
             columns = rows = 4
-        block_hist = []
-        block_x = image.shape[0] / rows
-        block_y = image.shape[1] / columns
-
-        """plt.figure()
-        pos = 1"""
-        for i in range(rows):
-            for j in range(columns):
-                block = image[int(i * block_x):int((i + 1) * block_x),
-                        int(j * block_y):int((j + 1) * block_y)]
-                block_hist.append(get_histogram(block, self.histogram_type))
-                """plt.subplot(4, 4, pos)
-                pos += 1
-                plt.gca().axes.get_xaxis().set_visible(False)
-                plt.gca().axes.get_yaxis().set_visible(False)
-                plt.imshow(cv2.cvtColor(block, cv2.COLOR_BGR2RGB))
-
-        plt.show()"""
-        return block_hist
+
+        channels_range = range(0, 1)
+        if self.histogram_type == HistogramTypes.HSV:
+            channels_range = range(0, 1)
+        elif self.histogram_type == HistogramTypes.YCbCr:
+            channels_range = range(1, 3)
+
+        return get_block_histograms(image, rows, columns, self.histogram_type, channels_range)
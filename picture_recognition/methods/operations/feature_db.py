@@ -0,0 +1,284 @@
+import json
+import os
+import struct
+import weakref
+from typing import Callable, Dict, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from methods.operations.feature_store import instance as feature_store
+from methods.operations.keypoints import KEYPOINT_DTYPE, keypoints_to_array
+from methods.operations.parallel import fork_map
+from model import Picture, Rectangle
+from model.image_cache import instance as image_cache
+
+VERSION = 1
+MAGIC = b'PRFDB\x00\x00\x00'
+ALIGNMENT = 64
+
+# Header: magic, version. Trailer: index offset, index length, magic
+_HEADER = struct.Struct('<8sI')
+_TRAILER = struct.Struct('<QQ8s')
+
+_cache_dir = None
+
+# The live matchers with each picture in their database, by key and path of the picture
+_users: Dict[Tuple[str, str], weakref.WeakSet] = {}
+
+# Keypoints as a structured array with KEYPOINT_DTYPE, descriptors and text rectangle
+Features = Tuple[np.ndarray, np.ndarray, Rectangle]
+
+
+def set_cache_dir(directory: Optional[str]) -> None:
+    """
+    Sets the directory where the trained features are stored. If None, the features are not persisted.
+    """
+    global _cache_dir
+    if directory is not None and not os.path.isdir(directory):
+        os.makedirs(directory)
+    _cache_dir = directory
+
+
+def get_cache_dir() -> Optional[str]:
+    """
+    :return: the directory set with set_cache_dir
+    """
+    return _cache_dir
+
+
+def train_features(key: str, user: object, images: List[Picture],
+                   extract: Callable[[Picture], Tuple[List[cv2.KeyPoint], np.ndarray, Rectangle]],
+                   desc: str = 'Training', keep_descriptors: bool = True) -> List[Features]:
+    """
+    Obtains the features of each image. They are taken from the feature store if another method already obtained
+    them in this run, else loaded from the feature database when it is enabled and the image has not changed since
+    they were stored. The rest are extracted in parallel with fork_map.
+
+    The features and the text rectangles are added to the feature store, so the workers of later extractions
+    inherit the text rectangles.
+    :param key: identifies the extractor and its parameters, different keys are stored in different files
+    :param user: the matcher adding the images to its database. Several matchers can share the features of a key
+    :param images: the images to extract the features from
+    :param extract: function returning the keypoints, the descriptors and the text rectangle of a picture. It runs
+    in the worker processes, so it must not depend on state modified during the extraction
+    :param desc: description shown in the progress bar
+    :param keep_descriptors: if False, the features are not added to the feature store, only the text rectangles.
+    Used by the matchers that replace the descriptors with a compact version, so they are freed once encoded
+    :return: the features of each image, in the same order. The keypoints are structured arrays, which are
+    lighter than cv2.KeyPoint objects and can be pickled
+    """
+    features = [feature_store.lookup(image, key) for image in images]
+    stored = [pos for pos, entry in enumerate(features) if entry is None]
+
+    db = FeatureDB(os.path.join(_cache_dir, key + '.fdb')) if _cache_dir is not None else None
+    if db is not None and stored:
+        for pos, entry in zip(stored, db.load([images[pos] for pos in stored])):
+            features[pos] = entry
+
+    # Extract the missing features in parallel. The workers inherit the counts of the feature store and of the
+    # image cache, so they are taken before and each extraction returns only its own
+    missing = [pos for pos, entry in enumerate(features) if entry is None]
+    counts = feature_store.take_counts()
+    image_counts = image_cache.take_counts()
+    extracted = fork_map(lambda image: (_portable(extract(image)), feature_store.take_counts(),
+                                        image_cache.take_counts()),
+                         [images[pos] for pos in missing], desc=desc)
+    feature_store.add_counts(*counts)
+    image_cache.add_counts(*image_counts)
+    for pos, (entry, extraction_counts, extraction_image_counts) in zip(missing, extracted):
+        features[pos] = entry
+        feature_store.add_counts(*extraction_counts)
+        image_cache.add_counts(*extraction_image_counts)
+
+    if db is not None and missing:
+        db.save([(images[pos], features[pos]) for pos in missing])
+
+    for image, entry in zip(images, features):
+        if keep_descriptors:
+            feature_store.put(image, key, entry)
+        feature_store.put(image, 'text', entry[2])
+        _users.setdefault((key, _picture_path(image)), weakref.WeakSet()).add(user)
+
+    return features
+
+
+def remove_features(key: str, user: object, images: List[Picture]) -> None:
+    """
+    Removes the images from the database of the matcher. The features of the images that no other live matcher of
+    the same key has in its database are removed from the feature store and from the feature database when it is
+    enabled, the rest are still used.
+    :param key: the key the features were obtained with in train_features
+    :param user: the matcher removing the images from its database
+    """
+    unused = []
+    for image in images:
+        entry = key, _picture_path(image)
+        users = _users.get(entry)
+        if users is not None:
+            users.discard(user)
+            if len(users) > 0:
+                continue
+            del _users[entry]
+        unused.append(image)
+
+    for image in unused:
+        feature_store.discard(image, key)
+    if _cache_dir is not None and unused:
+        FeatureDB(os.path.join(_cache_dir, key + '.fdb')).remove(unused)
+
+
+def _portable(features: Tuple[List[cv2.KeyPoint], np.ndarray, Rectangle]) -> Features:
+    kp, des, bounding_text = features
+    return keypoints_to_array(kp), des, bounding_text
+
+
+def _picture_path(picture: Picture) -> str:
+    return os.path.abspath(os.path.join(picture.parent_dir, picture.name))
+
+
+def _stamp(path: str) -> (int, int):
+    st = os.stat(path)
+    return st.st_size, st.st_mtime_ns
+
+
+def _align(f) -> int:
+    pos = f.tell()
+    padding = (-pos) % ALIGNMENT
+    f.write(b'\x00' * padding)
+    return pos + padding
+
+
+class FeatureDB:
+    """
+    Binary file storing the features of each picture.
+
+    The file starts with a header (magic and version), followed by the raw keypoint and descriptor arrays of each
+    picture and a JSON index describing where each array is. A trailer at the end of the file points to the
+    index, so new pictures are appended by overwriting the index and writing it again after them.
+
+    Each entry stores the size and modification time of its source image, so it is ignored if the image changes.
+    The arrays are read through a memory map and are only loaded when used. Removing pictures only rewrites the
+    index, their arrays stay in the file without being referenced.
+    """
+    path: str
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def load(self, images: List[Picture]) -> List[Optional[Features]]:
+        """
+        :return: the stored features of each image, or None if they are missing or outdated
+        """
+        index = self._read_index()
+        if index is None:
+            return [None] * len(images)
+
+        data = np.memmap(self.path, np.uint8, mode='c')
+        features = []
+        for image in images:
+            path = _picture_path(image)
+            entry = index['entries'].get(path)
+            if entry is None or tuple(entry['stamp']) != _stamp(path):
+                features.append(None)
+                continue
+
+            offset, count = entry['keypoints']
+            kp = data[offset:offset + count * KEYPOINT_DTYPE.itemsize].view(KEYPOINT_DTYPE)
+
+            des = None
+            if entry['descriptors'] is not None:
+                offset, rows, cols, dtype = entry['descriptors']
+                dtype = np.dtype(dtype)
+                des = data[offset:offset + rows * cols * dtype.itemsize].view(dtype).reshape(rows, cols)
+
+            x, y, width, height = entry['text']
+            features.append((kp, des, Rectangle((x, y), width, height)))
+
+        return features
+
+    def save(self, features: List[Tuple[Picture, Features]]) -> None:
+        """
+        Stores the features of the given pictures, replacing the previous ones if they were already stored.
+        """
+        index = self._read_index()
+        if index is None:
+            index = {'version': VERSION, 'entries': {}}
+            with open(self.path, 'wb') as f:
+                f.write(_HEADER.pack(MAGIC, VERSION))
+                index_offset = f.tell()
+        else:
+            index_offset = index['offset']
+
+        with open(self.path, 'r+b') as f:
+            f.seek(index_offset)
+            for picture, (kp, des, rec) in features:
+                path = _picture_path(picture)
+                offset = _align(f)
+                kp_arr = np.ascontiguousarray(kp, KEYPOINT_DTYPE)
+                f.write(kp_arr.tobytes())
+                entry = {
+                    'id': picture.id,
+                    'stamp': _stamp(path),
+                    'keypoints': [offset, len(kp_arr)],
+                    'descriptors': None,
+                    'text': [int(rec.top_left[0]), int(rec.top_left[1]), int(rec.width), int(rec.height)]
+                }
+                if des is not None:
+                    des = np.ascontiguousarray(des)
+                    entry['descriptors'] = [_align(f), des.shape[0], des.shape[1], des.dtype.str]
+                    f.write(des.tobytes())
+
+                index['entries'][path] = entry
+
+            self._write_index(f, index)
+
+    def remove(self, images: List[Picture]) -> None:
+        """
+        Removes the entries of the given pictures from the index.
+        """
+        index = self._read_index()
+        if index is None:
+            return
+
+        removed = [index['entries'].pop(_picture_path(image), None) for image in images]
+        if not any(removed):
+            return
+
+        with open(self.path, 'r+b') as f:
+            f.seek(index['offset'])
+            self._write_index(f, index)
+
+    @staticmethod
+    def _write_index(f, index: dict) -> None:
+        """
+        Writes the index and the trailer at the current position of the file, which ends after them.
+        """
+        index.pop('offset', None)
+        raw = json.dumps(index).encode('utf-8')
+        offset = f.tell()
+        f.write(raw)
+        f.write(_TRAILER.pack(offset, len(raw), MAGIC))
+        f.truncate()
+
+    def _read_index(self) -> Optional[dict]:
+        """
+        :return: the index of the file with its offset, or None if the file does not exist or is not valid
+        """
+        if not os.path.isfile(self.path) or os.path.getsize(self.path) < _HEADER.size + _TRAILER.size:
+            return None
+
+        with open(self.path, 'rb') as f:
+            magic, version = _HEADER.unpack(f.read(_HEADER.size))
+            if magic != MAGIC or version != VERSION:
+                return None
+
+            f.seek(-_TRAILER.size, os.SEEK_END)
+            offset, length, magic = _TRAILER.unpack(f.read(_TRAILER.size))
+            if magic != MAGIC:
+                return None
+
+            f.seek(offset)
+            index = json.loads(f.read(length).decode('utf-8'))
+            index['offset'] = offset
+            return index
@@ -0,0 +1,114 @@
+import threading
+from typing import Any, Callable, Hashable, Optional, TypeVar
+
+from model import Picture
+
+T = TypeVar('T')
+
+
+class FeatureStore:
+    """
+    Memoizes the features obtained from the pictures during a run, so the methods using the same extractor with the
+    same parameters share them instead of computing them again. The entries are keyed by the path of the picture,
+    the name of the extractor and its parameters. The entries are not evicted: the callers discard the ones of each
+    query picture once its queries have finished, so the store only grows with the catalog.
+
+    Forked workers inherit the entries stored before the fork, the ones they add are not seen by the parent. Their
+    hits and misses are taken with take_counts and sent back to the parent, which adds them with add_counts.
+    """
+    hits: int
+    misses: int
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self._features = {}
+        self._lock = threading.Lock()
+
+    def get(self, picture: Picture, extractor: str, compute: Callable[[], T], params: Hashable = ()) -> T:
+        """
+        :param picture: the picture the features are obtained from
+        :param extractor: name of the extractor
+        :param compute: function that obtains the features if they are not stored
+        :param params: the parameters of the extractor that change its result
+        :return: the features
+        """
+        path, key = self._key(picture, extractor, params)
+        with self._lock:
+            features = self._features.get(path)
+            if features is not None and key in features:
+                self.hits += 1
+                return features[key]
+            self.misses += 1
+
+        value = compute()
+        with self._lock:
+            return self._features.setdefault(path, {}).setdefault(key, value)
+
+    def lookup(self, picture: Picture, extractor: str, params: Hashable = ()) -> Any:
+        """
+        :return: the stored features, or None if they are not stored
+        """
+        path, key = self._key(picture, extractor, params)
+        with self._lock:
+            return self._features.get(path, {}).get(key)
+
+    def put(self, picture: Picture, extractor: str, value: Any, params: Hashable = ()) -> None:
+        path, key = self._key(picture, extractor, params)
+        with self._lock:
+            self._features.setdefault(path, {})[key] = value
+
+    def discard(self, picture: Picture, extractor: Optional[str] = None, params: Hashable = ()) -> None:
+        """
+        Removes the features of the picture obtained with the extractor, or all of them if no extractor is given.
+        """
+        with self._lock:
+            if extractor is None:
+                self._features.pop(self._path(picture), None)
+                return
+
+            path, key = self._key(picture, extractor, params)
+            features = self._features.get(path)
+            if features is not None:
+                features.pop(key, None)
+                if not features:
+                    del self._features[path]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._features.clear()
+
+    def take_counts(self) -> (int, int):
+        """
+        :return: the hits and misses since the last call
+        """
+        with self._lock:
+            counts = self.hits, self.misses
+            self.hits = self.misses = 0
+        return counts
+
+    def add_counts(self, hits: int, misses: int) -> None:
+        """
+        Adds the hits and misses taken in another process.
+        """
+        with self._lock:
+            self.hits += hits
+            self.misses += misses
+
+    def stats(self) -> str:
+        """
+        :return: the hits and misses, and the entries stored in this process
+        """
+        with self._lock:
+            return 'Feature store: {} hits, {} misses, {} entries of {} pictures'.format(
+                self.hits, self.misses, sum(len(f) for f in self._features.values()), len(self._features))
+
+    @staticmethod
+    def _path(picture: Picture) -> str:
+        return picture.get_path()
+
+    def _key(self, picture: Picture, extractor: str, params: Hashable) -> (str, tuple):
+        return self._path(picture), (extractor, params)
+
+
+instance = FeatureStore()
@@ -1,53 +1,88 @@
-from typing import List, Tuple
+from typing import List, Set, Tuple, Union
 
 import cv2
 import numpy as np
-from functional import seq
-from methods.operations.text import detect_text
+from methods.operations.text import detect_picture_text
+from methods.operations.feature_db import remove_features, train_features
+from methods.operations.flann_index import FlannIndex
+from methods.operations.knn import ExactIndex
+from methods.operations.matching import find_positions, rank, stack
+from methods.operations.product_quantizer import PQIndex
 from model import Picture
 from model import Rectangle
 
+RATIO = 0.75
+
 
 class FLANN_Matcher:
-    db: List[Tuple[Picture, List[cv2.KeyPoint], np.array,Rectangle]]
-    bf: cv2.BFMatcher
+    db: List[Tuple[Picture, np.ndarray, np.array,Rectangle]]
+    removed: Set[int]
+    quantize: bool
+    exact: bool
+    index: Union[FlannIndex, PQIndex, ExactIndex]
     sift: cv2.xfeatures2d.SIFT_create
 
-    def __init__(self):
+    def __init__(self, quantize: bool = False, exact: bool = False, **index_params):
+        """
+        :param quantize: if True, the descriptors are product quantized and searched exhaustively with a PQIndex
+        instead of the FlannIndex, and the database does not keep the float descriptors
+        :param exact: if True, the nearest neighbours are searched exhaustively with an ExactIndex instead of the
+        FlannIndex, and the database does not keep the float descriptors either
+        :param index_params: parameters of the FlannIndex
+        """
         self.db = []
-        self.flann = cv2.FlannBasedMatcher_create()
+        self.removed = set()
         self.sift = cv2.xfeatures2d.SIFT_create(600)
+        self.quantize = quantize
+        self.exact = exact
+        if quantize:
+            self.index = PQIndex()
+        elif exact:
+            self.index = ExactIndex(self.sift.descriptorSize())
+        else:
+            self.index = FlannIndex(binary=False, **index_params)
 
     def query(self, picture: Picture) -> List[Picture]:
-        mask ,rec = detect_text(picture.get_image())
+        mask, rec = detect_picture_text(picture)
         kp, des = self.sift.detectAndCompute(picture.get_image(), mask)
-        FLANN_INDEX_KDTREE = 1
-        flann_params = dict(algorithm=FLANN_INDEX_KDTREE, trees=5)
-        flann = cv2.FlannBasedMatcher(flann_params, {})
-        return (
-            seq(self.db)
-                .map(
-                lambda p: (p[0], self.flann.knnMatch(np.asarray(p[2], np.float32), np.asarray(des, np.float32), 2)))
-                .map(lambda p: (p[0], self._ratio_test(p[1])))
-                .map(lambda p: (p[0], len(p[1])))
-                .filter(lambda p: p[1] > 4)
-                .sorted(lambda p: p[1], reverse=True)
-                .map(lambda p: p[0])
-                .take(10)
-                .to_list()
-
-        )
-
-    @staticmethod
-    def _ratio_test(matches):
-        good = []
-        for m, n in matches:
-            if m.distance < 0.75 * n.distance:
-                good.append(m)
-        return good
+
+        return rank([p[0] for p in self.db], self.index.vote(des, RATIO), 4, excluded=self.removed)
 
     def train(self, images: List[Picture]) -> None:
-        for image in images:
-            mask,bounding_text = detect_text(image.get_image())
-            kp, des = self.sift.detectAndCompute(image.get_image(), mask)
-            self.db.append((image, kp, des,bounding_text))
+        self.db = []
+        self.removed = set()
+        descriptors, owners = self._append(images)
+        self.index.train(descriptors, owners, len(self.db), key='sift_600')
+
+    def add_pictures(self, images: List[Picture]) -> None:
+        """
+        Adds the pictures at the end of the database, only obtaining and indexing the features of the new ones.
+        """
+        start = len(self.db)
+        descriptors, owners = self._append(images)
+        self.index.add(descriptors, owners + start, len(self.db))
+
+    def remove_pictures(self, images: List[Picture]) -> None:
+        """
+        Removes the pictures from the database, and their features when no other matcher uses them. They keep their
+        position in the database, but the index drops their rows from the search.
+        """
+        positions = find_positions([p[0] for p in self.db], images)
+        self.removed.update(positions)
+        self.index.remove(positions)
+        remove_features('sift_600', self, images)
+
+    def _append(self, images: List[Picture]) -> (np.ndarray, np.ndarray):
+        """
+        :return: the stacked descriptors of the new pictures and the position among them of the owner of each row
+        """
+        features = train_features('sift_600', self, images, self._extract, desc='Training sift',
+                                  keep_descriptors=not self.quantize)
+        for image, (kp, des, bounding_text) in zip(images, features):
+            self.db.append((image, kp, None if self.quantize or self.exact else des, bounding_text))
+        return stack([f[1] for f in features], self.sift.descriptorSize(), np.float32)
+
+    def _extract(self, image: Picture):
+        mask, bounding_text = detect_picture_text(image)
+        kp, des = self.sift.detectAndCompute(image.get_image(), mask)
+        return kp, des, bounding_text
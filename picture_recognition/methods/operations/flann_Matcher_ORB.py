@@ -1,55 +1,72 @@
-from typing import List, Tuple
+from typing import List, Set, Tuple
 
 import cv2
 import numpy as np
-from functional import seq
-from methods.operations.text import detect_text
+from methods.operations.text import detect_picture_text
+from methods.operations.feature_db import remove_features, train_features
+from methods.operations.flann_index import FlannIndex
+from methods.operations.matching import find_positions, rank, stack
 from model import Picture
 from model import Rectangle
 
-THRESHOLD = 28
+RATIO = 0.75
 
 
 class Flann_Matcher_ORB:
-    db: List[Tuple[Picture, List[cv2.KeyPoint], np.array,Rectangle]]
-    bf: cv2.BFMatcher
+    db: List[Tuple[Picture, np.ndarray, np.array,Rectangle]]
+    removed: Set[int]
+    index: FlannIndex
     orb: cv2.ORB
 
-    def __init__(self):
+    def __init__(self, **index_params):
+        """
+        :param index_params: parameters of the FlannIndex
+        """
         self.db = []
-        FLANN_INDEX_KDTREE = 1
-        flann_params = dict(algorithm=FLANN_INDEX_KDTREE, trees=5)
-        self.flann = cv2.FlannBasedMatcher(flann_params, {})
+        self.removed = set()
+        self.index = FlannIndex(binary=True, **index_params)
         self.orb = cv2.ORB_create()
 
     def query(self, picture: Picture) -> List[Picture]:
-        mask, rec = detect_text(picture.get_image())
+        mask, rec = detect_picture_text(picture)
         kp, des = self.orb.detectAndCompute(picture.get_image(), mask)
 
-        return (
-            seq(self.db)
-                .map(
-                lambda p: (p[0], self.flann.knnMatch(np.asarray(p[2], np.float32), np.asarray(des, np.float32), 2)))
-                .map(lambda p: (p[0], self._ratio_test(p[1])))
-                .map(lambda p: (p[0], len(p[1])))
-                .filter(lambda p: p[1] > 4)
-                .sorted(lambda p: p[1], reverse=True)
-                .map(lambda p: p[0])
-                .take(10)
-                .to_list()
-
-        )
-
-    @staticmethod
-    def _ratio_test(matches):
-        good = []
-        for m, n in matches:
-            if m.distance < 0.75 * n.distance:
-                good.append(m)
-        return good
+        return rank([p[0] for p in self.db], self.index.vote(des, RATIO), 4, excluded=self.removed)
 
     def train(self, images: List[Picture]) -> None:
-        for image in images:
-            mask,bounding_text = detect_text(image.get_image())
-            kp, des = self.orb.detectAndCompute(image.get_image(), mask)
-            self.db.append((image, kp, des,bounding_text))
+        self.db = []
+        self.removed = set()
+        self._append(images)
+
+        descriptors, owners = stack([p[2] for p in self.db], self.orb.descriptorSize(), np.uint8)
+        self.index.train(descriptors, owners, len(self.db), key='orb_500')
+
+    def add_pictures(self, images: List[Picture]) -> None:
+        """
+        Adds the pictures at the end of the database, only obtaining and indexing the features of the new ones.
+        """
+        start = len(self.db)
+        self._append(images)
+
+        descriptors, owners = stack([p[2] for p in self.db[start:]], self.orb.descriptorSize(), np.uint8)
+        self.index.add(descriptors, owners + start, len(self.db))
+
+    def remove_pictures(self, images: List[Picture]) -> None:
+        """
+        Removes the pictures from the database, and their features when no other matcher uses them. They keep their
+        position in the database, but the index drops their rows from the search.
+        """
+        positions = find_positions([p[0] for p in self.db], images)
+        self.removed.update(positions)
+        self.index.remove(positions)
+        remove_features('orb_500', self, images)
+
+    def _append(self, images: List[Picture]) -> None:
+        features = train_features('orb_500', self, images, self._extract, desc='Training orb')
+        for image, (kp, des, bounding_text) in zip(images, features):
+            self.db.append((image, kp, des, bounding_text))
+
+    def _extract(self, image: Picture):
+        mask, bounding_text = detect_picture_text(image)
+        kp, des = self.orb.detectAndCompute(image.get_image(), mask)
+        return kp, des, bounding_text
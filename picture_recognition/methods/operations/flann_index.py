@@ -0,0 +1,203 @@
+import hashlib
+import json
+import os
+from typing import Collection, List, Optional, Set
+
+import cv2
+import numpy as np
+
+from methods.operations.feature_db import get_cache_dir
+from methods.operations.profiling import instance as profiler
+
+FLANN_INDEX_KDTREE = 1
+FLANN_INDEX_LSH = 6
+
+TREES = 5
+TABLE_NUMBER = 6
+KEY_SIZE = 12
+MULTI_PROBE_LEVEL = 1
+CHECKS = 50
+
+
+class Segment:
+    """
+    Index over a part of the database descriptors. It keeps a reference to the descriptors, since the index does not
+    copy them.
+    """
+    descriptors: np.ndarray
+    owners: np.ndarray
+    index: Optional[cv2.flann_Index]
+
+    def __init__(self, descriptors: np.ndarray, owners: np.ndarray, index: Optional[cv2.flann_Index]):
+        self.descriptors = descriptors
+        self.owners = owners
+        self.index = index
+
+
+class FlannIndex:
+    """
+    Approximate nearest neighbour index over the stacked descriptors of the whole database. Float descriptors (SIFT)
+    use a forest of randomized KD-trees and binary descriptors (ORB) multi-probe LSH under the Hamming distance.
+
+    A query searches the two nearest database descriptors of each of its descriptors in a single call, applies the
+    ratio test and votes for the painting owning the nearest one.
+
+    KD-tree indexes are saved in the cache directory set with feature_db.set_cache_dir and loaded when the database
+    descriptors and the parameters have not changed. LSH indexes are always built, OpenCV can't load them back.
+
+    OpenCV indexes can't be modified, so the descriptors added after train are indexed in new segments, which are
+    searched too. A new segment is merged with the previous ones while it is more than half their size, so each
+    segment is less than half the previous one: there are O(log n) segments and each descriptor is indexed O(log n)
+    times. The descriptors of removed paintings are ignored by the queries and dropped when their segment is merged.
+    Only the segment built in train is persisted.
+    """
+    binary: bool
+    params: dict
+    checks: int
+    size: int
+    segments: List[Segment]
+    removed: Set[int]
+
+    def __init__(self, binary: bool, trees=TREES, table_number=TABLE_NUMBER, key_size=KEY_SIZE,
+                 multi_probe_level=MULTI_PROBE_LEVEL, checks=CHECKS):
+        """
+        :param binary: if True the descriptors are binary and LSH is used, else a KD-tree forest
+        :param trees: number of KD-trees, more trees improve the recall
+        :param table_number: number of LSH hash tables
+        :param key_size: number of bits of the LSH hash keys, shorter keys improve the recall
+        :param multi_probe_level: number of bits flipped to visit neighbouring LSH buckets
+        :param checks: maximum number of leaves visited per search, the main speed versus recall trade-off
+        """
+        self.binary = binary
+        if binary:
+            self.params = dict(algorithm=FLANN_INDEX_LSH, table_number=table_number, key_size=key_size,
+                               multi_probe_level=multi_probe_level)
+        else:
+            self.params = dict(algorithm=FLANN_INDEX_KDTREE, trees=trees)
+        self.checks = checks
+        self.size = 0
+        self.segments = []
+        self.removed = set()
+
+    def train(self, descriptors: np.ndarray, owners: np.ndarray, size: int, key: str = None) -> None:
+        """
+        Builds the index, or loads it from the cache directory.
+        :param descriptors: the stacked descriptors of the database
+        :param owners: the position in the database of the painting owning each descriptor
+        :param size: the number of paintings in the database
+        :param key: name of the index in the cache directory, if None it is not persisted
+        """
+        self.size = size
+        self.segments = []
+        self.removed = set()
+        if len(descriptors) < 2:
+            self._add_segment(descriptors, owners)
+            return
+
+        descriptors = self._contiguous(descriptors)
+        path = None
+        if key is not None and get_cache_dir() is not None and not self.binary:
+            path = os.path.join(get_cache_dir(), key + '.flann')
+            digest = hashlib.sha1(descriptors.tobytes()).hexdigest()
+            index = self._load(path, descriptors, digest)
+            if index is not None:
+                self.segments.append(Segment(descriptors, owners, index))
+                return
+
+        index = cv2.flann_Index(descriptors, self.params)
+        self.segments.append(Segment(descriptors, owners, index))
+        if path is not None:
+            index.save(path)
+            with open(path + '.json', 'w') as f:
+                json.dump({'digest': digest, 'params': self.params}, f)
+
+    def add(self, descriptors: np.ndarray, owners: np.ndarray, size: int) -> None:
+        """
+        Indexes the descriptors of new paintings.
+        :param descriptors: the stacked descriptors of the new paintings
+        :param owners: the position in the database of the painting owning each descriptor
+        :param size: the number of paintings in the database, including the new ones
+        """
+        self.size = size
+        descriptors = self._contiguous(descriptors)
+        while self.segments and len(self.segments[-1].descriptors) < 2 * len(descriptors):
+            last = self.segments.pop()
+            descriptors = np.concatenate((last.descriptors, descriptors))
+            owners = np.concatenate((last.owners, owners))
+        self._add_segment(descriptors, owners)
+
+    def remove(self, positions: Collection[int]) -> None:
+        """
+        :param positions: the positions in the database of the removed paintings
+        """
+        self.removed.update(positions)
+
+    def _add_segment(self, descriptors: np.ndarray, owners: np.ndarray) -> None:
+        if self.removed:
+            keep = ~np.isin(owners, list(self.removed))
+            descriptors, owners = descriptors[keep], owners[keep]
+        if len(descriptors) == 0:
+            return
+
+        # A single descriptor can't be searched for two neighbours, it waits to be merged with the next segment
+        descriptors = self._contiguous(descriptors)
+        index = cv2.flann_Index(descriptors, self.params) if len(descriptors) >= 2 else None
+        self.segments.append(Segment(descriptors, owners, index))
+
+    def _contiguous(self, descriptors: np.ndarray) -> np.ndarray:
+        return np.ascontiguousarray(descriptors, np.uint8 if self.binary else np.float32)
+
+    def _load(self, path: str, descriptors: np.ndarray, digest: str) -> Optional[cv2.flann_Index]:
+        if not os.path.isfile(path) or not os.path.isfile(path + '.json'):
+            return None
+        with open(path + '.json') as f:
+            meta = json.load(f)
+        if meta['digest'] != digest or meta['params'] != self.params:
+            return None
+
+        index = cv2.flann_Index()
+        if not index.load(descriptors, path):
+            return None
+        return index
+
+    @profiler.profiled('flann.vote')
+    def vote(self, des: np.ndarray, ratio: float) -> np.ndarray:
+        """
+        :param des: the query descriptors
+        :param ratio: the nearest neighbour must be closer than ratio times the second one
+        :return: the number of query descriptors matched with each painting of the database
+        """
+        segments = [segment for segment in self.segments if segment.index is not None]
+        if des is None or not segments:
+            return np.zeros((self.size,), np.int64)
+
+        des = self._contiguous(des)
+        owners, distances = zip(*(self._search(segment, des) for segment in segments))
+        owners, distances = np.hstack(owners), np.hstack(distances)
+        if len(segments) > 1:
+            # Keep the two nearest neighbours among all the segments
+            nearest = np.argsort(distances, axis=1, kind='stable')[:, :2]
+            owners = np.take_along_axis(owners, nearest, axis=1)
+            distances = np.take_along_axis(distances, nearest, axis=1)
+
+        good = np.isfinite(distances[:, 1]) & (distances[:, 0] < ratio * distances[:, 1])
+        return np.bincount(owners[good, 0], minlength=self.size)
+
+    def _search(self, segment: Segment, des: np.ndarray) -> (np.ndarray, np.ndarray):
+        """
+        :return: the owners of the two nearest neighbours of each query descriptor in the segment and their
+        distances. The distance is infinite if the neighbour was not found or belongs to a removed painting
+        """
+        indices, distances = segment.index.knnSearch(des, 2, params=dict(checks=self.checks))
+        distances = distances.astype(np.float32)
+        if not self.binary:
+            # The KD-tree returns squared L2 distances
+            np.sqrt(distances, out=distances)
+
+        # LSH may not find two neighbours
+        found = indices >= 0
+        owners = np.where(found, segment.owners[indices], 0)
+        if self.removed:
+            found &= ~np.isin(owners, list(self.removed))
+        distances[~found] = np.inf
+        return owners, distances
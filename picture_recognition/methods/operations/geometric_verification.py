@@ -0,0 +1,61 @@
+from typing import List, Sequence, Tuple, TypeVar
+
+import cv2
+import numpy as np
+
+from methods.operations.profiling import instance as profiler
+
+K = 10
+TOP_N = 20
+MIN_INLIERS = 4
+REPROJECTION_THRESHOLD = 5.0
+# Enough to find a homography with 99.5% confidence when a third of the matches are inliers. Paintings with fewer
+# inliers are not the query, and with the OpenCV default of 2000 they take most of the time
+MAX_ITERATIONS = 500
+
+T = TypeVar('T')
+
+
+def count_inliers(src: np.ndarray, dst: np.ndarray, threshold: float = REPROJECTION_THRESHOLD,
+                  max_iterations: int = MAX_ITERATIONS) -> int:
+    """
+    Fits a homography between the matched points with RANSAC.
+    :param src: the coordinates of the matched points in the first image, with shape (matches, 2)
+    :param dst: the coordinates of the same matches in the second image
+    :param threshold: maximum reprojection error of an inlier, in pixels
+    :param max_iterations: maximum number of RANSAC iterations, it bounds the time spent in each painting
+    :return: the number of inliers, 0 if there are less than the 4 matches needed or no homography is found
+    """
+    if len(src) < 4:
+        return 0
+
+    _, mask = cv2.findHomography(src.reshape((-1, 1, 2)), dst.reshape((-1, 1, 2)), cv2.RANSAC, threshold,
+                                 maxIters=max_iterations)
+    return 0 if mask is None else int(np.count_nonzero(mask))
+
+
+@profiler.profiled('verification')
+def rerank(candidates: Sequence[T], matches: Sequence[Tuple[np.ndarray, np.ndarray]], k: int = K,
+           min_inliers: int = MIN_INLIERS) -> List[T]:
+    """
+    Orders the candidates by the number of inliers of the homography between the query and each of them.
+
+    The number of matches of a candidate bounds its number of inliers, so the candidates are verified from the one
+    with the most matches, and the verification stops once no remaining candidate can enter the k best.
+    :param candidates: the top N candidates of a matcher
+    :param matches: for each candidate, the coordinates of its matches in the query and in the candidate
+    :param k: number of results
+    :param min_inliers: the candidates with this number of inliers or less are discarded
+    :return: the k candidates with the most inliers, the best first. Ties keep the order by number of matches
+    """
+    order = sorted(range(len(candidates)), key=lambda pos: -len(matches[pos][0]))
+    verified = []
+    for pos in order:
+        inliers = sorted((count for count, _ in verified), reverse=True)
+        bound = inliers[k - 1] if len(inliers) >= k else min_inliers
+        if len(matches[pos][0]) <= bound:
+            break
+        verified.append((count_inliers(*matches[pos]), pos))
+
+    verified.sort(key=lambda v: -v[0])
+    return [candidates[pos] for count, pos in verified[:k] if count > min_inliers]
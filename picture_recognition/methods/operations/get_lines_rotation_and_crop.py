@@ -6,7 +6,9 @@ import numpy as np
 from functional import seq
 from numba import njit
 
-from model import Frame
+from methods.operations.feature_store import instance as feature_store
+from methods.operations.profiling import instance as profiler
+from model import Frame, Picture
 
 MAX_SIDE = 500
 SHOW_OUTPUT = False
@@ -16,6 +18,49 @@ def get_frame_with_lines(im: np.ndarray) -> Frame:
     scale = min(MAX_SIDE / im.shape[0], MAX_SIDE / im.shape[1])
     resized = cv2.resize(im, (0, 0), fx=scale, fy=scale)
 
+    with profiler.span('frame.lines'):
+        intersections = find_intersections(resized)
+
+    imres = None
+    if SHOW_OUTPUT:
+        imres = cv2.cvtColor(resized, cv2.COLOR_BGR2RGB)
+
+    points = [(0., 0.), (0., 0.), (0., 0.), (0., 0.)]
+    angle = 0
+    if len(intersections) > 4:
+        with profiler.span('frame.rectangle'):
+            points, angle = magic(intersections, im.shape[0] * scale, im.shape[1] * scale)
+
+        if SHOW_OUTPUT:
+            for p in points:
+                cv2.circle(imres, (int(p[0]), int(p[1])), 3, (255, 0, 0), thickness=-1)
+
+    if SHOW_OUTPUT:
+        plt.imshow(imres)
+        plt.show()
+
+    # Undo scale
+    points = (seq(points)
+              .map(lambda point: (int(point[0] / scale), int(point[1] / scale)))
+              .to_list())
+
+    return Frame(points, angle)
+
+
+@profiler.profiled('frame')
+def get_picture_frame(picture: Picture) -> Frame:
+    """
+    Same as get_frame_with_lines, shared through the feature store.
+    """
+    return feature_store.get(picture, 'frame', lambda: get_frame_with_lines(picture.get_image()))
+
+
+def find_intersections(resized: np.ndarray) -> np.ndarray:
+    """
+    Detects the lines of the image and obtains their simplified intersections of around 90º.
+    :param resized: the image, already resized
+    :return: matrix with rows (x, y, angle)
+    """
     if SHOW_OUTPUT:
         plt.imshow(cv2.cvtColor(resized, cv2.COLOR_BGR2RGB))
         plt.show()
@@ -45,8 +90,9 @@ def get_frame_with_lines(im: np.ndarray) -> Frame:
         plt.show()
 
     lines = cv2.HoughLinesP(gray, rho=1, theta=np.pi / 180, threshold=80, minLineLength=100, maxLineGap=10)
+    if lines is None:
+        return np.empty((0, 3), np.float64)
 
-    imres = None
     if SHOW_OUTPUT:
         im2 = resized.copy()
         for line in lines:
@@ -54,8 +100,6 @@ def get_frame_with_lines(im: np.ndarray) -> Frame:
         plt.imshow(cv2.cvtColor(im2, cv2.COLOR_BGR2RGB))
         plt.show()
 
-        imres = cv2.cvtColor(resized, cv2.COLOR_BGR2RGB)
-
     intersections = get_intersections(lines)
     if SHOW_OUTPUT:
         im2 = resized.copy()
@@ -74,25 +118,18 @@ def get_frame_with_lines(im: np.ndarray) -> Frame:
         plt.imshow(cv2.cvtColor(im2, cv2.COLOR_BGR2RGB))
         plt.show()
 
-    points = [(0., 0.), (0., 0.), (0., 0.), (0., 0.)]
-    angle = 0
-    if len(intersections) > 4:
-        points, angle = magic(intersections, im.shape[0] * scale, im.shape[1] * scale)
-
-        if SHOW_OUTPUT:
-            for p in points:
-                cv2.circle(imres, (int(p[0]), int(p[1])), 3, (255, 0, 0), thickness=-1)
-
-    if SHOW_OUTPUT:
-        plt.imshow(imres)
-        plt.show()
+    return intersections
 
-    # Undo scale
-    points = (seq(points)
-              .map(lambda point: (int(point[0] / scale), int(point[1] / scale)))
-              .to_list())
 
-    return Frame(points, angle)
+def compile_numba() -> None:
+    """
+    Compiles the numba functions of the frame detection with the argument types they are called with, so the
+    processes forked later don't compile them again.
+    """
+    lines = np.array([[[0, 0, 100, 0]], [[0, 50, 100, 50]], [[0, 100, 100, 100]], [[0, 0, 0, 100]],
+                      [[100, 0, 100, 100]]], np.int32)
+    intersections = simplify_intersections(get_intersections(lines))
+    magic(intersections, 200., 200.)
 
 
 @njit()
@@ -145,6 +182,11 @@ def magic(data: np.ndarray, width: int, height: int):
     """
     For each 3 points with an angle of 90º among them we calculate a 4th one, then, we store
     the set with the biggest area.
+
+    The triples are visited in the same order as an exhaustive search and only replace the best one when their area
+    is strictly bigger, so the result is the same. For each first point only the following points with a similar
+    angle are considered, and a triple is skipped when its area is bounded by the current best one: the area is at
+    most half the length of the first side times the distance from the first point to the farthest candidate.
     :param data: matrix with rows (x, y, angle)
     :param width: width of the image
     :param height: height of the image
@@ -154,55 +196,81 @@ def magic(data: np.ndarray, width: int, height: int):
     points = [(0., 0.), (0., 0.), (0., 0.), (0., 0.)]
     angle = 0
 
-    for p0 in range(len(data)):
-        for p1 in range(p0 + 1, len(data)):
-            for p2 in range(p1 + 1, len(data)):
-                if (np.abs(data[p0, 2] - data[p1, 2]) < 5 and
-                        np.abs(data[p0, 2] - data[p2, 2]) < 5):
-
-                    # Combine points in a matrix
-                    p = data[np.array([p0, p1, p2]), 0:2]
-
-                    # Calculate area using shoelace formula
-                    area = 0.0
-                    for i in range(p.shape[0]):
-                        j = (i + 1) % p.shape[0]
-                        area += p[i][0] * p[j][1]
-                        area -= p[j][0] * p[i][1]
-                    area = abs(area) / 2.0
-
-                    if area > max_area:
-                        d01 = np.subtract(data[p1, :], data[p0, :])
-                        d12 = np.subtract(data[p2, :], data[p1, :])
-                        d20 = np.subtract(data[p0, :], data[p2, :])
-
-                        # Calculate fourth point
-                        if np.linalg.norm(d01) > np.linalg.norm(d12) and np.linalg.norm(d01) > np.linalg.norm(d20):
-                            # p2 corner
-                            point4 = np.add(data[p1, :], d20)
-                        elif np.linalg.norm(d12) > np.linalg.norm(d20):
-                            # p0 corner
-                            point4 = np.add(data[p2, :], d01)
-                        else:
-                            # p1 corner
-                            point4 = np.add(data[p0, :], d12)
-
-                        # Discard point if outside of image
-                        if point4[0] < 0 or point4[1] < 0 or point4[0] > width or point4[1] > height:
-                            continue
-
-                        max_area = area
-                        points = [
-                            (data[p0, 0], data[p0, 1]),
-                            (data[p1, 0], data[p1, 1]),
-                            (data[p2, 0], data[p2, 1]),
-                            (point4[0], point4[1])
-                        ]
-                        angle = data[p0, 2]
+    n = len(data)
+    candidates = np.empty((n,), np.int64)
+    for p0 in range(n):
+        # Following points with a similar angle and distance to the farthest one
+        count = 0
+        radius = 0.
+        for p in range(p0 + 1, n):
+            if np.abs(data[p0, 2] - data[p, 2]) < 5:
+                candidates[count] = p
+                count += 1
+                radius = max(radius, math.hypot(data[p, 0] - data[p0, 0], data[p, 1] - data[p0, 1]))
+
+        if count < 2 or not _may_improve(0.5 * radius * radius, max_area):
+            continue
+
+        for c1 in range(count - 1):
+            p1 = candidates[c1]
+            side = math.hypot(data[p1, 0] - data[p0, 0], data[p1, 1] - data[p0, 1])
+            if not _may_improve(0.5 * side * radius, max_area):
+                continue
+
+            for c2 in range(c1 + 1, count):
+                p2 = candidates[c2]
+
+                # Calculate area using shoelace formula
+                area = 0.0
+                area += data[p0, 0] * data[p1, 1]
+                area -= data[p1, 0] * data[p0, 1]
+                area += data[p1, 0] * data[p2, 1]
+                area -= data[p2, 0] * data[p1, 1]
+                area += data[p2, 0] * data[p0, 1]
+                area -= data[p0, 0] * data[p2, 1]
+                area = abs(area) / 2.0
+
+                if area > max_area:
+                    d01 = np.subtract(data[p1, :], data[p0, :])
+                    d12 = np.subtract(data[p2, :], data[p1, :])
+                    d20 = np.subtract(data[p0, :], data[p2, :])
+                    n01 = np.linalg.norm(d01)
+                    n12 = np.linalg.norm(d12)
+                    n20 = np.linalg.norm(d20)
+
+                    # Calculate fourth point
+                    if n01 > n12 and n01 > n20:
+                        # p2 corner
+                        point4 = np.add(data[p1, :], d20)
+                    elif n12 > n20:
+                        # p0 corner
+                        point4 = np.add(data[p2, :], d01)
+                    else:
+                        # p1 corner
+                        point4 = np.add(data[p0, :], d12)
+
+                    # Discard point if outside of image
+                    if point4[0] < 0 or point4[1] < 0 or point4[0] > width or point4[1] > height:
+                        continue
+
+                    max_area = area
+                    points = [
+                        (data[p0, 0], data[p0, 1]),
+                        (data[p1, 0], data[p1, 1]),
+                        (data[p2, 0], data[p2, 1]),
+                        (point4[0], point4[1])
+                    ]
+                    angle = data[p0, 2]
 
     return points, angle
 
 
+@njit()
+def _may_improve(bound: float, max_area: float) -> bool:
+    # Margin for the rounding errors of the shoelace formula
+    return bound * (1 + 1e-9) + 1e-6 > max_area
+
+
 @njit()
 def simplify_intersections(data: np.ndarray) -> np.ndarray:
     mask = np.ones((data.shape[0],), np.bool_)
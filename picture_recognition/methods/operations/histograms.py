@@ -32,3 +32,44 @@ def get_histogram(im: np.ndarray, histogram_type=HistogramTypes.HSV) -> List[np.
             hist.append(h)
 
     return hist
+
+
+def get_block_histograms(im: np.ndarray, rows: int, columns: int, histogram_type=HistogramTypes.HSV,
+                         channels: range = None) -> np.ndarray:
+    """
+    Obtains the normalized histogram of each channel of each block of a rows x columns grid, the same as calling
+    get_histogram for each block. The colour space is converted once and the histograms of all the blocks are counted
+    with a single bincount per channel of the (block, value) index of every pixel.
+    :param im: the BGR image
+    :param rows: number of blocks in the vertical axis
+    :param columns: number of blocks in the horizontal axis
+    :param histogram_type: the colour space of the histograms
+    :param channels: the channels to compute, all by default
+    :return: array with shape (rows * columns, channels, 256), the blocks in row-major order
+    """
+    if histogram_type == HistogramTypes.HSV:
+        im = cv2.cvtColor(im, cv2.COLOR_BGR2HSV)
+    elif histogram_type == HistogramTypes.YCbCr:
+        im = cv2.cvtColor(im, cv2.COLOR_BGR2YCrCb)
+    if channels is None:
+        channels = range(im.shape[2])
+
+    # Same block bounds as slicing the image by int(i * block_size), the pixels out of the grid are ignored
+    block_x = im.shape[0] / rows
+    block_y = im.shape[1] / columns
+    row_bounds = [int(i * block_x) for i in range(rows + 1)]
+    column_bounds = [int(j * block_y) for j in range(columns + 1)]
+    row_blocks = np.repeat(np.arange(rows, dtype=np.int32), np.diff(row_bounds))
+    column_blocks = np.repeat(np.arange(columns, dtype=np.int32), np.diff(column_bounds))
+    im = im[:row_bounds[-1], :column_bounds[-1]]
+
+    offsets = (row_blocks[:, np.newaxis] * columns + column_blocks[np.newaxis, :]).astype(np.intp) * 256
+    hist = np.empty((rows * columns, len(channels), 256), np.float64)
+    for pos, channel in enumerate(channels):
+        hist[:, pos] = np.bincount((offsets + im[:, :, channel]).ravel(),
+                                   minlength=rows * columns * 256).reshape((rows * columns, 256))
+
+    # L2 normalization as cv2.normalize, empty histograms stay at zero
+    norms = np.sqrt(np.square(hist).sum(axis=-1, keepdims=True))
+    np.divide(hist, norms, out=hist, where=norms > np.finfo(np.float64).eps)
+    return hist.astype(np.float32)
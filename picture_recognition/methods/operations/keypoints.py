@@ -0,0 +1,59 @@
+from typing import List
+
+import cv2
+import numpy as np
+
+KEYPOINT_DTYPE = np.dtype([
+    ('x', np.float32),
+    ('y', np.float32),
+    ('size', np.float32),
+    ('angle', np.float32),
+    ('response', np.float32),
+    ('octave', np.int32),
+])
+
+# Keypoints of a whole catalog, with the position in the database of the painting owning each one
+CATALOG_KEYPOINT_DTYPE = np.dtype(KEYPOINT_DTYPE.descr + [('owner', np.int32)])
+
+
+def keypoints_to_array(keypoints: List[cv2.KeyPoint]) -> np.ndarray:
+    """
+    Converts a list of keypoints into a structured array that can be stored and pickled.
+    :param keypoints: the list of keypoints returned by the detector
+    :return: a structured array with KEYPOINT_DTYPE
+    """
+    return np.array([(kp.pt[0], kp.pt[1], kp.size, kp.angle, kp.response, kp.octave) for kp in keypoints],
+                    KEYPOINT_DTYPE)
+
+
+def keypoints_to_points(keypoints: List[cv2.KeyPoint]) -> np.ndarray:
+    """
+    :return: the coordinates of the keypoints, with shape (keypoints, 2)
+    """
+    return np.array([kp.pt for kp in keypoints], np.float32).reshape((-1, 2))
+
+
+def stack_keypoints(keypoints: List[np.ndarray], start: int = 0) -> np.ndarray:
+    """
+    Concatenates the keypoints of several paintings in a single structured array.
+    :param keypoints: structured arrays with KEYPOINT_DTYPE, one per painting
+    :param start: position in the database of the first painting
+    :return: a structured array with CATALOG_KEYPOINT_DTYPE
+    """
+    arr = np.empty((sum(len(kp) for kp in keypoints),), CATALOG_KEYPOINT_DTYPE)
+    row = 0
+    for owner, kp in enumerate(keypoints, start):
+        for name in KEYPOINT_DTYPE.names:
+            arr[name][row:row + len(kp)] = kp[name]
+        arr['owner'][row:row + len(kp)] = owner
+        row += len(kp)
+    return arr
+
+
+def get_points(keypoints: np.ndarray, idx: np.ndarray) -> np.ndarray:
+    """
+    :param keypoints: a structured array with KEYPOINT_DTYPE or CATALOG_KEYPOINT_DTYPE
+    :param idx: the indices of the keypoints, usually the query or train indices of matches
+    :return: the coordinates of the keypoints, with shape (len(idx), 2)
+    """
+    return np.stack((keypoints['x'][idx], keypoints['y'][idx]), axis=-1)
@@ -0,0 +1,195 @@
+from typing import Collection, Set
+
+import numpy as np
+
+from methods.operations.matching import COMPACT_FRACTION, append_rows, count_owned_rows
+from methods.operations.profiling import instance as profiler
+
+CHUNK = 4096
+
+
+def squared_norms(descriptors: np.ndarray) -> np.ndarray:
+    """
+    :return: the squared L2 norm of each descriptor
+    """
+    return np.einsum('ij,ij->i', descriptors, descriptors)
+
+
+def squared_distances(a: np.ndarray, a_norms: np.ndarray, b: np.ndarray, b_norms: np.ndarray) -> np.ndarray:
+    """
+    Squared L2 distances as |a|^2 - 2 a.b + |b|^2, so most of the work is a single matrix multiplication.
+    :return: the distance between each descriptor of a and each descriptor of b, with shape (len(a), len(b))
+    """
+    distances = np.matmul(a, b.T)
+    distances *= -2
+    distances += a_norms[:, np.newaxis]
+    distances += b_norms[np.newaxis, :]
+    # Rounding can make the distance of identical descriptors slightly negative
+    return np.maximum(distances, 0, out=distances)
+
+
+def two_nearest(distances: np.ndarray) -> (np.ndarray, np.ndarray):
+    """
+    :param distances: one column per descriptor, with its distance to each candidate in the rows
+    :return: the two smallest distances of each column, the smallest first, and their rows, with shape (2, columns).
+    If there is a single row, the second neighbour has an infinite distance and the row of the first one
+    """
+    if len(distances) < 2:
+        nearest = np.zeros((2, distances.shape[1]), np.int64)
+        return np.concatenate((distances, np.full_like(distances, np.inf))), nearest
+
+    nearest = np.argpartition(distances, 1, axis=0)[:2]
+    nearest_distances = np.take_along_axis(distances, nearest, axis=0)
+    order = np.argsort(nearest_distances, axis=0, kind='stable')
+    return np.take_along_axis(nearest_distances, order, axis=0), np.take_along_axis(nearest, order, axis=0)
+
+
+def merge_two_nearest(distances: np.ndarray, owners: np.ndarray, chunk: np.ndarray,
+                      chunk_owners: np.ndarray) -> (np.ndarray, np.ndarray):
+    """
+    Updates the two nearest neighbours of each query descriptor with a new chunk of database descriptors.
+    :param distances: the two nearest distances found before, with shape (2, queries)
+    :param owners: the owners of those neighbours
+    :param chunk: the distances between the chunk descriptors (rows) and the query descriptors (columns)
+    :param chunk_owners: the owner of each chunk descriptor
+    :return: the updated distances and owners. Ties keep the neighbours found before
+    """
+    chunk_distances, nearest = two_nearest(chunk)
+    candidates = np.concatenate((distances, chunk_distances))
+    candidate_owners = np.concatenate((owners, chunk_owners[nearest]))
+    order = np.argsort(candidates, axis=0, kind='stable')[:2]
+    return np.take_along_axis(candidates, order, axis=0), np.take_along_axis(candidate_owners, order, axis=0)
+
+
+class ExactIndex:
+    """
+    Exact nearest neighbours over the stacked float descriptors of the whole database under the L2 norm, with the
+    same interface as FlannIndex. The distances are computed in chunks of database descriptors with one matrix
+    multiplication each, which runs in the BLAS library on every core, instead of one knnMatch call per painting.
+
+    The rows of removed paintings are ignored by the queries, and dropped all at once when they are more than
+    COMPACT_FRACTION of the rows.
+    """
+    columns: int
+    size: int
+    removed: Set[int]
+    removed_rows: int
+    descriptors: np.ndarray
+    norms: np.ndarray
+    owners: np.ndarray
+
+    def __init__(self, columns: int = 128):
+        """
+        :param columns: the descriptor size
+        """
+        self.columns = columns
+        self.size = 0
+        self._clear()
+
+    def train(self, descriptors: np.ndarray, owners: np.ndarray, size: int, key: str = None) -> None:
+        """
+        :param descriptors: the stacked descriptors of the database
+        :param owners: the position in the database of the painting owning each descriptor
+        :param size: the number of paintings in the database
+        :param key: unused, there is nothing to persist
+        """
+        self._clear()
+        self.add(descriptors, owners, size)
+
+    def add(self, descriptors: np.ndarray, owners: np.ndarray, size: int) -> None:
+        """
+        Appends the descriptors of new paintings.
+        """
+        self.size = size
+        rows = len(self.descriptors)
+        descriptors = np.asarray(descriptors, np.float32)
+        self._descriptors = append_rows(self._descriptors, rows, descriptors)
+        self._norms = append_rows(self._norms, rows, squared_norms(descriptors))
+        self._owners = append_rows(self._owners, rows, owners)
+        self._set_rows(rows + len(descriptors))
+
+    def remove(self, positions: Collection[int]) -> None:
+        """
+        :param positions: the positions in the database of the removed paintings
+        """
+        positions = [pos for pos in positions if pos not in self.removed]
+        self.removed.update(positions)
+        self.removed_rows += count_owned_rows(self.owners, positions)
+        if self.removed_rows > COMPACT_FRACTION * len(self.descriptors):
+            self._compact()
+
+    @profiler.profiled('knn.vote')
+    def vote(self, des: np.ndarray, ratio: float) -> np.ndarray:
+        """
+        Searches the two nearest database descriptors of each query descriptor.
+        :param des: the query descriptors
+        :param ratio: the nearest neighbour must be closer than ratio times the second one
+        :return: the number of query descriptors matched with each painting of the database
+        """
+        if des is None or len(self.descriptors) == 0:
+            return np.zeros((self.size,), np.int64)
+
+        des = np.asarray(des, np.float32)
+        des_norms = squared_norms(des)
+        distances = np.full((2, len(des)), np.inf, np.float32)
+        owners = np.zeros((2, len(des)), np.int32)
+        removed = list(self.removed) if self.removed_rows else []
+        for start in range(0, len(self.descriptors), CHUNK):
+            end = start + CHUNK
+            chunk = squared_distances(self.descriptors[start:end], self.norms[start:end], des, des_norms)
+            if removed:
+                chunk[np.isin(self.owners[start:end], removed)] = np.inf
+            distances, owners = merge_two_nearest(distances, owners, chunk, self.owners[start:end])
+
+        np.sqrt(distances, out=distances)
+        good = np.isfinite(distances[1]) & (distances[0] < ratio * distances[1])
+        return np.bincount(owners[0, good], minlength=self.size)
+
+    @profiler.profiled('knn.ratio_votes')
+    def ratio_votes(self, des: np.ndarray, ratio: float) -> np.ndarray:
+        """
+        Searches the two nearest query descriptors of each database descriptor, the same as a knnMatch of the
+        descriptors of each painting against the query with k=2.
+        :param des: the query descriptors
+        :param ratio: the nearest neighbour must be closer than ratio times the second one
+        :return: the number of descriptors of each painting of the database that pass the ratio test
+        """
+        counts = np.zeros((self.size,), np.int64)
+        if des is None or len(des) < 2:
+            return counts
+
+        des = np.asarray(des, np.float32)
+        des_norms = squared_norms(des)
+        for start in range(0, len(self.descriptors), CHUNK):
+            end = start + CHUNK
+            chunk = squared_distances(des, des_norms, self.descriptors[start:end], self.norms[start:end])
+            distances, _ = two_nearest(chunk)
+            np.sqrt(distances, out=distances)
+            counts += np.bincount(self.owners[start:end][distances[0] < ratio * distances[1]], minlength=self.size)
+        counts[list(self.removed)] = 0
+        return counts
+
+    def _compact(self) -> None:
+        """
+        Drops the rows of the removed paintings.
+        """
+        keep = ~np.isin(self.owners, list(self.removed))
+        rows = int(np.count_nonzero(keep))
+        self._descriptors[:rows] = self.descriptors[keep]
+        self._norms[:rows] = self.norms[keep]
+        self._owners[:rows] = self.owners[keep]
+        self._set_rows(rows)
+        self.removed_rows = 0
+
+    def _clear(self) -> None:
+        self.removed = set()
+        self.removed_rows = 0
+        self._descriptors = np.empty((0, self.columns), np.float32)
+        self._norms = np.empty((0,), np.float32)
+        self._owners = np.empty((0,), np.int32)
+        self._set_rows(0)
+
+    def _set_rows(self, rows: int) -> None:
+        self.descriptors = self._descriptors[:rows]
+        self.norms = self._norms[:rows]
+        self.owners = self._owners[:rows]
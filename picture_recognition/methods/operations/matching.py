@@ -0,0 +1,139 @@
+from typing import Collection, List, Optional, Sequence, TypeVar
+
+import cv2
+import numpy as np
+
+from model import Picture
+from methods.operations.profiling import instance as profiler
+
+K = 10
+# Fraction of the stacked rows that can belong to removed paintings before they are dropped
+COMPACT_FRACTION = 0.25
+
+T = TypeVar('T')
+
+
+def to_arrays(matches: List[cv2.DMatch]) -> (np.ndarray, np.ndarray, np.ndarray):
+    """
+    Converts the result of a match call to arrays.
+    :return: the distance, the query index and the train index of each match
+    """
+    distances = np.fromiter((m.distance for m in matches), np.float32, len(matches))
+    query_idx = np.fromiter((m.queryIdx for m in matches), np.int32, len(matches))
+    train_idx = np.fromiter((m.trainIdx for m in matches), np.int32, len(matches))
+    return distances, query_idx, train_idx
+
+
+def knn_to_arrays(matches: List[List[cv2.DMatch]], k: int = 2) -> (np.ndarray, np.ndarray, np.ndarray):
+    """
+    Converts the result of a knnMatch call to arrays, ignoring the descriptors with less than k neighbours.
+    :return: the distances, the query indices and the train indices of the k neighbours of each descriptor, with
+    shape (descriptors, k)
+    """
+    matches = [m for m in matches if len(m) >= k]
+    distances = np.fromiter((n.distance for m in matches for n in m[:k]), np.float32, len(matches) * k)
+    query_idx = np.fromiter((n.queryIdx for m in matches for n in m[:k]), np.int32, len(matches) * k)
+    train_idx = np.fromiter((n.trainIdx for m in matches for n in m[:k]), np.int32, len(matches) * k)
+    return distances.reshape((-1, k)), query_idx.reshape((-1, k)), train_idx.reshape((-1, k))
+
+
+def stack(descriptors: List[Optional[np.ndarray]], columns: int, dtype) -> (np.ndarray, np.ndarray):
+    """
+    Concatenates the descriptors of the database in a single matrix.
+    :param descriptors: the descriptors of each painting, None if it has none
+    :param columns: the descriptor size
+    :param dtype: the descriptor type
+    :return: the matrix and the position of the painting owning each row
+    """
+    entries = [(pos, des) for pos, des in enumerate(descriptors) if des is not None]
+    if not entries:
+        return np.empty((0, columns), dtype), np.empty((0,), np.int32)
+
+    return (np.ascontiguousarray(np.concatenate([des for _, des in entries]), dtype),
+            np.concatenate([np.full(len(des), pos, np.int32) for pos, des in entries]))
+
+
+def threshold_filter(distances: np.ndarray, threshold: float) -> np.ndarray:
+    """
+    :return: mask of the matches strictly closer than the threshold. The bound is raised to the closest distance,
+    so when the threshold is not above it no match passes, the closest included
+    """
+    if len(distances) == 0:
+        return np.zeros((0,), np.bool_)
+    return distances < max(threshold, distances.min())
+
+
+def ratio_test(distances: np.ndarray, ratio: float) -> np.ndarray:
+    """
+    :param distances: the distances to the two nearest neighbours of each descriptor
+    :return: mask of the descriptors whose nearest neighbour is closer than ratio times the second one
+    """
+    return distances[:, 0] < ratio * distances[:, 1]
+
+
+def count_good_matches(matches: List[cv2.DMatch], threshold: float) -> int:
+    """
+    :return: the number of matches that pass threshold_filter
+    """
+    distances, _, _ = to_arrays(matches)
+    return int(np.count_nonzero(threshold_filter(distances, threshold)))
+
+
+def count_ratio_test(matches: List[List[cv2.DMatch]], ratio: float) -> int:
+    """
+    :return: the number of knnMatch results that pass ratio_test
+    """
+    distances, _, _ = knn_to_arrays(matches)
+    return int(np.count_nonzero(ratio_test(distances, ratio)))
+
+
+@profiler.profiled('rank')
+def rank(items: Sequence[T], scores: Sequence[float], min_score: float, k: int = K,
+         excluded: Collection[int] = ()) -> List[T]:
+    """
+    :param items: the candidates, usually the database pictures
+    :param scores: the score of each candidate
+    :param min_score: the candidates with a score lower or equal are discarded
+    :param k: number of results
+    :param excluded: positions of the candidates that are never returned, usually the removed pictures
+    :return: the k best scored candidates, the best first. Ties keep the order of the candidates
+    """
+    scores = np.array(scores, np.float64)
+    scores[list(excluded)] = -np.inf
+    order = np.argsort(-scores, kind='stable')[:k]
+    return [items[pos] for pos in order if scores[pos] > min_score]
+
+
+def find_positions(pictures: Sequence[Picture], wanted: Sequence[Picture]) -> List[int]:
+    """
+    :param pictures: the pictures of the database
+    :param wanted: the pictures to look for, identified by their path
+    :return: the positions in the database of the wanted pictures that are in it
+    """
+    paths = {picture.get_path() for picture in wanted}
+    return [pos for pos, picture in enumerate(pictures) if picture.get_path() in paths]
+
+
+def append_rows(buffer: np.ndarray, size: int, rows: np.ndarray) -> np.ndarray:
+    """
+    Writes the rows after the first size rows of the buffer. The buffer grows geometrically when they don't fit, so
+    appending n rows takes amortized O(n) time regardless of the size of the buffer.
+    :return: the buffer, the same one or a larger copy
+    """
+    end = size + len(rows)
+    if end > len(buffer):
+        grown = np.empty((max(end, 2 * len(buffer)),) + buffer.shape[1:], buffer.dtype)
+        grown[:size] = buffer[:size]
+        buffer = grown
+    buffer[size:end] = rows
+    return buffer
+
+
+def count_owned_rows(owners: np.ndarray, positions: Collection[int]) -> int:
+    """
+    :param owners: the position of the painting owning each row, sorted as given by stack
+    :param positions: the positions of some paintings
+    :return: the number of rows owned by them, found by binary search
+    """
+    positions = np.fromiter(positions, owners.dtype, len(positions))
+    return int((np.searchsorted(owners, positions, 'right') - np.searchsorted(owners, positions, 'left')).sum())
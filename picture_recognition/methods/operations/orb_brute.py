@@ -1,13 +1,17 @@
 import math
-import sys
-from typing import List
+from typing import List, Set
 
 import cv2
 import numpy as np
-from functional import seq
-from tqdm import tqdm
 
-from methods.operations.text import detect_text
+from methods.operations.feature_db import remove_features, train_features
+from methods.operations.feature_store import instance as feature_store
+from methods.operations.geometric_verification import rerank
+from methods.operations.keypoints import CATALOG_KEYPOINT_DTYPE, get_points, keypoints_to_points, stack_keypoints
+from methods.operations.matching import K, COMPACT_FRACTION, append_rows, count_good_matches, count_owned_rows, \
+    find_positions, rank, stack, to_arrays, threshold_filter
+from methods.operations.profiling import instance as profiler
+from methods.operations.text import detect_picture_text
 from model import Picture, Frame
 from model import Rectangle
 
@@ -15,55 +19,239 @@ THRESHOLD = 30
 
 
 class ORBBrute:
-    db: [(Picture, List[cv2.KeyPoint], np.array)]
+    """
+    Ranks the database paintings by their number of good ORB matches with the query.
+
+    Pictures can be added to and removed from the trained database. Removed paintings keep their position in db, so
+    the positions stay aligned with other structures built from the same pictures, like the candidates given by a
+    histogram shortlist, until the next train.
+
+    The descriptors of the whole database are also stacked in a single matrix, with the keypoints in a structured
+    array with the same rows. Its owner field is the position of the painting owning each row. The rows of removed
+    paintings stay in the stacked arrays, and the query descriptors matched with them don't vote, until they are more
+    than COMPACT_FRACTION of the rows and are dropped all at once.
+    """
+    db: [(Picture, np.ndarray, np.array)]
+    removed: Set[int]
+    removed_rows: int
+    descriptors: np.ndarray
+    keypoints: np.ndarray
+    owners: np.ndarray
 
     bf: cv2.BFMatcher
+    bf_stacked: cv2.BFMatcher
     orb: cv2.ORB
+    stacked: bool
+    use_mask: bool
 
-    def __init__(self):
-        self.db = []
+    def __init__(self, stacked=False):
+        """
+        :param stacked: if True, the descriptors of the whole database are matched in a single call against one
+        contiguous matrix, instead of once per painting
+        """
+        self.stacked = stacked
+        self.use_mask = True
         self.bf = cv2.BFMatcher_create(cv2.NORM_HAMMING, crossCheck=True)
+        self.bf_stacked = cv2.BFMatcher_create(cv2.NORM_HAMMING)
         self.orb = cv2.ORB_create(1000)
+        self._clear()
+
+    def query(self, picture: Picture, frame: Frame = None, candidates: List[int] = None) -> List[Picture]:
+        kp, des = self.describe(picture, frame)
+        return self.match(des, candidates)
 
-    def query(self, picture: Picture, frame: Frame = None) -> List[Picture]:
+    def describe(self, picture: Picture, frame: Frame = None,
+                 cropped: np.ndarray = None) -> (List[cv2.KeyPoint], np.ndarray):
+        """
+        Obtains the keypoints and descriptors of the picture, cropping it first with the frame if it is valid. They
+        are shared through the feature store with the other instances.
+        :param cropped: the picture already cropped with crop and the same frame, so it is not warped again
+        """
+        points = tuple(frame.points) if frame and frame.is_valid() else None
+
+        def extract():
+            im = cropped if cropped is not None else self.crop(picture, frame)
+            return self.orb.detectAndCompute(im, None)
+
+        with profiler.span('orb.extract'):
+            return feature_store.get(picture, self._features_name(), extract, params=points)
+
+    @staticmethod
+    def crop(picture: Picture, frame: Frame = None) -> np.ndarray:
+        """
+        :return: the image of the picture, warped to a square with the content of the frame if it is valid
+        """
         im = picture.get_image()
         if frame and frame.is_valid():
             side = int(math.sqrt(frame.get_area()) * 0.8)
             m = frame.get_perspective_matrix(np.array([[0, side - 1], [side - 1, side - 1], [side - 1, 0], [0, 0]]))
-            im = cv2.warpPerspective(im, m, (side, side))
+            with profiler.span('orb.warp'):
+                im = cv2.warpPerspective(im, m, (side, side))
 
         # plt.imshow(cv2.cvtColor(im, cv2.COLOR_BGR2RGB))
         # plt.show()
 
-        kp, des = self.orb.detectAndCompute(im, None)
-
-        return (
-            seq(self.db)
-                .map(lambda p: (p[0], self.bf.match(p[2], des)))
-                .map(lambda p: (p[0],
-                                seq(p[1])
-                                .filter(lambda d: d.distance < max(THRESHOLD,
-                                                                   seq(p[1]).map(lambda m: m.distance).min()))
-                                .to_list()
-                                )
-                     )
-                .map(lambda p: (p[0], len(p[1])))
-                .filter(lambda p: p[1] > 4)
-                .sorted(lambda p: p[1], reverse=True)
-                .map(lambda p: p[0])
-                .take(10)
-                .to_list()
-        )
+        return im
+
+    def match(self, des: np.ndarray, candidates: List[int] = None) -> List[Picture]:
+        """
+        Ranks the paintings by their number of good matches with the query descriptors.
+        :param des: the query descriptors
+        :param candidates: positions in the database of the paintings to compare with, or None to use all of them
+        :return: the 10 best paintings
+        """
+        return [self.db[pos][0] for pos in self.shortlist(des, candidates)]
+
+    def shortlist(self, des: np.ndarray, candidates: List[int] = None, k: int = K) -> List[int]:
+        """
+        Same as match, but returns the positions in the database of the k best paintings.
+        """
+        if des is None:
+            return []
+        if self.stacked and candidates is None:
+            return self._match_stacked(des, k)
+
+        positions = [pos for pos in (range(len(self.db)) if candidates is None else candidates)
+                     if pos not in self.removed]
+        with profiler.span('orb.match'):
+            scores = [count_good_matches(self.bf.match(self.db[pos][2], des), THRESHOLD) for pos in positions]
+        return rank(positions, scores, 4, k)
+
+    def _match_stacked(self, des: np.ndarray, k: int) -> List[int]:
+        """
+        Matches every query descriptor against the stacked database matrix in one call and counts the good matches
+        of each painting through its owner id.
+        """
+        if len(self.descriptors) == 0:
+            return []
+
+        with profiler.span('orb.match'):
+            distances, _, train_idx = to_arrays(self.bf_stacked.match(des, self.descriptors))
+        owners = self.owners[train_idx[distances < THRESHOLD]]
+        if self.removed_rows:
+            owners = owners[~np.isin(owners, list(self.removed))]
+        counts = np.bincount(owners, minlength=len(self.db))
+        return rank(range(len(self.db)), counts, 4, k, excluded=self.removed)
+
+    def verify(self, kp: List[cv2.KeyPoint], des: np.ndarray, candidates: List[int], k: int = K) -> List[Picture]:
+        """
+        Re-ranks the candidates by the number of inliers of the homography between the query and each painting,
+        computed from their good matches.
+        :param kp: the query keypoints
+        :param des: the query descriptors
+        :param candidates: positions in the database of the paintings to verify, usually returned by shortlist
+        :param k: number of results
+        :return: the k paintings with the most inliers
+        """
+        if des is None:
+            return []
+
+        with profiler.span('orb.verify_matches'):
+            matches = self._verify_matches(kp, des, candidates)
+        return [self.db[pos][0] for pos in rerank(candidates, matches, k)]
+
+    def _verify_matches(self, kp: List[cv2.KeyPoint], des: np.ndarray, candidates: List[int]):
+        """
+        :return: for each candidate, the coordinates of its good matches in the query and in the painting
+        """
+        points = keypoints_to_points(kp)
+        # The rows of each painting in the stacked matrix start at its first owner entry
+        firsts = np.searchsorted(self.owners, candidates)
+        matches = []
+        for pos, first in zip(candidates, firsts):
+            if self.db[pos][2] is None:
+                matches.append((points[:0], points[:0]))
+                continue
+            distances, query_idx, train_idx = to_arrays(self.bf.match(des, self.db[pos][2]))
+            good = threshold_filter(distances, THRESHOLD)
+            matches.append((points[query_idx[good]], get_points(self.keypoints, first + train_idx[good])))
+        return matches
 
     def train(self, images: List[Picture], use_mask=True) -> List[Rectangle]:
-        bounding_texts = []
-        for image in tqdm(images, file=sys.stdout, desc='Training orb'):
-            mask, bounding_text = detect_text(image.get_image())
-            if use_mask:
-                kp, des = self.orb.detectAndCompute(image.get_image(), mask=mask)
-            else:
-                kp, des = self.orb.detectAndCompute(image.get_image(), None)
+        self.use_mask = use_mask
+        self._clear()
+        return self.add_pictures(images)
 
+    def add_pictures(self, images: List[Picture]) -> List[Rectangle]:
+        """
+        Adds the pictures at the end of the database, only obtaining the features of the new ones.
+        :return: the text rectangle of each picture
+        """
+        use_mask = self.use_mask
+        bounding_texts = []
+        start = len(self.db)
+        features = train_features(self._key(), self, images, lambda image: self._extract(image, use_mask),
+                                  desc='Training orb')
+        for image, (kp, des, bounding_text) in zip(images, features):
             self.db.append((image, kp, des))
             bounding_texts.append(bounding_text)
+
+        self._stack(start)
         return bounding_texts
+
+    def remove_pictures(self, images: List[Picture]) -> List[int]:
+        """
+        Removes the pictures from the database, and their features when no other matcher uses them. The rows of
+        their descriptors are only counted, the stacked arrays are compacted when there are too many of them.
+        :return: the positions of the removed pictures
+        """
+        positions = [pos for pos in find_positions([p[0] for p in self.db], images) if pos not in self.removed]
+        self.removed.update(positions)
+        remove_features(self._key(), self, images)
+
+        self.removed_rows += count_owned_rows(self.owners, positions)
+        if self.removed_rows > COMPACT_FRACTION * len(self.descriptors):
+            self._compact()
+        return positions
+
+    def _features_name(self) -> str:
+        return 'orb_%d' % self.orb.getMaxFeatures()
+
+    def _key(self) -> str:
+        return self._features_name() if self.use_mask else self._features_name() + '_no_mask'
+
+    def _extract(self, image: Picture, use_mask: bool):
+        mask, bounding_text = detect_picture_text(image)
+        if use_mask:
+            kp, des = self.orb.detectAndCompute(image.get_image(), mask=mask)
+        else:
+            kp, des = self.orb.detectAndCompute(image.get_image(), None)
+
+        return kp, des, bounding_text
+
+    def _clear(self) -> None:
+        self.db = []
+        self.removed = set()
+        self.removed_rows = 0
+        self._descriptors = np.empty((0, self.orb.descriptorSize()), np.uint8)
+        self._keypoints = np.empty((0,), CATALOG_KEYPOINT_DTYPE)
+        self._set_rows(0)
+
+    def _stack(self, start: int) -> None:
+        """
+        Appends the descriptors and the keypoints of the paintings from the start position to the stacked arrays.
+        """
+        db = self.db[start:]
+        descriptors, _ = stack([p[2] for p in db], self.orb.descriptorSize(), np.uint8)
+        # The paintings without descriptors have no keypoints either
+        keypoints = stack_keypoints([p[1] if p[2] is not None else p[1][:0] for p in db], start)
+        rows = len(self.descriptors)
+        self._descriptors = append_rows(self._descriptors, rows, descriptors)
+        self._keypoints = append_rows(self._keypoints, rows, keypoints)
+        self._set_rows(rows + len(descriptors))
+
+    def _compact(self) -> None:
+        """
+        Drops the rows of the removed paintings from the stacked arrays.
+        """
+        keep = ~np.isin(self.owners, list(self.removed))
+        rows = int(np.count_nonzero(keep))
+        self._descriptors[:rows] = self.descriptors[keep]
+        self._keypoints[:rows] = self.keypoints[keep]
+        self._set_rows(rows)
+        self.removed_rows = 0
+
+    def _set_rows(self, rows: int) -> None:
+        self.descriptors = self._descriptors[:rows]
+        self.keypoints = self._keypoints[:rows]
+        self.owners = self.keypoints['owner']
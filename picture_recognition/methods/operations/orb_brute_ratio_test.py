@@ -1,48 +1,59 @@
-from typing import List, Tuple
+from typing import List, Set, Tuple
 
 import cv2
 import numpy as np
-from functional import seq
-from methods.operations.text import detect_text
+from methods.operations.text import detect_picture_text
+from methods.operations.feature_db import remove_features, train_features
+from methods.operations.matching import count_ratio_test, find_positions, rank
 from model import Picture
 from model import Rectangle
 
+RATIO = 0.9
+
+
 class ORBBruteRatioTest:
-    db: List[Tuple[Picture, List[cv2.KeyPoint], np.array,Rectangle]]
+    db: List[Tuple[Picture, np.ndarray, np.array,Rectangle]]
+    removed: Set[int]
     bf: cv2.BFMatcher
     orb: cv2.ORB
 
     def __init__(self):
         self.db = []
+        self.removed = set()
         self.bf = cv2.BFMatcher_create()
         self.orb = cv2.ORB_create(1000)
 
     def query(self, picture: Picture) -> List[Picture]:
-        mask ,rec = detect_text(picture.get_image())
+        mask ,rec = detect_picture_text(picture)
         kp, des = self.orb.detectAndCompute(picture.get_image(), mask)
 
-        return (
-            seq(self.db)
-                .map(lambda p: (p[0], self.bf.knnMatch(p[2], des, k=2)))
-                .map(lambda p: (p[0], self._ratio_test(p[1])))
-                .map(lambda p: (p[0], len(p[1])))
-                .filter(lambda p: p[1] > 4)
-                .sorted(lambda p: p[1], reverse=True)
-                .map(lambda p: p[0])
-                .take(10)
-                .to_list()
-        )
-
-    @staticmethod
-    def _ratio_test(matches):
-        good = []
-        for m, n in matches:
-            if m.distance < 0.9 * n.distance:
-                good.append(m)
-        return good
+        scores = [count_ratio_test(self.bf.knnMatch(p[2], des, k=2), RATIO) if pos not in self.removed else 0
+                  for pos, p in enumerate(self.db)]
+        return rank([p[0] for p in self.db], scores, 4, excluded=self.removed)
 
     def train(self, images: List[Picture]) -> None:
-        for image in images:
-            mask, bounding_text= detect_text(image)
-            kp, des = self.orb.detectAndCompute(image.get_image(), mask)
-            self.db.append((image, kp, des,bounding_text))
+        self.db = []
+        self.removed = set()
+        self.add_pictures(images)
+
+    def add_pictures(self, images: List[Picture]) -> None:
+        """
+        Adds the pictures to the database, only obtaining the features of the new ones.
+        """
+        features = train_features('orb_1000', self, images, self._extract, desc='Training orb')
+        for image, (kp, des, bounding_text) in zip(images, features):
+            self.db.append((image, kp, des, bounding_text))
+
+    def remove_pictures(self, images: List[Picture]) -> None:
+        """
+        Removes the pictures from the database, and their features when no other matcher uses them. They keep their
+        position in the database until the next train, but they are not matched anymore.
+        """
+        positions = find_positions([p[0] for p in self.db], images)
+        self.removed.update(positions)
+        remove_features('orb_1000', self, images)
+
+    def _extract(self, image: Picture):
+        mask, bounding_text = detect_picture_text(image)
+        kp, des = self.orb.detectAndCompute(image.get_image(), mask)
+        return kp, des, bounding_text
@@ -1,63 +1,83 @@
-from typing import List, Tuple
+from typing import List, Set, Tuple
 
 import cv2
-from functional import seq
 import numpy as np
 from model import Picture
-from methods.operations.text import detect_text
+from methods.operations.text import detect_picture_text
+from methods.operations.feature_db import remove_features, train_features
+from methods.operations.geometric_verification import TOP_N, rerank
+from methods.operations.keypoints import get_points, keypoints_to_points
+from methods.operations.matching import find_positions, knn_to_arrays, rank, ratio_test
 from model import Rectangle
 MIN_MATCH_COUNT = 6
+RATIO = 0.9
 
 
 class ORBBruteRatioTestHomography:
-    db: List[Tuple[Picture, List[cv2.KeyPoint], np.array,Rectangle]]
+    """
+    Ranks the database paintings by their number of ORB matches that pass the ratio test, and re-ranks the top N by
+    the number of inliers of the homography between the query and the painting. The keypoint coordinates of the
+    database are stored as arrays.
+    """
+    db: List[Tuple[Picture, np.ndarray, np.array,Rectangle]]
+    removed: Set[int]
     bf: cv2.BFMatcher
     orb: cv2.ORB
+    top_n: int
 
-    def __init__(self):
+    def __init__(self, top_n: int = TOP_N):
+        """
+        :param top_n: number of paintings verified with the homography
+        """
         self.db = []
+        self.removed = set()
         self.bf = cv2.BFMatcher_create()
         self.orb = cv2.ORB_create()
+        self.top_n = top_n
 
     def query(self, picture: Picture) -> List[Picture]:
-        mask,rec=detect_text(picture.get_image())
+        mask,rec=detect_picture_text(picture)
         kp, des = self.orb.detectAndCompute(picture.get_image(), mask)
+        if des is None:
+            return []
+        points = keypoints_to_points(kp)
 
-        return (
-            seq(self.db)
-                .map(lambda p: (p[0], p[1], self.bf.knnMatch(des, p[2], k=2)))
-                .map(lambda p: (p[0], p[1], self._ratio_test(p[2])))
-                .filter(lambda p: len(p[2]) > MIN_MATCH_COUNT)
-                .map(lambda p: (p[0], self._homography(kp, p[1], p[2])))
-                .filter(lambda p: len(p[1]) > MIN_MATCH_COUNT)
-                .sorted(lambda p: p[1], reverse=True)
-                .map(lambda p: p[0])
-                .take(10)
-                .to_list()
-        )
+        matches = []
+        for pos, p in enumerate(self.db):
+            if p[2] is None or pos in self.removed:
+                matches.append((points[:0], points[:0]))
+                continue
+            distances, query_idx, train_idx = knn_to_arrays(self.bf.knnMatch(des, p[2], k=2))
+            good = ratio_test(distances, RATIO)
+            matches.append((points[query_idx[good, 0]], get_points(p[1], train_idx[good, 0])))
 
-    def train(self, images: List[Picture]) -> None:
-        for image in images:
-            mask ,bounding_text = detect_text(image.get_image())
-            kp, des = self.orb.detectAndCompute(image.get_image(), mask)
-            self.db.append((image, kp, des,bounding_text))
-
-    @staticmethod
-    def _ratio_test(matches):
-        good = []
-        for m, n in matches:
-            if m.distance < 0.9 * n.distance:
-                good.append(m)
-        return good
-
-    @staticmethod
-    def _homography(kp1, kp2, good):
+        top = rank(range(len(self.db)), [len(m[0]) for m in matches], MIN_MATCH_COUNT, self.top_n,
+                   excluded=self.removed)
+        return rerank([self.db[pos][0] for pos in top], [matches[pos] for pos in top], min_inliers=MIN_MATCH_COUNT)
 
-        src_pts = np.float32([kp1[m.queryIdx].pt for m in good]).reshape(-1, 1, 2)
-        dst_pts = np.float32([kp2[m.trainIdx].pt for m in good]).reshape(-1, 1, 2)
+    def train(self, images: List[Picture]) -> None:
+        self.db = []
+        self.removed = set()
+        self.add_pictures(images)
 
-        M, mask = cv2.findHomography(src_pts, dst_pts, cv2.RANSAC, 5.0)
-        matches = mask.sum()
+    def add_pictures(self, images: List[Picture]) -> None:
+        """
+        Adds the pictures to the database, only obtaining the features of the new ones.
+        """
+        features = train_features('orb_500', self, images, self._extract, desc='Training orb')
+        for image, (kp, des, bounding_text) in zip(images, features):
+            self.db.append((image, kp, des, bounding_text))
 
-        return matches
+    def remove_pictures(self, images: List[Picture]) -> None:
+        """
+        Removes the pictures from the database, and their features when no other matcher uses them. They keep their
+        position in the database until the next train, but they are not matched anymore.
+        """
+        positions = find_positions([p[0] for p in self.db], images)
+        self.removed.update(positions)
+        remove_features('orb_500', self, images)
 
+    def _extract(self, image: Picture):
+        mask, bounding_text = detect_picture_text(image)
+        kp, des = self.orb.detectAndCompute(image.get_image(), mask)
+        return kp, des, bounding_text
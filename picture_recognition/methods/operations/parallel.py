@@ -0,0 +1,66 @@
+import multiprocessing
+import multiprocessing.pool
+import sys
+from typing import Callable, List, TypeVar
+
+import cv2
+from tqdm import tqdm
+
+T = TypeVar('T')
+R = TypeVar('R')
+
+_workers = 1
+
+# State inherited by the workers when forked, so it is never pickled
+_func = None
+_items = None
+
+
+def set_workers(workers: int) -> None:
+    """
+    Sets the number of processes used by default by fork_map.
+    """
+    global _workers
+    _workers = workers
+
+
+def fork_map(func: Callable[[T], R], items: List[T], workers: int = None, desc: str = None) -> List[R]:
+    """
+    Applies the function to each item using a pool of forked processes. The function and the items are inherited by
+    the workers through fork, only the position of each item is sent to them, so the function can use any trained
+    state without pickling it. The results must be picklable.
+    :param func: the function to apply
+    :param items: the list of items
+    :param workers: number of processes, if 1 (or fork is not available) the items are processed in this process.
+    If None, the number set with set_workers is used
+    :param desc: description shown in the progress bar
+    :return: the results, in the same order as the items
+    """
+    global _func, _items
+    if workers is None:
+        workers = _workers
+    if workers <= 1 or len(items) <= 1 or 'fork' not in multiprocessing.get_all_start_methods():
+        return [func(item) for item in tqdm(items, file=sys.stdout, desc=desc)]
+
+    _func, _items = func, items
+    try:
+        with create_pool(workers) as pool:
+            return list(tqdm(pool.imap(_call, range(len(items))), total=len(items), file=sys.stdout, desc=desc))
+    finally:
+        _func = _items = None
+
+
+def create_pool(workers: int) -> multiprocessing.pool.Pool:
+    """
+    :return: a pool of forked processes, which inherit the state of this process at the time of the call
+    """
+    return multiprocessing.get_context('fork').Pool(workers, initializer=_init_worker)
+
+
+def _init_worker():
+    # Each worker is already a unit of parallelism
+    cv2.setNumThreads(1)
+
+
+def _call(pos: int):
+    return _func(_items[pos])
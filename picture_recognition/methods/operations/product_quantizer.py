@@ -0,0 +1,262 @@
+from typing import Collection, List, Optional, Set
+
+import cv2
+import numpy as np
+
+from methods.operations.knn import merge_two_nearest
+from methods.operations.matching import append_rows
+from methods.operations.profiling import instance as profiler
+
+SUBSPACES = 16
+CENTROIDS = 256
+ITERATIONS = 20
+MAX_SAMPLES = 100000
+CHUNK = 4096
+
+
+class ProductQuantizer:
+    """
+    Product quantization of float descriptors. Each descriptor is split in subvectors of consecutive dimensions, and
+    each subvector is replaced by the position of the nearest of the k-means centroids of its subspace. With 16
+    subspaces a 128-D float32 SIFT descriptor (512 bytes) is stored in 16 bytes, and a 64-D SURF one in 16 bytes too.
+
+    The distances are asymmetric: the query descriptors are not quantized. The distance of each query subvector to
+    every centroid of its subspace is computed once per query (the lookup tables), then the distance to a code is the
+    sum of one table entry per subspace.
+    """
+    subspaces: int
+    norm: int
+    centroids: Optional[np.ndarray]
+
+    def __init__(self, subspaces: int = SUBSPACES, norm: int = cv2.NORM_L2):
+        """
+        :param subspaces: number of subvectors, it must divide the descriptor size. Each one is stored in a byte
+        :param norm: cv2.NORM_L2 or cv2.NORM_L1, the distance approximated
+        """
+        self.subspaces = subspaces
+        self.norm = norm
+        self.centroids = None
+
+    def is_trained(self) -> bool:
+        return self.centroids is not None
+
+    def clear(self) -> None:
+        """
+        Forgets the centroids, so encode_descriptors trains the quantizer again.
+        """
+        self.centroids = None
+
+    def train(self, descriptors: np.ndarray) -> None:
+        """
+        Obtains the centroids of each subspace with k-means.
+        :param descriptors: a sample of the descriptors that will be encoded
+        """
+        rng = np.random.RandomState(0)
+        if len(descriptors) > MAX_SAMPLES:
+            descriptors = descriptors[rng.choice(len(descriptors), MAX_SAMPLES, replace=False)]
+
+        sub = self._split(descriptors)
+        k = min(CENTROIDS, len(descriptors))
+        criteria = (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, ITERATIONS, 1e-3)
+        cv2.setRNGSeed(0)
+        centroids = []
+        for m in range(self.subspaces):
+            _, _, centers = cv2.kmeans(np.ascontiguousarray(sub[:, m]), k, None, criteria, 1, cv2.KMEANS_PP_CENTERS)
+            if k < CENTROIDS:
+                # Not enough descriptors, the remaining codes are never used
+                centers = np.concatenate((centers, np.repeat(centers[:1], CENTROIDS - k, axis=0)))
+            centroids.append(centers)
+        self.centroids = np.stack(centroids).astype(np.float32)
+
+    def encode(self, descriptors: Optional[np.ndarray]) -> Optional[np.ndarray]:
+        """
+        :return: the code of each descriptor, with shape (descriptors, subspaces), or None if there are no descriptors
+        """
+        if descriptors is None:
+            return None
+
+        sub = self._split(descriptors).transpose((1, 0, 2))
+        # Nearest centroid by |c|^2 - 2 x.c, the |x|^2 term is the same for every centroid
+        scores = np.square(self.centroids).sum(axis=-1)[:, np.newaxis, :] - 2 * np.matmul(
+            sub, self.centroids.transpose((0, 2, 1)))
+        return np.ascontiguousarray(scores.argmin(axis=-1).T, np.uint8)
+
+    def tables(self, queries: np.ndarray) -> np.ndarray:
+        """
+        :param queries: the query descriptors
+        :return: the distance of each query subvector to each centroid of its subspace, with shape (subspaces,
+        centroids, queries). Squared for the L2 norm
+        """
+        sub = self._split(queries).transpose((1, 0, 2))
+        if self.norm == cv2.NORM_L1:
+            return np.stack([np.abs(self.centroids[m][:, np.newaxis, :] - sub[m][np.newaxis]).sum(axis=-1)
+                             for m in range(self.subspaces)])
+
+        tables = (np.square(self.centroids).sum(axis=-1)[:, :, np.newaxis] -
+                  2 * np.matmul(self.centroids, sub.transpose((0, 2, 1))) +
+                  np.square(sub).sum(axis=-1)[:, np.newaxis, :])
+        return np.maximum(tables, 0, out=tables)
+
+    def distances(self, tables: np.ndarray, codes: np.ndarray) -> np.ndarray:
+        """
+        :param tables: the lookup tables of the query descriptors
+        :param codes: the encoded descriptors
+        :return: the approximate distance between each code and each query descriptor, with shape (codes, queries)
+        """
+        distances = tables[0][codes[:, 0]]
+        for m in range(1, self.subspaces):
+            distances += tables[m][codes[:, m]]
+        if self.norm != cv2.NORM_L1:
+            np.sqrt(distances, out=distances)
+        return distances
+
+    def match(self, tables: np.ndarray, codes: np.ndarray) -> (np.ndarray, np.ndarray, np.ndarray):
+        """
+        Same as a cross-checked BFMatcher.match with the codes as query descriptors: the pairs that are each other's
+        nearest neighbour.
+        :return: the distance, the code index and the query descriptor index of each match, as matching.to_arrays
+        """
+        distances = self.distances(tables, codes)
+        if distances.size == 0:
+            return np.empty((0,), np.float32), np.empty((0,), np.int32), np.empty((0,), np.int32)
+
+        rows = np.arange(len(codes), dtype=np.int32)
+        nearest = distances.argmin(axis=1).astype(np.int32)
+        mutual = distances.argmin(axis=0)[nearest] == rows
+        return distances[rows, nearest][mutual], rows[mutual], nearest[mutual]
+
+    def knn_match(self, tables: np.ndarray, codes: np.ndarray, k: int = 2) -> (np.ndarray, np.ndarray, np.ndarray):
+        """
+        Same as BFMatcher.knnMatch with the codes as query descriptors.
+        :return: the distances, the code indices and the query descriptor indices of the k nearest neighbours of each
+        code, with shape (codes, k), as matching.knn_to_arrays
+        """
+        distances = self.distances(tables, codes)
+        if distances.shape[1] < k:
+            empty = np.empty((0, k), np.int32)
+            return empty.astype(np.float32), empty, empty
+
+        nearest = np.argpartition(distances, k - 1, axis=1)[:, :k]
+        nearest_distances = np.take_along_axis(distances, nearest, axis=1)
+        order = np.argsort(nearest_distances, axis=1, kind='stable')
+        rows = np.repeat(np.arange(len(codes), dtype=np.int32)[:, np.newaxis], k, axis=1)
+        return (np.take_along_axis(nearest_distances, order, axis=1), rows,
+                np.take_along_axis(nearest, order, axis=1).astype(np.int32))
+
+    def _split(self, descriptors: np.ndarray) -> np.ndarray:
+        """
+        :return: the descriptors as float32 with shape (descriptors, subspaces, subvector size)
+        """
+        descriptors = np.asarray(descriptors, np.float32)
+        return descriptors.reshape((len(descriptors), self.subspaces, -1))
+
+
+def encode_descriptors(quantizer: Optional[ProductQuantizer],
+                       descriptors: List[Optional[np.ndarray]]) -> List[Optional[np.ndarray]]:
+    """
+    Encodes the descriptors of each painting, training the quantizer first with all of them if it is not trained.
+    :param quantizer: the quantizer, if None the descriptors are returned as they are
+    :param descriptors: the descriptors of each painting, None if it has none
+    :return: the codes of each painting
+    """
+    if quantizer is None:
+        return descriptors
+
+    present = [des for des in descriptors if des is not None]
+    if not quantizer.is_trained():
+        if not present:
+            return descriptors
+        quantizer.train(np.concatenate(present))
+    return [quantizer.encode(des) for des in descriptors]
+
+
+class PQIndex:
+    """
+    Exhaustive search over the product quantized descriptors of the whole database, with the same interface as
+    FlannIndex. A query computes its lookup tables once and scans the codes in chunks, keeping the two nearest
+    neighbours of each query descriptor, then applies the ratio test and votes for the painting owning the nearest
+    one. The descriptors of removed paintings are ignored.
+    """
+    quantizer: ProductQuantizer
+    size: int
+    removed: Set[int]
+    codes: np.ndarray
+    owners: np.ndarray
+
+    def __init__(self, quantizer: ProductQuantizer = None):
+        """
+        :param quantizer: the quantizer, trained with the database descriptors in train if it is not trained
+        """
+        self.quantizer = quantizer if quantizer is not None else ProductQuantizer()
+        self.size = 0
+        self.removed = set()
+        self._clear()
+
+    def train(self, descriptors: np.ndarray, owners: np.ndarray, size: int, key: str = None) -> None:
+        """
+        Trains the quantizer and encodes the descriptors.
+        :param descriptors: the stacked descriptors of the database
+        :param owners: the position in the database of the painting owning each descriptor
+        :param size: the number of paintings in the database
+        :param key: unused, the codes are not persisted
+        """
+        self.removed = set()
+        self._clear()
+        if len(descriptors) > 0:
+            self.quantizer.train(descriptors)
+        self.add(descriptors, owners, size)
+
+    def add(self, descriptors: np.ndarray, owners: np.ndarray, size: int) -> None:
+        """
+        Encodes the descriptors of new paintings, without training the quantizer again.
+        """
+        self.size = size
+        if len(descriptors) == 0:
+            return
+        if not self.quantizer.is_trained():
+            self.quantizer.train(descriptors)
+
+        rows = len(self.codes)
+        self._codes = append_rows(self._codes, rows, self.quantizer.encode(descriptors))
+        self._owners = append_rows(self._owners, rows, owners)
+        self._set_rows(rows + len(descriptors))
+
+    def remove(self, positions: Collection[int]) -> None:
+        """
+        :param positions: the positions in the database of the removed paintings
+        """
+        self.removed.update(positions)
+
+    @profiler.profiled('pq.vote')
+    def vote(self, des: np.ndarray, ratio: float) -> np.ndarray:
+        """
+        :param des: the query descriptors
+        :param ratio: the nearest neighbour must be closer than ratio times the second one
+        :return: the number of query descriptors matched with each painting of the database
+        """
+        if des is None or len(self.codes) == 0:
+            return np.zeros((self.size,), np.int64)
+
+        tables = self.quantizer.tables(des)
+        distances = np.full((2, len(des)), np.inf, np.float32)
+        owners = np.zeros((2, len(des)), np.int32)
+        removed = list(self.removed)
+        for start in range(0, len(self.codes), CHUNK):
+            chunk = self.quantizer.distances(tables, self.codes[start:start + CHUNK])
+            chunk_owners = self.owners[start:start + CHUNK]
+            if removed:
+                chunk[np.isin(chunk_owners, removed)] = np.inf
+
+            distances, owners = merge_two_nearest(distances, owners, chunk, chunk_owners)
+
+        good = np.isfinite(distances[1]) & (distances[0] < ratio * distances[1])
+        return np.bincount(owners[0, good], minlength=self.size)
+
+    def _clear(self) -> None:
+        self._codes = np.empty((0, self.quantizer.subspaces), np.uint8)
+        self._owners = np.empty((0,), np.int32)
+        self._set_rows(0)
+
+    def _set_rows(self, rows: int) -> None:
+        self.codes = self._codes[:rows]
+        self.owners = self._owners[:rows]
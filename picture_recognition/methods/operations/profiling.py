@@ -0,0 +1,127 @@
+import functools
+import json
+import time
+from contextlib import nullcontext
+from typing import Callable, Dict, List, Tuple, TypeVar
+
+import numpy as np
+
+# Name, start and end in seconds of time.perf_counter, which is the same clock in every process
+Span = Tuple[str, float, float]
+
+F = TypeVar('F', bound=Callable)
+
+PERCENTILES = (50, 95, 99)
+
+_NO_SPAN = nullcontext()
+
+
+class _Timer:
+    __slots__ = ('spans', 'name', 'start')
+
+    def __init__(self, spans: List[Span], name: str):
+        self.spans = spans
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.spans.append((self.name, self.start, time.perf_counter()))
+
+
+class Profiler:
+    """
+    Records named timing spans around the stages of the queries, like:
+
+        with profiler.span('orb.extract'):
+            kp, des = orb.detectAndCompute(im, None)
+
+    Spans can be nested. It is disabled by default, then span returns a shared context that does nothing, so the
+    instrumented code only pays a function call and an attribute check.
+
+    Forked workers inherit whether it is enabled. Each process records its own spans, so they are taken after each
+    query and sent back with its result.
+    """
+    enabled: bool
+    spans: List[Span]
+
+    def __init__(self):
+        self.enabled = False
+        self.spans = []
+
+    def enable(self, enabled: bool = True) -> None:
+        self.enabled = enabled
+        self.spans = []
+
+    def span(self, name: str):
+        """
+        :param name: name of the stage, the same for every run of it
+        :return: a context manager that records the time spent inside it
+        """
+        if not self.enabled:
+            return _NO_SPAN
+        return _Timer(self.spans, name)
+
+    def profiled(self, name: str) -> Callable[[F], F]:
+        """
+        Decorator that records a span around every call of the function.
+        """
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return func(*args, **kwargs)
+                with _Timer(self.spans, name):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def take(self) -> List[Span]:
+        """
+        :return: the spans recorded since the last call, in the order they finished
+        """
+        spans, self.spans = self.spans, []
+        return spans
+
+
+def durations(spans: List[Span]) -> Dict[str, List[float]]:
+    """
+    :return: the duration in seconds of every run of each stage, the stages in the order they first finished
+    """
+    res = {}
+    for name, start, end in spans:
+        res.setdefault(name, []).append(end - start)
+    return res
+
+
+def summarize(spans: List[Span]) -> List[Tuple[str, int, np.ndarray]]:
+    """
+    :return: for each stage, its number of runs and the PERCENTILES of their durations in seconds
+    """
+    return [(name, len(values), np.percentile(values, PERCENTILES)) for name, values in durations(spans).items()]
+
+
+def write_chrome_trace(path: str, traces: List[Tuple[str, int, List[Span]]]) -> None:
+    """
+    Writes the spans in the Chrome trace event format, which can be opened in chrome://tracing or Perfetto. Each
+    process is shown with a row for each method.
+    :param path: the output file
+    :param traces: the name of the method, the process id and the spans of each query
+    """
+    methods = {}
+    events = []
+    for method, pid, spans in traces:
+        tid = methods.setdefault(method, len(methods))
+        events.extend({'name': name, 'cat': method, 'ph': 'X', 'ts': start * 1e6, 'dur': (end - start) * 1e6,
+                       'pid': pid, 'tid': tid} for name, start, end in spans)
+
+    pids = {pid for _, pid, _ in traces}
+    events.extend({'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': tid, 'args': {'name': method}}
+                  for pid in pids for method, tid in methods.items())
+    with open(path, 'w') as f:
+        json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
+
+
+instance = Profiler()
@@ -1,50 +1,94 @@
-from typing import List, Tuple
+from typing import List, Optional, Set, Tuple
 
 import cv2
-from functional import seq
 import numpy as np
 from model import Picture
-from methods.operations.text import detect_text
+from methods.operations.text import detect_picture_text
+from methods.operations.feature_db import remove_features, train_features
+from methods.operations.knn import ExactIndex
+from methods.operations.matching import find_positions, rank, ratio_test, stack
+from methods.operations.product_quantizer import ProductQuantizer, encode_descriptors
 
 from model import Rectangle
 
+RATIO = 0.75
+
 
 class SIFTBruteRatioTest:
-    db: List[Tuple[Picture, List[cv2.KeyPoint], np.array,Rectangle]]
-    bf: cv2.BFMatcher
+    """
+    Ranks the database paintings by the number of their descriptors whose two nearest query descriptors pass the
+    ratio test. The float descriptors are stacked in an ExactIndex and matched with all the paintings at once, the
+    database only keeps the codes when they are quantized.
+
+    Removed paintings keep their position in db until the next train.
+    """
+    db: List[Tuple[Picture, np.ndarray, Optional[np.ndarray], Rectangle]]
+    removed: Set[int]
+    index: ExactIndex
     sift: cv2.xfeatures2d.SIFT_create
+    quantizer: Optional[ProductQuantizer]
 
-    def __init__(self):
+    def __init__(self, quantize: bool = False):
+        """
+        :param quantize: if True, the database descriptors are product quantized, and matched with asymmetric
+        distances instead of the exact index
+        """
         self.db = []
-        self.bf = cv2.BFMatcher_create()
+        self.removed = set()
+        self.quantizer = ProductQuantizer(norm=cv2.NORM_L2) if quantize else None
         self.sift = cv2.xfeatures2d.SIFT_create(500)
+        self.index = ExactIndex(self.sift.descriptorSize())
 
     def query(self, picture: Picture) -> List[Picture]:
-        mask,rec=detect_text(picture.get_image())
+        mask,rec=detect_picture_text(picture)
         kp, des = self.sift.detectAndCompute(picture.get_image(), mask)
 
-        return (
-            seq(self.db)
-                .map(lambda p: (p[0], self.bf.knnMatch(p[2], des, k=2)))
-                .map(lambda p: (p[0], self._ratio_test(p[1])))
-                .map(lambda p: (p[0], len(p[1])))
-                .filter(lambda p: p[1] > 0)
-                .sorted(lambda p: p[1], reverse=True)
-                .map(lambda p: p[0])
-                .take(10)
-                .to_list()
-        )
-
-    @staticmethod
-    def _ratio_test(matches):
-        good = []
-        for m, n in matches:
-            if m.distance < 0.75 * n.distance:
-                good.append(m)
-        return good
+        if self.quantizer is not None:
+            if des is None:
+                return []
+            tables = self.quantizer.tables(des)
+            scores = [np.count_nonzero(ratio_test(self.quantizer.knn_match(tables, p[2])[0], RATIO))
+                      if p[2] is not None else 0 for p in self.db]
+        else:
+            scores = self.index.ratio_votes(des, RATIO)
+        return rank([p[0] for p in self.db], scores, 0, excluded=self.removed)
 
     def train(self, images: List[Picture]) -> None:
-        for image in images:
-            mask,bounding_text =detect_text(image.get_image())
-            kp, des = self.sift.detectAndCompute(image.get_image(), mask)
-            self.db.append((image, kp, des,bounding_text))
+        self.db = []
+        self.removed = set()
+        if self.quantizer is not None:
+            self.quantizer.clear()
+        self.index = ExactIndex(self.sift.descriptorSize())
+        self.add_pictures(images)
+
+    def add_pictures(self, images: List[Picture]) -> None:
+        """
+        Adds the pictures at the end of the database, only obtaining the features of the new ones.
+        """
+        start = len(self.db)
+        features = train_features('sift_500', self, images, self._extract, desc='Training sift',
+                                  keep_descriptors=self.quantizer is None)
+        if self.quantizer is not None:
+            codes = encode_descriptors(self.quantizer, [f[1] for f in features])
+        else:
+            codes = [None] * len(features)
+        for image, (kp, _, bounding_text), des in zip(images, features, codes):
+            self.db.append((image, kp, des, bounding_text))
+
+        if self.quantizer is None:
+            descriptors, owners = stack([f[1] for f in features], self.sift.descriptorSize(), np.float32)
+            self.index.add(descriptors, owners + start, len(self.db))
+
+    def remove_pictures(self, images: List[Picture]) -> None:
+        """
+        Removes the pictures from the database, and their features when no other matcher uses them.
+        """
+        positions = find_positions([p[0] for p in self.db], images)
+        self.removed.update(positions)
+        self.index.remove(positions)
+        remove_features('sift_500', self, images)
+
+    def _extract(self, image: Picture):
+        mask, bounding_text = detect_picture_text(image)
+        kp, des = self.sift.detectAndCompute(image.get_image(), mask)
+        return kp, des, bounding_text
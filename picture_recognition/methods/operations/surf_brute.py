@@ -1,47 +1,76 @@
-from typing import List, Tuple
+from typing import List, Optional, Set, Tuple
 
 import cv2
-from functional import seq
 import numpy as np
 from model import Picture
-from methods.operations.text import detect_text
+from methods.operations.text import detect_picture_text
+from methods.operations.feature_db import remove_features, train_features
+from methods.operations.matching import count_good_matches, find_positions, rank, threshold_filter
+from methods.operations.product_quantizer import ProductQuantizer, encode_descriptors
 from model import Rectangle
 THRESHOLD = 28
 
 
 class SURFBrute:
-    db: List[Tuple[Picture, List[cv2.KeyPoint], np.array,Rectangle]]
+    db: List[Tuple[Picture, np.ndarray, np.array,Rectangle]]
+    removed: Set[int]
     bf: cv2.BFMatcher
     surf: cv2.xfeatures2d.SURF_create
+    quantizer: Optional[ProductQuantizer]
 
-    def __init__(self):
+    def __init__(self, quantize: bool = False):
+        """
+        :param quantize: if True, the database descriptors are product quantized, and matched with asymmetric
+        distances instead of the brute force matcher
+        """
         self.db = []
+        self.removed = set()
+        self.quantizer = ProductQuantizer(norm=cv2.NORM_L1) if quantize else None
         self.bf = cv2.BFMatcher_create(cv2.NORM_L1, crossCheck=True)
         self.surf = cv2.xfeatures2d.SURF_create(2000)
 
     def query(self, picture: Picture) -> List[Picture]:
-        mask,rec = detect_text(picture.get_image())
+        mask,rec = detect_picture_text(picture)
         kp, des = self.surf.detectAndCompute(picture.get_image(), mask)
 
-        return (
-            seq(self.db)
-                .map(lambda p: (p[0], self.bf.match(p[2], des)))
-                .map(lambda p: (p[0],
-                                seq(p[1]).filter(lambda d: d.distance < max(THRESHOLD,
-                                                                            seq(p[1]).map(lambda m: m.distance).min()))
-                                .to_list()
-                                )
-                     )
-                .map(lambda p: (p[0], len(p[1])))
-                .filter(lambda p: p[1] > 4)
-                .sorted(lambda p: p[1], reverse=True)
-                .map(lambda p: p[0])
-                .take(10)
-                .to_list()
-        )
+        if self.quantizer is not None:
+            if des is None:
+                return []
+            tables = self.quantizer.tables(des)
+            scores = [np.count_nonzero(threshold_filter(self.quantizer.match(tables, p[2])[0], THRESHOLD))
+                      if p[2] is not None and pos not in self.removed else 0 for pos, p in enumerate(self.db)]
+        else:
+            scores = [count_good_matches(self.bf.match(p[2], des), THRESHOLD) if pos not in self.removed else 0
+                      for pos, p in enumerate(self.db)]
+        return rank([p[0] for p in self.db], scores, 4, excluded=self.removed)
 
     def train(self, images: List[Picture]) -> None:
-        for image in images:
-            mask,bounding_text = detect_text(image.get_image())
-            kp, des = self.surf.detectAndCompute(image.get_image(), mask)
-            self.db.append((image, kp, des,bounding_text))
+        self.db = []
+        self.removed = set()
+        if self.quantizer is not None:
+            self.quantizer.clear()
+        self.add_pictures(images)
+
+    def add_pictures(self, images: List[Picture]) -> None:
+        """
+        Adds the pictures to the database, only obtaining the features of the new ones.
+        """
+        features = train_features('surf_2000', self, images, self._extract, desc='Training surf',
+                                  keep_descriptors=self.quantizer is None)
+        codes = encode_descriptors(self.quantizer, [f[1] for f in features])
+        for image, (kp, _, bounding_text), des in zip(images, features, codes):
+            self.db.append((image, kp, des, bounding_text))
+
+    def remove_pictures(self, images: List[Picture]) -> None:
+        """
+        Removes the pictures from the database, and their features when no other matcher uses them. They keep their
+        position in the database until the next train, but they are not matched anymore.
+        """
+        positions = find_positions([p[0] for p in self.db], images)
+        self.removed.update(positions)
+        remove_features('surf_2000', self, images)
+
+    def _extract(self, image: Picture):
+        mask, bounding_text = detect_picture_text(image)
+        kp, des = self.surf.detectAndCompute(image.get_image(), mask)
+        return kp, des, bounding_text
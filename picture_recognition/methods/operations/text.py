@@ -1,10 +1,23 @@
 import imutils as imutils
 import cv2
 import numpy as np
-from model import Rectangle
+from methods.operations.feature_store import instance as feature_store
+from methods.operations.profiling import instance as profiler
+from model import Picture, Rectangle
 import matplotlib.pyplot as plt
 
 
+@profiler.profiled('text')
+def detect_picture_text(picture: Picture) -> (np.ndarray, Rectangle):
+    """
+    Same as detect_text, but the text rectangle is shared through the feature store and the mask is built from it.
+    """
+    bounding = feature_store.get(picture, 'text', lambda: detect_text(picture.get_image())[1])
+    mask = np.ones(picture.get_image().shape[:2], dtype=np.uint8) * 255
+    mask = cv2.rectangle(mask, bounding.top_left, bounding.get_bottom_right(), (0, 0, 0), -1)
+    return mask, bounding
+
+
 def detect_text(img: np.ndarray) -> (np.ndarray, Rectangle):
     im = img.copy()
     im_yuv = cv2.cvtColor(im, cv2.COLOR_BGR2YUV)
@@ -18,5 +18,11 @@ class orb_brute_ratio_test(AbstractMethod):
     def train(self, images: List[Picture]):
         self.orb.train(images)
 
+    def add_pictures(self, images: List[Picture]):
+        self.orb.add_pictures(images)
+
+    def remove_pictures(self, images: List[Picture]) -> None:
+        self.orb.remove_pictures(images)
+
 
 instance = orb_brute_ratio_test()
@@ -18,5 +18,11 @@ class sift_brute_ratio_test(AbstractMethod):
     def train(self, images: List[Picture]):
         self.sift.train(images)
 
+    def add_pictures(self, images: List[Picture]):
+        self.sift.add_pictures(images)
+
+    def remove_pictures(self, images: List[Picture]) -> None:
+        self.sift.remove_pictures(images)
+
 
 instance = sift_brute_ratio_test()
@@ -17,5 +17,11 @@ class surf_brute(AbstractMethod):
     def train(self, images: List[Picture]):
         self.surf.train(images)
 
+    def add_pictures(self, images: List[Picture]):
+        self.surf.add_pictures(images)
+
+    def remove_pictures(self, images: List[Picture]) -> None:
+        self.surf.remove_pictures(images)
+
 
 instance = surf_brute()
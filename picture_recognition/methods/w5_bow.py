@@ -0,0 +1,40 @@
+from typing import List
+
+from methods import AbstractMethod
+from methods.operations import get_picture_frame, ORBBrute, BoWIndex
+from model import Picture, Frame
+from model.rectangle import Rectangle
+
+
+class w5_bow(AbstractMethod):
+    """Same as w5, but only the shortlist obtained from a bag of visual words index is matched."""
+
+    orb: ORBBrute
+    bow: BoWIndex
+
+    def __init__(self):
+        self.orb = ORBBrute()
+        self.bow = BoWIndex()
+
+    def query(self, picture: Picture) -> (List[Picture], Frame):
+        frame = get_picture_frame(picture)
+
+        kp, des = self.orb.describe(picture, frame=frame)
+        return self.orb.match(des, candidates=self.bow.query(des)), frame
+
+    def train(self, images: List[Picture]) -> List[Rectangle]:
+        texts = self.orb.train(images)
+        self.bow.train(self.orb.descriptors, self.orb.owners, len(self.orb.db))
+        return texts
+
+    def add_pictures(self, images: List[Picture]) -> List[Rectangle]:
+        rows = len(self.orb.descriptors)
+        texts = self.orb.add_pictures(images)
+        self.bow.add(self.orb.descriptors[rows:], self.orb.owners[rows:], len(self.orb.db))
+        return texts
+
+    def remove_pictures(self, images: List[Picture]) -> None:
+        self.bow.remove(self.orb.remove_pictures(images))
+
+
+instance = w5_bow()
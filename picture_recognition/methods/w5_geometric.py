@@ -0,0 +1,49 @@
+from typing import List
+
+from methods import AbstractMethod
+from methods.operations import get_picture_frame, ORBBrute
+from methods.operations.geometric_verification import TOP_N
+from methods.operations.profiling import instance as profiler
+from model import Picture, Frame
+from model.rectangle import Rectangle
+
+
+class w5_geometric(AbstractMethod):
+    """
+    Same as w5, but the top N paintings by number of matches are re-ranked by the inliers of the homography between
+    the cropped painting and each of them.
+    """
+
+    orb: ORBBrute
+    top_n: int
+
+    def __init__(self, top_n: int = TOP_N):
+        """
+        :param top_n: number of paintings verified with the homography
+        """
+        self.orb = ORBBrute()
+        self.top_n = top_n
+
+    def query(self, picture: Picture) -> (List[Picture], Frame):
+        with profiler.span('geometric.frame'):
+            frame = get_picture_frame(picture)
+
+        with profiler.span('geometric.orb'):
+            kp, des = self.orb.describe(picture, frame=frame)
+            candidates = self.orb.shortlist(des, k=self.top_n)
+
+        with profiler.span('geometric.verification'):
+            res = self.orb.verify(kp, des, candidates)
+        return res, frame
+
+    def train(self, images: List[Picture]) -> List[Rectangle]:
+        return self.orb.train(images)
+
+    def add_pictures(self, images: List[Picture]) -> List[Rectangle]:
+        return self.orb.add_pictures(images)
+
+    def remove_pictures(self, images: List[Picture]) -> None:
+        self.orb.remove_pictures(images)
+
+
+instance = w5_geometric()
@@ -1,7 +1,7 @@
 from typing import List
 
 from methods import AbstractMethod
-from methods.operations import get_frame_with_lines, ORBBrute
+from methods.operations import get_picture_frame, ORBBrute
 from model import Picture, Frame
 from model.rectangle import Rectangle
 
@@ -14,12 +14,18 @@ class w5_no_frame_no_text(AbstractMethod):
         self.orb = ORBBrute()
 
     def query(self, picture: Picture) -> (List[Picture], Frame):
-        frame = get_frame_with_lines(picture.get_image())
+        frame = get_picture_frame(picture)
 
         return self.orb.query(picture), frame
 
     def train(self, images: List[Picture]) -> List[Rectangle]:
         return self.orb.train(images, use_mask=False)
 
+    def add_pictures(self, images: List[Picture]) -> List[Rectangle]:
+        return self.orb.add_pictures(images)
+
+    def remove_pictures(self, images: List[Picture]) -> None:
+        self.orb.remove_pictures(images)
+
 
 instance = w5_no_frame_no_text()
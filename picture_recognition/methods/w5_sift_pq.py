@@ -0,0 +1,32 @@
+from typing import List
+
+from methods import AbstractMethod
+from methods.operations import get_picture_frame, SIFTBrute
+from model import Picture, Frame
+from model.rectangle import Rectangle
+
+
+class w5_sift_pq(AbstractMethod):
+    """Matches SIFT descriptors stored as product quantized codes, which take 16 bytes instead of 512."""
+
+    sift: SIFTBrute
+
+    def __init__(self):
+        self.sift = SIFTBrute(quantize=True)
+
+    def query(self, picture: Picture) -> (List[Picture], Frame):
+        frame = get_picture_frame(picture)
+
+        return self.sift.query(picture), frame
+
+    def train(self, images: List[Picture]) -> List[Rectangle]:
+        return self.sift.train(images)
+
+    def add_pictures(self, images: List[Picture]) -> List[Rectangle]:
+        return self.sift.add_pictures(images)
+
+    def remove_pictures(self, images: List[Picture]) -> None:
+        self.sift.remove_pictures(images)
+
+
+instance = w5_sift_pq()
@@ -0,0 +1,31 @@
+from typing import List
+
+from methods import AbstractMethod
+from methods.operations import get_picture_frame, ORBBrute
+from model import Picture, Frame
+from model.rectangle import Rectangle
+
+
+class w5_stacked(AbstractMethod):
+
+    orb: ORBBrute
+
+    def __init__(self):
+        self.orb = ORBBrute(stacked=True)
+
+    def query(self, picture: Picture) -> (List[Picture], Frame):
+        frame = get_picture_frame(picture)
+
+        return self.orb.query(picture, frame=frame), frame
+
+    def train(self, images: List[Picture]) -> List[Rectangle]:
+        return self.orb.train(images)
+
+    def add_pictures(self, images: List[Picture]) -> List[Rectangle]:
+        return self.orb.add_pictures(images)
+
+    def remove_pictures(self, images: List[Picture]) -> None:
+        self.orb.remove_pictures(images)
+
+
+instance = w5_stacked()
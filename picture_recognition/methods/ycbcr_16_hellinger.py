@@ -21,5 +21,12 @@ class ycbcr_16_hellinger(AbstractMethod):
         self.compare_histograms.train(images)
         return [Rectangle() for _ in images]
 
+    def add_pictures(self, images: List[Picture]) -> List[Rectangle]:
+        self.compare_histograms.add_pictures(images)
+        return [Rectangle() for _ in images]
+
+    def remove_pictures(self, images: List[Picture]) -> None:
+        self.compare_histograms.remove_pictures(images)
+
 
 instance = ycbcr_16_hellinger()
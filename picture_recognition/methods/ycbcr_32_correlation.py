@@ -20,5 +20,11 @@ class ycbcr_32_correlation(AbstractMethod):
     def train(self, images: List[Picture]):
         self.compare_histograms.train(images)
 
+    def add_pictures(self, images: List[Picture]):
+        self.compare_histograms.add_pictures(images)
+
+    def remove_pictures(self, images: List[Picture]) -> None:
+        self.compare_histograms.remove_pictures(images)
+
 
 instance = ycbcr_32_correlation()
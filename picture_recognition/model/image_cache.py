@@ -0,0 +1,99 @@
+# Copied to traffic_signs/week2/model/image_cache.py, the projects don't share a package. Keep both equal.
+import threading
+from collections import OrderedDict
+from typing import Callable
+
+import numpy as np
+
+MAX_BYTES = 1024 * 1024 * 1024
+
+
+class ImageCache:
+    """
+    Cache of decoded images shared by the whole process. The total size of the cached images is bounded, when it is
+    exceeded the least recently used images are evicted.
+
+    The bound is per process: forked workers inherit the images cached before the fork, and each one caches up to
+    max_bytes of its own. Their hits and misses are taken with take_counts and sent back to the parent, which adds
+    them with add_counts.
+    """
+    max_bytes: int
+    hits: int
+    misses: int
+
+    def __init__(self, max_bytes: int = MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._images = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: str, load: Callable[[], np.ndarray]) -> np.ndarray:
+        """
+        :param key: identifies the image, usually its path
+        :param load: function that decodes the image if it is not cached
+        :return: the image
+        """
+        with self._lock:
+            image = self._images.get(key)
+            if image is not None:
+                self._images.move_to_end(key)
+                self.hits += 1
+                return image
+            self.misses += 1
+
+        image = load()
+        if image is None or image.nbytes > self.max_bytes:
+            return image
+
+        with self._lock:
+            if key not in self._images:
+                self._images[key] = image
+                self._bytes += image.nbytes
+                self._evict()
+        return image
+
+    def set_max_bytes(self, max_bytes: int) -> None:
+        with self._lock:
+            self.max_bytes = max_bytes
+            self._evict()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._images.clear()
+            self._bytes = 0
+
+    def take_counts(self) -> (int, int):
+        """
+        :return: the hits and misses since the last call
+        """
+        with self._lock:
+            counts = self.hits, self.misses
+            self.hits = self.misses = 0
+        return counts
+
+    def add_counts(self, hits: int, misses: int) -> None:
+        """
+        Adds the hits and misses taken in another process.
+        """
+        with self._lock:
+            self.hits += hits
+            self.misses += misses
+
+    def stats(self) -> str:
+        """
+        :return: the hits and misses, and the images cached in this process
+        """
+        with self._lock:
+            total = self.hits + self.misses
+            return 'Image cache: {} hits, {} misses ({:.1%} hit rate), {} images using {:.1f} MB'.format(
+                self.hits, self.misses, self.hits / total if total else 0, len(self._images), self._bytes / 2 ** 20)
+
+    def _evict(self) -> None:
+        while self._bytes > self.max_bytes:
+            _, image = self._images.popitem(last=False)
+            self._bytes -= image.nbytes
+
+
+instance = ImageCache()
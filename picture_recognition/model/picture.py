@@ -1,25 +1,47 @@
+import itertools
+import os
+
 import cv2
 import matplotlib.pyplot as plt
 import numpy as np
 
+from model.image_cache import instance as image_cache
+
+_memory_ids = itertools.count()
+
 
 class Picture:
-    image_cached: np.ndarray
     name: str
     parent_dir: str
     id: int
+    image: np.ndarray
 
-    def __init__(self, parent_dir: str, name: str):
+    def __init__(self, parent_dir: str, name: str, image: np.ndarray = None):
+        """
+        :param parent_dir: the directory of the image file
+        :param name: the file name, with the format xxx_<id>.jpg
+        :param image: the decoded image, if given it is used instead of reading the file
+        """
         self.name = name
         self.parent_dir = parent_dir
-        self.image_cached = None
         self.id = int(self.name[4:-4])
+        self.image = image
 
-    def get_image(self) -> np.array:
-        if self.image_cached is None:
-            self.image_cached = cv2.imread(self.parent_dir + '/' + self.name, cv2.IMREAD_COLOR)
+    @staticmethod
+    def from_image(image: np.ndarray) -> 'Picture':
+        """
+        :return: a picture of an image that is not stored in a file, with a name unique in the process
+        """
+        return Picture('<memory:{}>'.format(os.getpid()), 'mem_{:06d}.jpg'.format(next(_memory_ids)), image)
+
+    def get_path(self) -> str:
+        return os.path.join(self.parent_dir, self.name)
 
-        return self.image_cached
+    def get_image(self) -> np.array:
+        if self.image is not None:
+            return self.image
+        path = self.parent_dir + '/' + self.name
+        return image_cache.get(path, lambda: cv2.imread(path, cv2.IMREAD_COLOR))
 
     def show(self):
         plt.figure()
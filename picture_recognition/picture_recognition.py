@@ -2,46 +2,96 @@ import argparse
 import fnmatch
 import os
 import pickle
-import sys
-from typing import List
+from typing import Dict, List
 from itertools import product
 
 import ml_metrics as metrics
 import pandas
 from functional import seq
 
-from methods import AbstractMethod, w5, w5_no_frame, w5_no_frame_no_text, ycbcr_16_hellinger
+from methods import AbstractMethod, method_refs, hsv_4_orb_cascade, w5_geometric
+from methods.operations.feature_db import set_cache_dir
+from methods.operations.feature_store import instance as feature_store
+from methods.operations.get_lines_rotation_and_crop import compile_numba
+from methods.operations.parallel import fork_map, set_workers
+from methods.operations.profiling import PERCENTILES, Span, instance as profiler, summarize, write_chrome_trace
 from model import Data, Picture
+from model.image_cache import instance as image_cache
 from model.rectangle import Rectangle
-from tqdm import tqdm
 
 
-def get_result(method: AbstractMethod, query: Picture):
-    return method.query(query)
+def get_result(method: AbstractMethod, query: Picture, positions: Dict[str, int]):
+    """
+    Runs the query, returning the result pictures as their positions in the dataset so they can be sent back from
+    a worker process without pickling the pictures, the process id, the profiling spans of the query when the
+    profiler is enabled, and the hits and misses of the feature store and of the image cache.
+    """
+    with profiler.span('query'):
+        pictures, frame = method.query(query)
+    return ([positions[p.name] for p in pictures], frame, os.getpid(), profiler.take(), feature_store.take_counts(),
+            image_cache.take_counts())
 
 
-def query(dataset_dir: str, query_dir: str, methods: List[AbstractMethod]):
+def get_results(methods: List[AbstractMethod], query: Picture, positions: Dict[str, int]):
+    """
+    Runs the query with every method in the same process, so they share the features of the query picture through
+    the feature store. They are discarded afterwards, so only the features of the catalog stay in the store.
+    """
+    try:
+        return [get_result(method, query, positions) for method in methods]
+    finally:
+        feature_store.discard(query)
+
+
+def query(dataset_dir: str, query_dir: str, methods: List[AbstractMethod], trace: str = None):
     data = Data(dataset_dir)
     file_names = fnmatch.filter(os.listdir(query_dir), '*.jpg')
 
     print('Training...')
     texts_recs = [method.train(data.pictures) for method in methods]
+    # The spans of the training are not part of any query, and the workers would inherit them
+    profiler.take()
+    compile_numba()
+    # The workers count from 0, their counts are added to these after the queries
+    train_counts = feature_store.take_counts()
+    train_image_counts = image_cache.take_counts()
 
     print('Querying...')
 
     query_pictures = seq(file_names).map(lambda query_name: Picture(query_dir, query_name)).to_list()
+    positions = {p.name: pos for pos, p in enumerate(data.pictures)}
+
+    qres = fork_map(lambda picture: get_results(methods, picture, positions), query_pictures, desc='Querying')
+    feature_store.add_counts(*train_counts)
+    image_cache.add_counts(*train_image_counts)
+    for res in qres:
+        for method_res in res:
+            feature_store.add_counts(*method_res[4])
+            image_cache.add_counts(*method_res[5])
 
     results = []
-    for method in methods:
-        print('\tRunning method', method.__class__.__name__)
-        mres = []
-        for picture in tqdm(query_pictures, file=sys.stdout):
-            mres.append((picture,) + get_result(method, picture))
-        results.append(mres)
+    for m, method in enumerate(methods):
+        print('\tMethod', method.__class__.__name__)
+        mres = [res[m] for res in qres]
+        results.append([(picture, [data.pictures[pos] for pos in res[0]], res[1])
+                        for picture, res in zip(query_pictures, mres)])
+        if profiler.enabled:
+            print_profile([span for res in mres for span in res[3]])
+
+    if trace is not None:
+        write_chrome_trace(trace, [(method.__class__.__name__, res[m][2], res[m][3])
+                                   for res in qres for m, method in enumerate(methods)])
+        print('Trace written to', trace)
 
     return results, texts_recs
 
 
+def print_profile(spans: List[Span]):
+    print('\t\tProfile (ms): p{} / p{} / p{}'.format(*PERCENTILES))
+    for stage, runs, values in summarize(spans):
+        print('\t\t\t{}: {} ({} runs)'.format(stage, ' / '.join('{:.1f}'.format(v * 1000) for v in values), runs))
+
+
 def main():
     # read arguments
     parser = argparse.ArgumentParser(description='Search the picture passed in a picture database.')
@@ -49,21 +99,36 @@ def main():
     parser.add_argument('query', help='Query images folder')
     parser.add_argument('methods', help='Method list separated by ;')
     parser.add_argument('--out', help='Output directory to run as test execution. Don\'t evaluate results')
+    parser.add_argument('--cache', help='Directory where the trained features are stored to reuse them between runs')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='Number of processes used to extract the training features and to run the queries')
+    parser.add_argument('--image-cache', type=int, default=1024,
+                        help='Maximum size of the decoded images cache in MB, of each process with --workers')
+    parser.add_argument('--shortlist', type=int, default=hsv_4_orb_cascade.shortlist,
+                        help='Number of paintings selected by the histograms and matched with ORB in the cascade')
+    parser.add_argument('--top-n', type=int, default=w5_geometric.top_n,
+                        help='Number of paintings verified with a homography in w5_geometric')
+    parser.add_argument('--profile', action='store_true',
+                        help='Print the percentiles of the time spent in each stage of the queries')
+    parser.add_argument('--trace', help='Chrome trace file where the stages of every query are written. Implies '
+                                        '--profile')
 
     args = parser.parse_args()
+    set_cache_dir(args.cache)
+    set_workers(args.workers)
+    image_cache.set_max_bytes(args.image_cache * 1024 * 1024)
+    hsv_4_orb_cascade.shortlist = args.shortlist
+    w5_geometric.top_n = args.top_n
+    profiler.enable(args.profile or args.trace is not None)
 
-    method_refs = {
-        'w5': w5,
-        'w5_no_frame': w5_no_frame,
-        'w5_no_frame_no_text': w5_no_frame_no_text,
-        'ycbcr_16_hellinger': ycbcr_16_hellinger
-    }
     method_names = args.methods.split(';')
     methods = seq(method_names).map(lambda x: method_refs.get(x, None)).to_list()
     if not all(methods):
         raise Exception('Invalid method')
 
-    results, text_recs = query(args.dataset, args.query, methods)
+    results, text_recs = query(args.dataset, args.query, methods, args.trace)
+    print(image_cache.stats())
+    print(feature_store.stats())
 
     if args.out is not None:
         save_results(method_names, results, text_recs, args.out)
@@ -0,0 +1,67 @@
+import argparse
+import fnmatch
+import json
+import os
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+
+def send_query(url: str, data: bytes) -> (dict, float):
+    """
+    :return: the response and the time it took in seconds
+    """
+    start = time.perf_counter()
+    request = urllib.request.Request(url + '/query', data=data, headers={'Content-Type': 'image/jpeg'})
+    try:
+        with urllib.request.urlopen(request) as response:
+            body = json.loads(response.read().decode('utf-8'))
+    except urllib.error.HTTPError as e:
+        body = json.loads(e.read().decode('utf-8'))
+    return body, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Send the query images to a picture query server and report the '
+                                                 'latency percentiles.')
+    parser.add_argument('query', help='Query images folder')
+    parser.add_argument('--url', default='http://127.0.0.1:8000', help='Server address')
+    parser.add_argument('--concurrency', type=int, default=4, help='Number of requests sent at the same time')
+    parser.add_argument('--repeat', type=int, default=1, help='Number of times each image is sent')
+    parser.add_argument('--show', action='store_true', help='Print the result of each query')
+
+    args = parser.parse_args()
+
+    names = sorted(fnmatch.filter(os.listdir(args.query), '*.jpg')) * args.repeat
+    images = {}
+    for name in names:
+        if name not in images:
+            with open(os.path.join(args.query, name), 'rb') as f:
+                images[name] = f.read()
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(args.concurrency) as executor:
+        results = list(executor.map(lambda name: send_query(args.url, images[name]), names))
+    total = time.perf_counter() - start
+
+    errors = 0
+    for name, (body, _) in zip(names, results):
+        if 'error' in body:
+            errors += 1
+            print(name, 'error:', body['error'])
+        elif args.show:
+            print(name, body)
+
+    latencies = np.array([latency for _, latency in results]) * 1000
+    print('{} queries ({} errors) in {:.2f} s, {:.1f} queries/s'.format(len(names), errors, total,
+                                                                        len(names) / total))
+    if len(latencies) > 0:
+        print('Latency: p50 {:.1f} ms, p95 {:.1f} ms, p99 {:.1f} ms, max {:.1f} ms'.format(
+            *np.percentile(latencies, [50, 95, 99]), latencies.max()))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,140 @@
+import argparse
+import json
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import cv2
+import numpy as np
+
+from methods import AbstractMethod, method_refs
+from methods.operations.feature_db import set_cache_dir
+from methods.operations.feature_store import instance as feature_store
+from methods.operations.get_lines_rotation_and_crop import compile_numba
+from methods.operations.parallel import create_pool, set_workers
+from methods.operations.text import detect_picture_text
+from model import Data, Picture
+from model.image_cache import instance as image_cache
+
+# Trained method, inherited by the workers when forked
+_method = None
+
+
+class InvalidImage(Exception):
+    pass
+
+
+def query_image(data: bytes) -> dict:
+    """
+    Runs the query of an encoded image with the trained method. Runs in the worker processes.
+    :return: the ids of the result pictures, the frame of the painting and the text box of the image
+    """
+    image = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+    if image is None:
+        raise InvalidImage('The request body is not an image')
+
+    picture = Picture.from_image(image)
+    try:
+        pictures, frame = _method.query(picture)
+        _, text = detect_picture_text(picture)
+    finally:
+        feature_store.discard(picture)
+
+    return {
+        'pictures': [p.id for p in pictures],
+        'frame': {
+            'angle': float(frame.angle),
+            'points': [[int(x), int(y)] for x, y in frame.points]
+        },
+        'text': [int(text.top_left[0]), int(text.top_left[1]), int(text.width), int(text.height)]
+    }
+
+
+class QueryHandler(BaseHTTPRequestHandler):
+    """
+    POST /query with an encoded image as body returns the query result as JSON. GET /health returns the name of the
+    method and the size of the catalog.
+    """
+
+    def do_GET(self):
+        if self.path != '/health':
+            self._send(404, {'error': 'Not found'})
+            return
+        self._send(200, {'method': self.server.method_name, 'pictures': self.server.catalog_size})
+
+    def do_POST(self):
+        if self.path != '/query':
+            self._send(404, {'error': 'Not found'})
+            return
+
+        data = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        try:
+            self._send(200, self.server.pool.apply(query_image, (data,)))
+        except InvalidImage as e:
+            self._send(400, {'error': str(e)})
+        except Exception as e:
+            self._send(500, {'error': repr(e)})
+
+    def _send(self, status: int, body: dict):
+        raw = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(raw)))
+        self.end_headers()
+        self.wfile.write(raw)
+
+    def log_message(self, format, *args):
+        # One line per request would flood the output
+        pass
+
+
+def serve(method: AbstractMethod, method_name: str, dataset_dir: str, host: str, port: int, workers: int):
+    global _method
+    data = Data(dataset_dir)
+
+    print('Training...')
+    method.train(data.pictures)
+    _method = method
+
+    compile_numba()
+
+    # The workers are forked after training, so they share the trained catalog
+    with create_pool(workers) as pool:
+        server = ThreadingHTTPServer((host, port), QueryHandler)
+        server.pool = pool
+        server.method_name = method_name
+        server.catalog_size = len(data.pictures)
+
+        print('Serving {} on http://{}:{} with {} workers'.format(method_name, host, server.server_port, workers))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve picture queries over HTTP with a trained method.')
+    parser.add_argument('dataset', help='Source images folder')
+    parser.add_argument('method', help='Method name')
+    parser.add_argument('--host', default='127.0.0.1', help='Address to listen on')
+    parser.add_argument('--port', type=int, default=8000, help='Port to listen on')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='Number of processes used to extract the training features and to run the queries')
+    parser.add_argument('--cache', help='Directory where the trained features are stored to reuse them between runs')
+    parser.add_argument('--image-cache', type=int, default=1024,
+                        help='Maximum size of the decoded images cache in MB, of each process with --workers')
+
+    args = parser.parse_args()
+    set_cache_dir(args.cache)
+    set_workers(args.workers)
+    image_cache.set_max_bytes(args.image_cache * 1024 * 1024)
+
+    method = method_refs.get(args.method, None)
+    if method is None:
+        raise Exception('Invalid method')
+
+    serve(method, args.method, args.dataset, args.host, args.port, args.workers)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+import argparse
+import fnmatch
+import os
+import time
+
+import cv2
+import numpy as np
+from tabulate import tabulate
+
+from methods import hsv_convolution, hsv_integral, hsv_sw
+from methods.operations import morpho, segregation
+from methods.window import combine_overlapped_regions, sliding_window
+from methods.window.sliding_window import window_iter, window_sides
+from model import Rectangle
+
+METHODS = {
+    'hsv_sw': hsv_sw,
+    'hsv_integral': hsv_integral,
+    'hsv_convolution': hsv_convolution
+}
+
+
+def reference_sliding_window(mask: np.array):
+    """
+    The sliding window detection counting the pixels of every window, as it was before the summed area table.
+    """
+    regions = [Rectangle(top_left=(x, y), width=int(side), height=int(side))
+               for side in window_sides() for x, y in window_iter(mask, int(side))]
+    return combine_overlapped_regions(regions)
+
+
+def key(regions):
+    return sorted((tuple(r.top_left), r.width, r.height) for r in regions)
+
+
+def benchmark(images_dir: str, limit: int, check: bool):
+    names = sorted(fnmatch.filter(os.listdir(images_dir), '*.jpg'))[:limit]
+    images = [im for im in (cv2.imread(os.path.join(images_dir, name)) for name in names) if im is not None]
+    if not images:
+        raise SystemExit('No readable images in {}'.format(images_dir))
+    print('{} images'.format(len(images)))
+
+    times = {name: [] for name in METHODS}
+    for name, method in METHODS.items():
+        # Compile the numba functions before timing
+        method.get_mask(images[0])
+        for im in images:
+            start = time.perf_counter()
+            method.get_mask(im)
+            times[name].append(time.perf_counter() - start)
+
+    if check:
+        times['sliding window stage'] = []
+        times['reference sliding window stage'] = []
+        different = 0
+        for im in images:
+            mask, _ = segregation(im, 'hsv')
+            mask = morpho(mask)
+
+            start = time.perf_counter()
+            _, regions = sliding_window(mask)
+            times['sliding window stage'].append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            reference = reference_sliding_window(mask)
+            times['reference sliding window stage'].append(time.perf_counter() - start)
+
+            different += key(regions) != key(reference)
+        print('Images with different sliding window regions than the pixel counting: {}'.format(different))
+
+    table = [[name, np.mean(values) * 1000, np.median(values) * 1000, np.max(values) * 1000]
+             for name, values in times.items()]
+    print(tabulate(table, headers=['Method', 'Mean (ms)', 'Median (ms)', 'Max (ms)'], floatfmt='.1f'))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare the time per image of the window detection methods.')
+    parser.add_argument('images', help='Images folder')
+    parser.add_argument('--limit', type=int, default=50, help='Maximum number of images')
+    parser.add_argument('--check', action='store_true',
+                        help='Also compare the sliding window regions with the ones of the pixel counting')
+
+    args = parser.parse_args()
+    benchmark(args.images, args.limit, args.check)
+
+
+if __name__ == '__main__':
+    main()
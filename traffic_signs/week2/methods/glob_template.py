@@ -2,7 +2,7 @@ from typing import List
 
 import numpy as np
 
-from methods.operations import template_matching, segregation
+from methods.operations import Template, segregation
 from model import Data
 
 
@@ -15,6 +15,9 @@ class glob_template:
 
     """
 
+    def __init__(self):
+        self.template_matching = Template()
+
     def train(self, data: List[Data]):
         """
         train(data)
@@ -25,11 +28,11 @@ class glob_template:
        ----------------------
         'data'          All the Data elements
         """
-        template_matching.train_masks(data)
+        self.template_matching.train_masks(data)
 
     def get_mask(self, im: np.array):
         mask, im = segregation(im, 'hsv')
-        regions = template_matching.template_matching_global(mask)
+        regions = self.template_matching.template_matching_global(mask)
         mask = np.zeros(im.shape[0:2])
 
         return regions, mask, im
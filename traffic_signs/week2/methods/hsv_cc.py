@@ -2,7 +2,7 @@ import cv2
 from typing import List
 
 import numpy as np
-from methods.operations import fill_holes, discard_geometry, segregation, morpho, get_cc_regions
+from methods.operations import fill_holes, DiscardGeometry, segregation, morpho, get_cc_regions
 from model import Data
 import matplotlib.pyplot as plt
 
@@ -16,6 +16,9 @@ class HSV_CC:
 
     """
 
+    def __init__(self):
+        self.discard_geometry = DiscardGeometry()
+
     def train(self, data: List[Data]):
         """
         train(data)
@@ -26,7 +29,7 @@ class HSV_CC:
        ----------------------
         'data'          All the Data elements
         """
-        discard_geometry.train(data)
+        self.discard_geometry.train(data)
 
     def get_mask(self, im: np.array):
         """
@@ -50,7 +53,7 @@ class HSV_CC:
         regions = get_cc_regions(mask)
 
         # Compute the final mask
-        mask, regions = discard_geometry.get_mask(mask, regions)
+        mask, regions = self.discard_geometry.get_mask(mask, regions)
 
         return regions, mask, im
 
@@ -2,13 +2,17 @@ from typing import List
 
 import numpy as np
 
-from methods.operations import discard_geometry, get_cc_regions
+from methods.operations import DiscardGeometry, get_cc_regions
 from model import Data
-from .operations import segregation, morpho, template_matching
+from .operations import segregation, morpho, Template
 
 
 class hsv_cc_template:
 
+    def __init__(self):
+        self.discard_geometry = DiscardGeometry()
+        self.template_matching = Template()
+
     def get_mask(self, im: np.array):
         # Color segmentation in HSV
         mask, im = segregation(im, 'hsv')
@@ -18,15 +22,15 @@ class hsv_cc_template:
         regions = get_cc_regions(mask)
 
         # Compute the final mask
-        mask, regions = discard_geometry.get_mask(mask, regions)
+        mask, regions = self.discard_geometry.get_mask(mask, regions)
 
-        mask, regions = template_matching.template_matching_reg(mask, regions)
+        mask, regions = self.template_matching.template_matching_reg(mask, regions)
 
         return regions, mask, im
 
     def train(self, data: List[Data]):
-        template_matching.train_masks(data)
-        discard_geometry.train(data)
+        self.template_matching.train_masks(data)
+        self.discard_geometry.train(data)
         pass
 
 
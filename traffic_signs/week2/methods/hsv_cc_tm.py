@@ -1,7 +1,7 @@
 from typing import List
 
 import numpy as np
-from methods.operations import fill_holes, discard_geometry, segregation, morpho, get_cc_regions
+from methods.operations import fill_holes, DiscardGeometry, segregation, morpho, get_cc_regions
 from model import Data
 import matplotlib.pyplot as plt
 
@@ -15,6 +15,9 @@ class HSV_CC_TM:
 
     """
 
+    def __init__(self):
+        self.discard_geometry = DiscardGeometry()
+
     def train(self, data: List[Data]):
         """
         train(data)
@@ -25,7 +28,7 @@ class HSV_CC_TM:
        ----------------------
         'data'          All the Data elements
         """
-        discard_geometry.train(data)
+        self.discard_geometry.train(data)
 
     def get_mask(self, im: np.array):
         """
@@ -53,7 +56,7 @@ class HSV_CC_TM:
         regions = get_cc_regions(mask)
 
         # Compute the final mask
-        mask, regions = discard_geometry.get_mask(mask, regions)
+        mask, regions = self.discard_geometry.get_mask(mask, regions)
 
         return regions, mask, im
 
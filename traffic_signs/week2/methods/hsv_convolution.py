@@ -2,15 +2,18 @@ from typing import List
 
 import numpy as np
 
-from methods.operations import segregation, fill_holes, morpho, discard_geometry
+from methods.operations import segregation, fill_holes, morpho, DiscardGeometry
 from methods.window import convolution
 from model import Data
 
 
 class hsv_convolution:
 
+    def __init__(self):
+        self.discard_geometry = DiscardGeometry()
+
     def train(self, data: List[Data]):
-        pass
+        self.discard_geometry.train(data)
 
     def get_mask(self, im: np.array):
         # Color segmentation in HSV
@@ -20,7 +23,7 @@ class hsv_convolution:
         mask = fill_holes(mask)
 
         mask, regions = convolution(mask)
-        mask, regions = discard_geometry.get_mask(mask, regions)
+        mask, regions = self.discard_geometry.get_mask(mask, regions)
 
         return regions, mask, im
 
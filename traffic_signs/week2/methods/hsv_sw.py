@@ -1,7 +1,7 @@
 from typing import List
 
 import numpy as np
-from methods.operations import fill_holes, discard_geometry, segregation, morpho
+from methods.operations import fill_holes, DiscardGeometry, segregation, morpho
 from methods.window import sliding_window
 from model import Data
 import matplotlib.pyplot as plt
@@ -16,6 +16,9 @@ class HSV_SW:
 
     """
 
+    def __init__(self):
+        self.discard_geometry = DiscardGeometry()
+
     def train(self, data: List[Data]):
         """
         train(data)
@@ -26,7 +29,7 @@ class HSV_SW:
        ----------------------
         'data'          All the Data elements
         """
-        discard_geometry.train(data)
+        self.discard_geometry.train(data)
 
     def get_mask(self, im: np.array):
         mask, im = segregation(im, 'hsv')
@@ -1,7 +1,7 @@
 from typing import List
 
 import numpy as np
-from methods.operations import fill_holes, discard_geometry, segregation, morpho
+from methods.operations import fill_holes, DiscardGeometry, segregation, morpho
 from methods.window import sliding_window
 from model import Data
 import matplotlib.pyplot as plt
@@ -16,8 +16,11 @@ class HSV_SW_TM:
 
     """
 
+    def __init__(self):
+        self.discard_geometry = DiscardGeometry()
+
     def train(self, data: List[Data]):
-        discard_geometry.train(data)
+        self.discard_geometry.train(data)
 
     def get_mask(self, im: np.array):
         mask, im = segregation(im, 'hsv')
@@ -26,7 +29,7 @@ class HSV_SW_TM:
 
         mask, regions = sliding_window(mask)
 
-        mask, regions = discard_geometry.get_mask(mask, regions)
+        mask, regions = self.discard_geometry.get_mask(mask, regions)
 
         return regions, mask, im
 
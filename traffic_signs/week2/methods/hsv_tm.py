@@ -1,7 +1,7 @@
 from typing import List
 
 import numpy as np
-from methods.operations import fill_holes, discard_geometry, segregation, morpho
+from methods.operations import fill_holes, DiscardGeometry, segregation, morpho
 from model import Data
 import matplotlib.pyplot as plt
 
@@ -15,6 +15,9 @@ class HSV_TM:
 
     """
 
+    def __init__(self):
+        self.discard_geometry = DiscardGeometry()
+
     def train(self, data: List[Data]):
         """
         train(data)
@@ -25,7 +28,7 @@ class HSV_TM:
        ----------------------
         'data'          All the Data elements
         """
-        discard_geometry.train(data)
+        self.discard_geometry.train(data)
 
     def get_mask(self, im: np.array):
         """
@@ -51,7 +54,7 @@ class HSV_TM:
         mask = fill_holes(mask)
 
         # Compute the final mask
-        mask, region = discard_geometry.get_mask(mask)
+        mask, region = self.discard_geometry.get_mask(mask)
 
         return region, mask, im
 
@@ -1,7 +1,7 @@
-from .discard_geometry import instance as discard_geometry
+from .discard_geometry import DiscardGeometry, instance as discard_geometry
 from .fill_holes import get_mask as fill_holes
 from .segregation import get_mask as segregation
 from .histogram_equalization import get_image as histogram_equalization
 from .morphology_operations import morphology_operations as morpho
-from .template import instance as template_matching
+from .template import Template, instance as template_matching
 from .get_cc_regions import get_cc_regions
@@ -135,6 +135,8 @@ class Template:
         maxes = self.get_max_areas(data)
         types = ['A', 'B', 'C', 'D', 'E', 'F']
 
+        # Replace the masks of a previous training
+        self.masks = []
         for pos, i in enumerate(types):
             average_width = 0
             average_height = 0
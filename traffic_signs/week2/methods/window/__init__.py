@@ -1,4 +1,5 @@
 from .combine_overlapped_regions import combine_overlapped_regions as combine_overlapped_regions
+from .combine_overlapped_regions import combine_boxes as combine_boxes
 from .clear_non_region_mask import clear_non_region_mask as clear_non_region_mask
 from .convolution import get_mask as convolution
 from .integral import get_mask as integral
@@ -1,42 +1,90 @@
-import sys
 from typing import List
 
+import cv2
+import numpy as np
+
 from model import Rectangle
 
 
 def combine_overlapped_regions(regions: List[Rectangle]) -> List[Rectangle]:
     """
     Combines the possible overlapped regions into a set of non overlapped regions by using union.
+
+    The regions are grouped by connected components of intersecting rectangles, and each group is replaced by the
+    union of its members. The union of a group can intersect other groups, so the grouping is repeated with the
+    unions until none intersect, usually once or twice.
     :param regions: the list of regions probably overlapped
     :return: a list of regions that are not overlapped
     """
-    if len(regions) > 10000:
-        print('Too many regions detected, returning []', file=sys.stderr)
-        return []
-    ret = list(regions)
+    if len(regions) <= 1:
+        return list(regions)
 
-    while combine(ret):
-        pass
+    boxes = np.array([tuple(r.top_left) + r.get_bottom_right() for r in regions])
+    merged, groups = combine_boxes(boxes)
+    _, first, sizes = np.unique(groups, return_index=True, return_counts=True)
 
+    ret = []
+    for group, (top, left, bottom, right) in enumerate(merged.tolist()):
+        region = regions[first[group]]
+        if sizes[group] > 1:
+            region = region.union(Rectangle(top_left=(top, left), width=right - left, height=bottom - top))
+        ret.append(region)
     return ret
 
 
-def combine(ret: List[Rectangle]) -> bool:
-    i = 0
-    combined = False
-    while i < len(ret):
-        j = i + 1
-        region = ret[i]
-        while j < len(ret):
-            if region.intersects(ret[j]):
-                region = region.union(ret[j])
-                ret[i] = region
-                ret.remove(ret[j])
-                j -= 1
-                combined = True
-
-            j += 1
-        if combined:
-            return True
-        i += 1
-    return False
+def combine_boxes(boxes: np.ndarray) -> (np.ndarray, np.ndarray):
+    """
+    Combines the possible overlapped boxes into non overlapped boxes, like combine_overlapped_regions.
+    :param boxes: rows (top, left, bottom, right)
+    :return: the combined boxes, in order of their first box, and the combined box of each box
+    """
+    groups = np.arange(len(boxes))
+    if len(boxes) <= 1:
+        return boxes, groups
+
+    while True:
+        labels = _intersecting_components(boxes)
+        count = labels.max() + 1
+        if count == len(boxes):
+            return boxes, groups
+
+        merged = np.empty((count, 4), boxes.dtype)
+        merged[labels] = boxes
+        np.minimum.at(merged[:, :2], labels, boxes[:, :2])
+        np.maximum.at(merged[:, 2:], labels, boxes[:, 2:])
+        boxes = merged
+        groups = labels[groups]
+
+
+def _intersecting_components(boxes: np.ndarray) -> np.ndarray:
+    """
+    Labels the connected components of the intersecting boxes. Two boxes intersect when they share a point, their
+    edges included.
+
+    The boxes are painted in a grid with a row and a column for each distinct coordinate, and another between each
+    pair of consecutive ones, so boxes that only share an edge share a cell and disjoint boxes are separated by an
+    empty cell. Then each box takes the label of the 4-connected component of its cells. It takes linear time in the
+    number of boxes plus the cells of the grid, instead of testing every pair of boxes.
+    :param boxes: rows (top, left, bottom, right)
+    :return: the component of each box, numbered from 0 in order of appearance
+    """
+    rows, row_idx = np.unique(boxes[:, [0, 2]], return_inverse=True)
+    cols, col_idx = np.unique(boxes[:, [1, 3]], return_inverse=True)
+    row_idx = 2 * row_idx.reshape((-1, 2))
+    col_idx = 2 * col_idx.reshape((-1, 2))
+
+    # Paint the boxes with a 2D difference array
+    painted = np.zeros((2 * len(rows), 2 * len(cols)), np.int32)
+    np.add.at(painted, (row_idx[:, 0], col_idx[:, 0]), 1)
+    np.add.at(painted, (row_idx[:, 0], col_idx[:, 1] + 1), -1)
+    np.add.at(painted, (row_idx[:, 1] + 1, col_idx[:, 0]), -1)
+    np.add.at(painted, (row_idx[:, 1] + 1, col_idx[:, 1] + 1), 1)
+    painted = np.cumsum(np.cumsum(painted, axis=0), axis=1) > 0
+
+    _, cells = cv2.connectedComponents(painted.astype(np.uint8), connectivity=4)
+    labels = cells[row_idx[:, 0], col_idx[:, 0]]
+    _, first, labels = np.unique(labels, return_index=True, return_inverse=True)
+    # Renumber the components in order of appearance
+    rank = np.empty_like(first)
+    rank[np.argsort(first, kind='stable')] = np.arange(len(first))
+    return rank[labels.ravel()]
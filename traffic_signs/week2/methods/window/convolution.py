@@ -1,49 +1,38 @@
-from typing import List, Tuple
+from typing import List
 
-import cv2
 import numpy as np
-from numba import njit
 
-from methods.window import combine_overlapped_regions, clear_non_region_mask
+from methods.window import clear_non_region_mask
 from model import Rectangle
-from .sliding_window import THRESHOLD, SIDE, INTERMEDIATE_STEPS, SHRINK_MULTIPLIER, STEP_FACTOR
+from .sliding_window import THRESHOLD, window_sides, window_steps
+from .summed_area import combine_windows, detect_windows, grid_size, summed_area_table
 
 
 def get_mask(mask: np.array) -> (np.array, List[Rectangle]):
-    regions = []
-    side = SIDE
-    for _ in range(INTERMEDIATE_STEPS):
-        kernel = np.empty((side, side))
-        kernel.fill(1 / 255)
-
-        conv_res = cv2.filter2D(mask, cv2.CV_32F, kernel, anchor=(0, 0),
-                                borderType=cv2.BORDER_CONSTANT)
-
-        positions = conv_iter(conv_res, side)
-        for pos in positions:
-            rec = Rectangle(
-                top_left=(pos[0], pos[1]),
-                width=side,
-                height=side
-            )
-            regions.append(rec)
-
-        side = int(side / SHRINK_MULTIPLIER)
-        if side % 2 == 0:
-            side += 1
-
-    regions = combine_overlapped_regions(regions)
+    """
+    Detects the windows of every scale with a proportion of positive pixels above THRESHOLD, and combines them. The
+    windows are the ones of a convolution with a box kernel anchored at its top left, sampled starting half a side
+    away from the top and left, but only the sampled sums are computed, from the summed area table of the mask.
+    :param mask: the binary mask, 0 or 255
+    :return: the mask cleared outside the regions and the regions
+    """
+    table = summed_area_table(mask)
+    positions = conv_iter(table)
+    regions = combine_windows(positions)
     mask = clear_non_region_mask(mask, regions)
 
     return mask, regions
 
 
-@njit()
-def conv_iter(conv_res: np.array, side: int) -> List[Tuple[int, int]]:
-    move_step = int(side * STEP_FACTOR)
-    ret = []
-    for i in range(int(side / 2), conv_res.shape[0] - int(side / 2), move_step):
-        for j in range(int(side / 2), conv_res.shape[1] - int(side / 2), move_step):
-            if conv_res[i, j] / side ** 2 > THRESHOLD:
-                ret.append((i, j))
-    return ret
+def conv_iter(table: np.array) -> np.ndarray:
+    """
+    :param table: the summed area table of the mask
+    :return: an array with a row (top, left, side) for each window found, ordered by scale, top and left
+    """
+    sides = window_sides()
+    steps = window_steps(sides)
+    first = sides // 2
+    # The windows can end outside the mask, where the convolution added zeros
+    rows = grid_size(first, table.shape[0] - 1 - sides // 2, steps)
+    cols = grid_size(first, table.shape[1] - 1 - sides // 2, steps)
+    return detect_windows(table, sides, steps, first, rows, cols, 0, THRESHOLD * 255)
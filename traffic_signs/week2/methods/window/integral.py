@@ -1,47 +1,37 @@
-import cv2
-from typing import List, Tuple
-
-from functional import seq
-from numba import njit
+from typing import List
 
 from model import Rectangle
-from .sliding_window import THRESHOLD, SIDE, INTERMEDIATE_STEPS, SHRINK_MULTIPLIER, STEP_FACTOR
+from .sliding_window import THRESHOLD, window_sides, window_steps
+from .summed_area import combine_windows, detect_windows, grid_size, summed_area_table
 import numpy as np
-from methods.window import combine_overlapped_regions, clear_non_region_mask
-
-
-def get_mask(mask: np.array) -> (np.array, List[Rectangle]):
-    integral = cv2.integral(mask / 255)
-
-    positions = int_iter(integral)
-    regions = []
-    for pos in positions:
-        regions.append(
-            Rectangle(
-                top_left=(pos[0], pos[1]),
-                width=pos[2],
-                height=pos[2]
-            )
-        )
-
-    regions = combine_overlapped_regions(regions)
+from methods.window import clear_non_region_mask
+
+
+def get_mask(mask: np.array, nms_overlap: float = 0) -> (np.array, List[Rectangle]):
+    """
+    Detects the windows of every scale with a proportion of positive pixels above THRESHOLD, and combines them.
+    :param mask: the binary mask, 0 or 255
+    :param nms_overlap: if positive, the windows with an intersection over union above it with a denser window are
+    discarded before combining them
+    :return: the mask cleared outside the regions and the regions
+    """
+    integral = summed_area_table(mask)
+    positions = int_iter(integral, nms_overlap)
+    regions = combine_windows(positions)
     mask = clear_non_region_mask(mask, regions)
     return mask, regions
 
 
-@njit()
-def int_iter(integral: np.array) -> List[Tuple[int, int, int]]:
-    ret = []
-    side = SIDE
-    for _ in range(INTERMEDIATE_STEPS):
-        for i in range(0, integral.shape[0] - side, int(side * STEP_FACTOR)):
-            for j in range(0, integral.shape[1] - side, int(side * STEP_FACTOR)):
-                s = integral[i + side, j + side] - integral[i + side, j] - integral[i, j + side] + integral[i, j]
-                if s / side ** 2 > THRESHOLD:
-                    ret.append((i, j, side))
-
-        side = int(side / SHRINK_MULTIPLIER)
-        if side % 2 == 0:
-            side += 1
-
-    return ret
+def int_iter(integral: np.array, nms_overlap: float = 0.) -> np.ndarray:
+    """
+    :param integral: the integral image of the mask
+    :param nms_overlap: the intersection over union for the non maximum suppression, 0 to keep every window
+    :return: an array with a row (top, left, side) for each window found, ordered by scale, top and left
+    """
+    sides = window_sides()
+    steps = window_steps(sides)
+    first = np.zeros_like(sides)
+    # The windows end at most at the last row and column of the mask
+    rows = grid_size(first, integral.shape[0] - sides, steps)
+    cols = grid_size(first, integral.shape[1] - sides, steps)
+    return detect_windows(integral, sides, steps, first, rows, cols, 0, THRESHOLD * 255, nms_overlap)
@@ -4,7 +4,8 @@ import numpy as np
 from numba import njit
 
 from model import Rectangle
-from . import combine_overlapped_regions, clear_non_region_mask
+from . import clear_non_region_mask
+from .summed_area import combine_windows, detect_windows, grid_size, summed_area_table
 
 SIDE = 51
 INTERMEDIATE_STEPS = 15
@@ -14,31 +15,55 @@ THRESHOLD = 0.6
 
 
 def sliding_window(mask: np.array) -> (np.array, List[Rectangle]):
-    regions = []
+    """
+    Detects the windows of every scale with a proportion of positive pixels above THRESHOLD, and combines them. The
+    pixels of all the windows are counted with a single summed area table of the positive pixels, with the same
+    windows and results as window_iter.
+    :param mask: the binary mask
+    :return: the mask cleared outside the regions and the regions
+    """
+    table = summed_area_table((mask > 0).astype(np.uint8))
+    sides = window_sides()
+    steps = window_steps(sides)
+    first = np.zeros_like(sides)
+    rows = grid_size(first, mask.shape[0] - sides, steps)
+    cols = grid_size(first, mask.shape[1] - sides, steps)
+
+    # window_iter counts side + 1 pixels on each axis
+    positions = detect_windows(table, sides, steps, first, rows, cols, 1, THRESHOLD, 0.)
+    regions = combine_windows(positions)
+    mask = clear_non_region_mask(mask, regions)
+    return mask, regions
 
-    side = SIDE
-    for _ in range(INTERMEDIATE_STEPS):
-        positions = window_iter(mask, side)
-        for pos in positions:
-            regions.append(
-                Rectangle(
-                    top_left=(pos[0], pos[1]),
-                    width=side,
-                    height=side
-                )
-            )
 
+def window_sides() -> np.ndarray:
+    """
+    :return: the side of the windows of each scale, from SIDE growing by 1 / SHRINK_MULTIPLIER and always odd
+    """
+    sides = np.empty((INTERMEDIATE_STEPS,), np.int64)
+    side = SIDE
+    for k in range(INTERMEDIATE_STEPS):
+        sides[k] = side
         side = int(side / SHRINK_MULTIPLIER)
         if side % 2 == 0:
             side += 1
+    return sides
 
-    regions = combine_overlapped_regions(regions)
-    mask = clear_non_region_mask(mask, regions)
-    return mask, regions
+
+def window_steps(sides: np.ndarray) -> np.ndarray:
+    """
+    :return: the distance between the windows of each side
+    """
+    return (sides * STEP_FACTOR).astype(np.int64)
 
 
 @njit()
 def window_iter(mask: np.array, side: int) -> List[Tuple[int, int]]:
+    """
+    Counts the pixels of each window one by one. It is no longer used to detect, but kept as the reference to check
+    sliding_window against.
+    :return: the top left of the windows of the side with a proportion of positive pixels above THRESHOLD
+    """
     move_step = int(side * STEP_FACTOR)
     ret = []
     x = 0
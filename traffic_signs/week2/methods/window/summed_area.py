@@ -0,0 +1,152 @@
+import threading
+from typing import List
+
+import cv2
+import numpy as np
+from numba import njit, prange
+
+from model import Rectangle
+from .combine_overlapped_regions import combine_boxes
+
+
+_buffers = threading.local()
+
+
+def summed_area_table(image: np.ndarray) -> np.ndarray:
+    """
+    Computes the summed area table of a uint8 image into a buffer reused by the next calls of the same thread with
+    images of the same size, so it is not allocated for each image. The table is only valid until the next call.
+    :return: the table, as made by cv2.integral. The sums fit in 32 bits for images of up to 8 megapixels
+    """
+    depth = cv2.CV_32S if image.size * 255 < 2 ** 31 else cv2.CV_64F
+    dtype = np.int32 if depth == cv2.CV_32S else np.float64
+    shape = (image.shape[0] + 1, image.shape[1] + 1)
+
+    table = getattr(_buffers, 'table', None)
+    if table is None or table.shape != shape or table.dtype != dtype:
+        table = np.empty(shape, dtype)
+        _buffers.table = table
+    return cv2.integral(image, table, sdepth=depth)
+
+
+def grid_size(first: np.ndarray, last: np.ndarray, steps: np.ndarray) -> np.ndarray:
+    """
+    :return: the number of positions from first, included, to last, excluded, of each scale
+    """
+    return np.maximum(0, -(-(last - first) // steps))
+
+
+def combine_windows(windows: np.ndarray) -> List[Rectangle]:
+    """
+    :param windows: rows (top, left, side)
+    :return: the combined regions of the windows
+    """
+    boxes, _ = combine_boxes(np.column_stack((windows[:, :2], windows[:, :2] + windows[:, 2:])))
+    return [Rectangle(top_left=(top, left), width=right - left, height=bottom - top)
+            for top, left, bottom, right in boxes.tolist()]
+
+
+def detect_windows(table: np.ndarray, sides: np.ndarray, steps: np.ndarray, first: np.ndarray, rows: np.ndarray,
+                   cols: np.ndarray, extent: int, threshold: float, nms_overlap: float = 0.) -> np.ndarray:
+    """
+    Finds the windows of every scale whose sum, divided by the squared side, is above a threshold. The sum of each
+    window takes 4 lookups in the summed area table, whatever its side.
+
+    The windows of all the scales are evaluated in a single parallel loop over their rows, flattened so the work is
+    balanced, and each row writes in its own slice of an array reused by the next calls of the same thread. The loop
+    only runs in parallel in the main thread: numba's parallel kernels launched from other threads keep the
+    interpreter from exiting, so the pool threads of train mode run the same loop compiled serially.
+    :param table: the summed area table, as made by cv2.integral. The windows are clipped to it
+    :param sides: the side of the windows of each scale
+    :param steps: the distance between windows of each scale
+    :param first: the top and left of the first window of each scale
+    :param rows: the number of rows of windows of each scale
+    :param cols: the number of windows in each row of each scale
+    :param extent: the windows sum side + extent pixels on each axis
+    :param threshold: the windows must have a greater sum divided by the squared side
+    :param nms_overlap: if positive, the windows with an intersection over union above it with a denser window are
+    discarded
+    :return: an array with a row (top, left, side) for each window found, ordered by scale, top and left
+    """
+    windows = int(np.sum(rows * cols))
+    density = getattr(_buffers, 'density', None)
+    if density is None or len(density) < windows:
+        density = np.empty((windows,), np.float64)
+        _buffers.density = density
+    kernel = _detect_windows_parallel if threading.current_thread() is threading.main_thread() else _detect_windows
+    return kernel(table, sides, steps, first, rows, cols, extent, float(threshold), float(nms_overlap),
+                  density[:windows])
+
+
+def _window_kernel(table: np.ndarray, sides: np.ndarray, steps: np.ndarray, first: np.ndarray, rows: np.ndarray,
+                   cols: np.ndarray, extent: int, threshold: float, nms_overlap: float,
+                   density: np.ndarray) -> np.ndarray:
+    scales = len(sides)
+    height = table.shape[0] - 1
+    width = table.shape[1] - 1
+
+    # The first row of windows of each scale, and its first window, among the rows and windows of every scale
+    first_row = np.zeros((scales + 1,), np.int64)
+    first_window = np.zeros((scales + 1,), np.int64)
+    for k in range(scales):
+        first_row[k + 1] = first_row[k] + rows[k]
+        first_window[k + 1] = first_window[k] + rows[k] * cols[k]
+
+    for r in prange(first_row[scales]):
+        k = np.searchsorted(first_row, r, side='right') - 1
+        side = sides[k]
+        top = first[k] + (r - first_row[k]) * steps[k]
+        bottom = min(top + side + extent, height)
+        offset = first_window[k] + (r - first_row[k]) * cols[k]
+        for c in range(cols[k]):
+            left = first[k] + c * steps[k]
+            right = min(left + side + extent, width)
+            s = table[bottom, right] - table[bottom, left] - table[top, right] + table[top, left]
+            mean = s / side ** 2
+            density[offset + c] = mean if mean > threshold else -1.
+
+    hits = np.flatnonzero(density >= 0)
+    res = np.empty((len(hits), 3), np.int64)
+    for h in prange(len(hits)):
+        pos = hits[h]
+        k = np.searchsorted(first_window, pos, side='right') - 1
+        res[h, 0] = first[k] + (pos - first_window[k]) // cols[k] * steps[k]
+        res[h, 1] = first[k] + (pos - first_window[k]) % cols[k] * steps[k]
+        res[h, 2] = sides[k]
+
+    if nms_overlap <= 0:
+        return res
+    return res[_suppress(res, density[hits], nms_overlap)]
+
+
+# Outside a parallel kernel prange runs as range
+_detect_windows = njit()(_window_kernel)
+_detect_windows_parallel = njit(parallel=True)(_window_kernel)
+
+
+@njit()
+def _suppress(windows: np.ndarray, scores: np.ndarray, overlap: float) -> np.ndarray:
+    """
+    Greedy non maximum suppression: the windows are visited from the densest, and each one is kept unless it
+    overlaps a kept window by more than overlap.
+    :return: a mask of the kept windows
+    """
+    keep = np.zeros((len(windows),), np.bool_)
+    kept = np.empty((len(windows),), np.int64)
+    n_kept = 0
+    for a in np.argsort(-scores, kind='mergesort'):
+        top, left, side = windows[a, 0], windows[a, 1], windows[a, 2]
+        suppressed = False
+        for b in kept[:n_kept]:
+            height = min(top + side, windows[b, 0] + windows[b, 2]) - max(top, windows[b, 0])
+            width = min(left + side, windows[b, 1] + windows[b, 2]) - max(left, windows[b, 1])
+            if height > 0 and width > 0:
+                inter = height * width
+                if inter / (side ** 2 + windows[b, 2] ** 2 - inter) > overlap:
+                    suppressed = True
+                    break
+        if not suppressed:
+            keep[a] = True
+            kept[n_kept] = a
+            n_kept += 1
+    return keep
@@ -2,6 +2,8 @@ import cv2
 from typing import List
 
 from model import GroundTruth, Rectangle
+from model.image_cache import instance as image_cache
+from model.shared_images import instance as shared_images
 import numpy as np
 
 
@@ -21,7 +23,9 @@ class Data:
 
     - And we store the type of signals (A,B,C,D,E,F)
 
-    Finally we read images and masks with the functions get_img and get_mask.
+    Finally we read images and masks with the functions get_img and get_mask. Both are kept in the shared
+    image cache, so they are only decoded again if they have been evicted, unless they are in the shared images
+    created for the worker processes.
 
     """
 
@@ -29,16 +33,12 @@ class Data:
     gt: List[GroundTruth]
     img_path: str
     mask_path: str
-    img: np.array
-    mask_img: np.array
 
     def __init__(self, directory: str, name: str):
         self.name = name
         self.gt = []
         self.img_path = '{}/{}.jpg'.format(directory, name)
         self.mask_path = '{}/mask/mask.{}.png'.format(directory, name)
-        self.img = None
-        self.mask_img = None
         with open('{}/gt/gt.{}.txt'.format(directory, name)) as f:
             for line in f.readlines():
                 parts = line.strip().split(' ')
@@ -51,11 +51,19 @@ class Data:
                 self.gt.append(gt)
 
     def get_img(self):
-        if self.img is None:
-            self.img = cv2.imread(self.img_path, cv2.IMREAD_COLOR)
-        return self.img
+        shared = shared_images.get(self.img_path)
+        if shared is not None:
+            return shared
+        return image_cache.get(self.img_path, self.read_img)
 
     def get_mask_img(self):
-        if self.mask_img is None:
-            self.mask_img = cv2.imread(self.mask_path, cv2.IMREAD_GRAYSCALE)
-        return self.mask_img
+        shared = shared_images.get(self.mask_path)
+        if shared is not None:
+            return shared
+        return image_cache.get(self.mask_path, self.read_mask_img)
+
+    def read_img(self):
+        return cv2.imread(self.img_path, cv2.IMREAD_COLOR)
+
+    def read_mask_img(self):
+        return cv2.imread(self.mask_path, cv2.IMREAD_GRAYSCALE)
@@ -57,11 +57,11 @@ class Rectangle:
     def union(self, other: 'Rectangle') -> 'Rectangle':
         rec = Rectangle()
         rec.top_left = (min(self.top_left[0], other.top_left[0]), min(self.top_left[1], other.top_left[1]))
-        bottom_right = (min(self.get_bottom_right()[0], other.get_bottom_right()[0]),
-                        min(self.get_bottom_right()[1], other.get_bottom_right()[1]))
+        bottom_right = (max(self.get_bottom_right()[0], other.get_bottom_right()[0]),
+                        max(self.get_bottom_right()[1], other.get_bottom_right()[1]))
 
-        rec.width = (bottom_right[1] - self.top_left[1]) + 1
-        rec.height = (bottom_right[0] - self.top_left[0]) + 1
+        rec.width = bottom_right[1] - rec.top_left[1]
+        rec.height = bottom_right[0] - rec.top_left[0]
 
         return rec
 
@@ -0,0 +1,87 @@
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+try:
+    from multiprocessing import shared_memory
+except ImportError:
+    # Python < 3.8, the images can't be shared
+    shared_memory = None
+
+MAX_BYTES = 1024 * 1024 * 1024
+
+
+class SharedImages:
+    """
+    Decoded images stored in a single block of shared memory, created before forking the worker processes. The
+    workers inherit the mapping, so they read the images without decoding them again or copying them: the memory is
+    not duplicated by copy on write. The images are read only.
+
+    The block is bounded. The images that don't fit are not stored, and are read from disk as usual.
+    """
+    _memory: Optional['shared_memory.SharedMemory']
+    _images: Dict[str, np.ndarray]
+
+    def __init__(self):
+        self._memory = None
+        self._images = {}
+
+    @staticmethod
+    def is_supported() -> bool:
+        """
+        :return: whether shared memory is available, it needs Python 3.8
+        """
+        return shared_memory is not None
+
+    def create(self, images: List[Tuple[str, Callable[[], np.ndarray]]], max_bytes: int = MAX_BYTES) -> None:
+        """
+        Decodes the images one by one and copies them to a new shared memory block. The pages of the block are only
+        allocated when written, so its size is just the bound.
+        :param images: the key of each image, usually its path, and the function that decodes it. The first ones
+        are stored first
+        :param max_bytes: size of the block
+        """
+        self.close()
+        if max_bytes <= 0 or not images:
+            return
+
+        self._memory = shared_memory.SharedMemory(create=True, size=max_bytes)
+        offset = 0
+        for key, load in images:
+            image = load()
+            if image is None or offset + image.nbytes > max_bytes:
+                continue
+
+            view = np.ndarray(image.shape, image.dtype, buffer=self._memory.buf, offset=offset)
+            view[:] = image
+            view.flags.writeable = False
+            self._images[key] = view
+            # Keep the next image aligned
+            offset += -(-image.nbytes // 64) * 64
+
+    def get(self, key: str) -> Optional[np.ndarray]:
+        """
+        :return: the stored image, or None if it is not stored
+        """
+        return self._images.get(key)
+
+    def stats(self) -> str:
+        return 'Shared images: {} images using {:.1f} MB'.format(
+            len(self._images), sum(image.nbytes for image in self._images.values()) / 2 ** 20)
+
+    def close(self) -> None:
+        """
+        Frees the block. Only called by the process that created it, once the workers have finished.
+        """
+        self._images = {}
+        if self._memory is not None:
+            self._memory.unlink()
+            try:
+                self._memory.close()
+            except BufferError:
+                # Some image is still referenced, the mapping is released with it
+                pass
+            self._memory = None
+
+
+instance = SharedImages()
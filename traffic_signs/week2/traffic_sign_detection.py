@@ -2,15 +2,18 @@
 # -*- coding: utf-8 -*-
 
 import argparse
+import copy
 import fnmatch
+import multiprocessing
 import os
 import pickle
 import sys
 import time
-from concurrent.futures import Executor, ThreadPoolExecutor
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
 from typing import List
 
 import cv2
+import numba
 import numpy as np
 from functional import seq
 from tabulate import tabulate
@@ -21,9 +24,16 @@ from evaluation.bbox_iou import bbox_iou
 from methods import hsv_convolution, hsv_integral, hsv_sw, hsv_cc, hsv_cc_template, glob_template
 from model import DatasetManager, Data
 from model import Result
+from model.image_cache import instance as image_cache
+from model.shared_images import instance as shared_images
 
 
 def validateMethod(train: List[Data], verify: List[Data], method):
+    """
+    Trains a copy of the method with the train split and evaluates it with the verify split. The copy keeps the
+    trained state, so the same method can be validated with other splits at the same time.
+    """
+    method = copy.deepcopy(method)
     method.train(train)
     tp = 0
     fn = 0
@@ -82,23 +92,6 @@ def validateMethod(train: List[Data], verify: List[Data], method):
     )
 
 
-def validate(analysis: bool, dataset_manager: DatasetManager, pixel_methods: List):
-    """In each job, the methods are executed with the same dataset split and their results are put in an array."""
-    train, verify = dataset_manager.get_data_splits()
-    if analysis:
-        data_analysis(train)
-
-    with ThreadPoolExecutor() as executor:
-        results = [executor.submit(validateMethod, train, verify, pixel_method)
-                   for pixel_method in pixel_methods]
-
-    results = seq(results) \
-        .map(lambda f: f.result()) \
-        .to_list()
-
-    return results
-
-
 def performance_accumulation_window(detections_gt, annotations_gt):
     """
     performance_accumulation_window()
@@ -161,23 +154,68 @@ def combine_results(result1: Result, result2: Result, executions):
     return result1
 
 
-def train_mode(train_dir: str, methods, analysis=False, threads=4, executions=10):
-    """In train mode, we split the dataset and evaluate the result of several executions"""
+def train_mode(train_dir: str, methods, analysis=False, threads=4, executions=10, processes=0,
+               shared_bytes=1024 * 1024 * 1024):
+    """
+    In train mode, we split the dataset and evaluate the result of several executions. In each execution, the
+    methods are evaluated with the same dataset split. Every (execution, method) pair is a task of a single pool.
+
+    With processes, the tasks run in forked processes, which read the decoded masks and images from shared memory.
+    The masks are stored first, since every split reads all of them.
+    """
     # Use this class to load and manage states
     dataset_manager = DatasetManager(train_dir)
-    # Perform the executions in parallel
-    with ThreadPoolExecutor(max_workers=threads) as executor:
-        results = [executor.submit(validate, analysis, dataset_manager, methods)
-                   for _ in range(executions)]
+    splits = [dataset_manager.get_data_splits() for _ in range(executions)]
+    if analysis:
+        for train, _ in splits:
+            data_analysis(train)
+
+    # Forked workers inherit the counts of the image cache, so they are taken before and each task returns its own
+    counts = image_cache.take_counts()
+    if processes > 0:
+        task = _validate_in_worker
+        shared_images.create([(d.mask_path, d.read_mask_img) for d in dataset_manager.data] +
+                             [(d.img_path, d.read_img) for d in dataset_manager.data], shared_bytes)
+        print(shared_images.stats())
+        executor = ProcessPoolExecutor(max_workers=processes, mp_context=multiprocessing.get_context('fork'),
+                                       initializer=_init_worker)
+    else:
+        task = validateMethod
+        executor = ThreadPoolExecutor(max_workers=threads)
+
+    try:
+        with executor:
+            futures = [executor.submit(task, train, verify, method)
+                       for train, verify in splits for method in methods]
+            results = [future.result() for future in futures]
+    finally:
+        shared_images.close()
+
+    image_cache.add_counts(*counts)
+    if processes > 0:
+        for _, task_counts in results:
+            image_cache.add_counts(*task_counts)
+        results = [result for result, _ in results]
+
+    # Average the results of each execution
+    averaged = [Result() for _ in methods]
+    for pos, result in enumerate(results):
+        combine_results(averaged[pos % len(methods)], result, executions)
+    return averaged
+
+
+def _validate_in_worker(train: List[Data], verify: List[Data], method):
+    """
+    Runs validateMethod in a worker process.
+    :return: the result and the hits and misses of the image cache of the worker
+    """
+    return validateMethod(train, verify, method), image_cache.take_counts()
 
-        # Average the results of each execution
-        results = seq(results) \
-            .map(lambda fut: seq(fut.result())) \
-            .reduce(lambda a, b: seq(a).zip(b).map(lambda l: combine_results(l[0], l[1], executions)).to_list(),
-                    [Result() for _i in range(len(methods))]) \
-            .to_list()
 
-        return results
+def _init_worker():
+    # Each worker is already a unit of parallelism. The workers run the parallel numba kernels in their main thread
+    cv2.setNumThreads(1)
+    numba.set_num_threads(1)
 
 
 def test_mode(train_dir: str, test_dir: str, output_dir: str, method):
@@ -212,9 +250,21 @@ def main():
     parser.add_argument('--analysis', action='store_true',
                         help='Whether to perform an analysis of the train split before evaluation. Train mode only.')
     parser.add_argument('--threads', type=int, help='Number of threads to use. Train mode only.', default=4)
+    parser.add_argument('--processes', type=int, default=0,
+                        help='Number of worker processes to use instead of threads. Train mode only.')
+    parser.add_argument('--shared-images', type=int, default=1024,
+                        help='Maximum size in MB of the decoded images shared with the worker processes, 0 to not '
+                             'share them. Needs Python 3.8.')
     parser.add_argument('--executions', type=int, help='Number of executions of each method. Train mode only.',
                         default=10)
+    parser.add_argument('--image-cache', type=int,
+                        help='Maximum size of the decoded images cache in MB, of each process with --processes.',
+                        default=1024)
     args = parser.parse_args()
+    if args.processes > 0 and args.shared_images > 0 and not shared_images.is_supported():
+        parser.error('--shared-images needs Python 3.8 or later, pass --shared-images 0 to use --processes without '
+                     'sharing the images')
+    image_cache.set_max_bytes(args.image_cache * 1024 * 1024)
 
     method_names = args.pixel_methods.split(';')
     method_refs = {
@@ -235,8 +285,11 @@ def main():
         else:
             test_mode(args.train_path, args.test, args.output, methods[0])
     else:
-        results = train_mode(args.train_path, methods, threads=args.threads,
-                             executions=args.executions)
+        results = train_mode(args.train_path, methods, analysis=args.analysis, threads=args.threads,
+                             executions=args.executions, processes=args.processes,
+                             shared_bytes=args.shared_images * 1024 * 1024)
+
+    print(image_cache.stats())
 
     if results:
         print(tabulate(seq(results)